@@ -198,5 +198,31 @@ CREATE TABLE import_batch_process_task (
     ibpt_records_type_2 INT NULL,
     ibpt_records_type_1 INT NULL,
     ibpt_records_dim_new INT NULL,
+    ibpt_rows_per_second FLOAT NULL,
+    ibpt_bytes BIGINT NULL,
     FOREIGN KEY (ibp_id) REFERENCES import_batch_process (ibp_id) ON DELETE CASCADE
 );
+
+-- Committed file offset per byte range of an ingest task
+CREATE TABLE import_batch_process_task_checkpoint (
+    ibpt_id INT NOT NULL,
+    ibptc_file_path VARCHAR(255) NOT NULL,
+    ibptc_range_start BIGINT NOT NULL,
+    ibptc_range_end BIGINT NOT NULL,
+    ibptc_offset BIGINT NOT NULL,
+    ibptc_chunk_count INT NOT NULL,
+    ibptc_updated TIMESTAMP NOT NULL,
+    PRIMARY KEY (ibpt_id, ibptc_range_start),
+    FOREIGN KEY (ibpt_id) REFERENCES import_batch_process_task (ibpt_id) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_checkpoint_file_path ON import_batch_process_task_checkpoint (ibptc_file_path);
+
+-- Fingerprint of every file at its last completed ingest
+CREATE TABLE import_file_fingerprint (
+    iff_file_path VARCHAR(255) PRIMARY KEY,
+    iff_size BIGINT NOT NULL,
+    iff_mtime_ns BIGINT NOT NULL,
+    iff_content_hash VARCHAR(128) NOT NULL,
+    iff_updated TIMESTAMP NOT NULL
+);
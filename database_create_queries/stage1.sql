@@ -27,6 +27,12 @@ CREATE TABLE s1_product_category (
     pc_category           VARCHAR(150) NOT NULL DEFAULT '*No Category'
 );
 
+-- Distinct categories of the ingest, with the number of products per category
+CREATE TABLE s1_category (
+    c_category            VARCHAR(150) PRIMARY KEY,
+    c_product_count       INT          NOT NULL DEFAULT 0
+);
+
 CREATE TABLE s1_related_product (
     rl_product_source_key         VARCHAR(10) NOT NULL,
     rl_related_product_source_key VARCHAR(10) NOT NULL,
@@ -39,42 +45,44 @@ CREATE INDEX idx_s1_review ON s1_review (
 );
 
 CREATE INDEX idx_s1_product ON s1_product (
-    p_product_metadata_id, p_product_source_key
+    p_product_source_key, p_product_metadata_id
 );
 
 CREATE INDEX idx_s1_product_category ON s1_product_category (
     pc_product_source_key, pc_category
 );
 
-CREATE INDEX idx_s1_related_product ON s1_related_product (
+-- Every relation is stored once, a pair and its mirror share the key
+CREATE UNIQUE INDEX idx_s1_related_product ON s1_related_product (
     LEAST(rl_product_source_key, rl_related_product_source_key),
     GREATEST(rl_product_source_key, rl_related_product_source_key),
     rl_relation
 );
 
--- Create views
+-- Create views, read by stage 2 without DISTINCT. They rely on the stage 1 dedup
+-- node, which deletes repeated rows before the migrations run. Stage 2 pages
+-- through them in index order, the row id breaks ties between rows
 CREATE VIEW v_s1_review AS
-SELECT DISTINCT *
+SELECT *, ctid AS r_row_id
 FROM s1_review;
 
 CREATE VIEW v_s1_product AS
-SELECT DISTINCT *
+SELECT *, ctid AS p_row_id
 FROM s1_product;
 
 CREATE VIEW v_s1_product_category AS
-SELECT DISTINCT *
+SELECT *, ctid AS pc_row_id
 FROM s1_product_category;
 
+CREATE VIEW v_s1_category AS
+SELECT c_category
+FROM s1_category;
+
+-- Mirrored and repeated pairs are skipped by the unique pair index
 CREATE VIEW v_s1_related_product AS
-SELECT DISTINCT
+SELECT
     rl_product_source_key,
     rl_related_product_source_key,
-    rl_relation
-FROM s1_related_product AS sp1
-WHERE NOT EXISTS (
-    SELECT 1
-    FROM s1_related_product AS sp2
-    WHERE 
-        sp1.rl_product_source_key = sp2.rl_related_product_source_key
-        AND sp1.rl_related_product_source_key = sp2.rl_product_source_key
-);
+    rl_relation,
+    ctid AS rl_row_id
+FROM s1_related_product;
@@ -34,6 +34,11 @@ CREATE TABLE s2_product_category (
     FOREIGN KEY (pc_product_source_key) REFERENCES s2_product (p_product_source_key) ON DELETE CASCADE
 );
 
+CREATE TABLE s2_category (
+    c_category            VARCHAR(150) NOT NULL,
+    PRIMARY KEY (c_category)
+);
+
 CREATE TABLE s2_related_product (
     rl_product_source_key         VARCHAR(10) NOT NULL,
     rl_related_product_source_key VARCHAR(10) NOT NULL,
@@ -96,8 +101,8 @@ SELECT
 FROM s2_related_product;
 
 CREATE VIEW v_s2_product_categories_only AS
-SELECT DISTINCT product_category
-FROM s2_product_category;
+SELECT c_category AS pc_category
+FROM s2_category;
 
 
 
@@ -0,0 +1,91 @@
+"""
+Benchmark of convert_value against the ast.literal_eval version it replaced,
+over the literal columns of the source files. Every value is checked to
+convert to an identical structure.
+
+Run from the etl_ingest directory:
+    python3 -m benchmarks.convert_value [reviews_csv] [products_csv]
+"""
+
+import ast
+import csv
+import sys
+import time
+
+from utils.data_utils import convert_value, _convert_cached
+
+reviews_csvFilePath = r"./data/reviews_Clothing_Shoes_and_Jewelry_5.csv"
+products_csvFilePath = r"./data/metadata_category_clothing_shoes_and_jewelry_only.csv"
+
+LITERAL_COLUMNS = [
+    (reviews_csvFilePath, "helpful"),
+    (products_csvFilePath, "salesrank"),
+    (products_csvFilePath, "categories"),
+    (products_csvFilePath, "related"),
+]
+
+
+def literal_eval_convert_value(value):
+    """The previous convert_value implementation."""
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def is_identical(a, b):
+    """Compares two converted values, including the types of all nested values."""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, list):
+        return len(a) == len(b) and all(map(is_identical, a, b))
+    if isinstance(a, dict):
+        return list(a) == list(b) and all(is_identical(a[k], b[k]) for k in a)
+    return a == b
+
+
+def read_column(csvFilePath, column):
+    """Reads all values of one column of a CSV file."""
+    with open(csvFilePath, encoding="utf-8") as csvf:
+        return [row[column] for row in csv.DictReader(csvf)]
+
+
+def time_conversion(convert, values):
+    """Converts all values, returns the results and the elapsed seconds."""
+    start = time.perf_counter()
+    results = [convert(value) for value in values]
+    return results, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        reviews_csvFilePath, products_csvFilePath = sys.argv[1], sys.argv[2]
+        LITERAL_COLUMNS = [
+            (reviews_csvFilePath, "helpful"),
+            (products_csvFilePath, "salesrank"),
+            (products_csvFilePath, "categories"),
+            (products_csvFilePath, "related"),
+        ]
+
+    print(f"{'column':<12}{'values':>10}{'ast (s)':>10}{'new (s)':>10}{'speedup':>9}")
+
+    for csvFilePath, column in LITERAL_COLUMNS:
+        values = read_column(csvFilePath, column)
+
+        _convert_cached.cache_clear()
+        expected, ast_seconds = time_conversion(literal_eval_convert_value, values)
+        results, new_seconds = time_conversion(convert_value, values)
+
+        mismatches = [
+            value
+            for value, a, b in zip(values, expected, results)
+            if not is_identical(a, b)
+        ]
+
+        print(
+            f"{column:<12}{len(values):>10}{ast_seconds:>10.2f}{new_seconds:>10.2f}"
+            f"{ast_seconds / max(new_seconds, 1e-9):>8.1f}x"
+        )
+        if mismatches:
+            print(f"  {len(mismatches)} mismatches, first: {mismatches[0]!r}")
+            sys.exit(1)
@@ -0,0 +1,111 @@
+"""
+Benchmark of the NumPy columnar review transform against the row by row
+transform. One million reviews are taken from the review CSV, repeating
+its rows when it has fewer, and transformed in chunks of 1000 by both.
+It times the whole chunk transform and the numeric columns alone, the
+score, helpfulness rating, review datetime and date key, which is the
+part the columnar transform replaces. The transformed rows and failed
+rows of both are checked to be equal.
+
+Run from the etl_ingest directory:
+    python3 -m benchmarks.review_columnar [reviews_csv] [rows]
+"""
+
+import sys
+import time
+from itertools import cycle, islice
+
+from ingest.reviews import (
+    REVIEW_SOURCE_FIELDS,
+    OVERALL_FIELD,
+    HELPFUL_FIELD,
+    UNIX_REVIEW_TIME_FIELD,
+    parse_helpfulness_rating,
+    parse_review_datetime,
+    review_columns,
+    transform_review_chunk,
+    transform_review_chunk_columnar,
+)
+from utils.source_utils import open_source, split_source
+
+reviews_csvFilePath = r"./data/reviews_Clothing_Shoes_and_Jewelry_5.csv"
+
+ROWS = 1000000
+CHUNK_SIZE = 1000
+
+
+def sample_chunks(csvFilePath, rows):
+    """Reads `rows` reviews into chunks, repeating the file as needed."""
+    fieldnames, ranges = split_source(csvFilePath, 1)
+    start, end = ranges[0]
+    with open_source(csvFilePath, fieldnames, start, end, REVIEW_SOURCE_FIELDS) as f:
+        source = list(f)
+
+    sample = list(islice(cycle(source), rows))
+    return [sample[i : i + CHUNK_SIZE] for i in range(0, len(sample), CHUNK_SIZE)]
+
+
+def row_numeric_columns(chunk):
+    """Computes the numeric columns row by row, like the row transform."""
+    for row in chunk:
+        try:
+            float(row[OVERALL_FIELD])
+            parse_helpfulness_rating(row[HELPFUL_FIELD])
+            parse_review_datetime(row[UNIX_REVIEW_TIME_FIELD]).strftime("%Y%m%d")
+        except Exception:
+            pass
+
+
+def time_chunks(transform, chunks):
+    """Transforms all chunks, returns the results and the elapsed seconds."""
+    start = time.perf_counter()
+    results = [transform(chunk) for chunk in chunks]
+    return results, time.perf_counter() - start
+
+
+def check_results(row_results, columnar_results):
+    """Returns the first transformed or failed row that differs, if any."""
+    for (rows, failed), (columnar_rows, columnar_failed) in zip(
+        row_results, columnar_results
+    ):
+        for row, columnar_row in zip(rows, columnar_rows):
+            if row != columnar_row:
+                return row, columnar_row
+        if len(rows) != len(columnar_rows):
+            return len(rows), len(columnar_rows)
+        if [tuple(f) for f in failed] != [tuple(f) for f in columnar_failed]:
+            return failed, columnar_failed
+    return None
+
+
+if __name__ == "__main__":
+    rows = ROWS
+    if len(sys.argv) > 1:
+        reviews_csvFilePath = sys.argv[1]
+    if len(sys.argv) > 2:
+        rows = int(sys.argv[2])
+
+    chunks = sample_chunks(reviews_csvFilePath, rows)
+
+    row_results, row_seconds = time_chunks(transform_review_chunk, chunks)
+    columnar_results, columnar_seconds = time_chunks(
+        transform_review_chunk_columnar, chunks
+    )
+    _, row_numeric_seconds = time_chunks(row_numeric_columns, chunks)
+    _, columnar_numeric_seconds = time_chunks(review_columns, chunks)
+
+    print(f"{'transform':<18}{'rows (s)':>10}{'columnar (s)':>14}{'speedup':>9}")
+    for name, row_time, columnar_time in (
+        ("whole chunk", row_seconds, columnar_seconds),
+        ("numeric columns", row_numeric_seconds, columnar_numeric_seconds),
+    ):
+        print(
+            f"{name:<18}{row_time:>10.2f}{columnar_time:>14.2f}"
+            f"{row_time / columnar_time:>8.1f}x"
+        )
+    print(f"{sum(len(chunk) for chunk in chunks)} reviews in {len(chunks)} chunks")
+
+    mismatch = check_results(row_results, columnar_results)
+    if mismatch:
+        print(f"  results differ, first: {mismatch!r}")
+        sys.exit(1)
@@ -0,0 +1,132 @@
+"""
+Benchmark of the positional row tuples and FailedRow records of the
+ingest against the csv.DictReader dicts and failure dicts they replaced.
+For both source files it compares the time to read all chunks, and the
+memory held by one chunk of rows plus a failure record for every row,
+the worst case of a chunk that fails entirely. Every tuple is checked
+to hold the values of its dict.
+
+Run from the etl_ingest directory:
+    python3 -m benchmarks.row_tuples [reviews_csv] [products_csv]
+"""
+
+import csv
+import sys
+import time
+import tracemalloc
+
+from ingest.reviews import REVIEW_SOURCE_FIELDS
+from ingest.products import PRODUCT_SOURCE_FIELDS
+from utils.file_utils import split_file_ranges, RecordLineReader
+from utils.source_utils import MappedCsvReader, FailedRow
+
+reviews_csvFilePath = r"./data/reviews_Clothing_Shoes_and_Jewelry_5.csv"
+products_csvFilePath = r"./data/metadata_category_clothing_shoes_and_jewelry_only.csv"
+
+CHUNK_SIZE = 1000
+# Chunks the held memory is averaged over
+MEMORY_CHUNKS = 20
+
+
+def dict_chunks(csvFilePath, fieldnames, start, end):
+    """Reads chunks of dict rows the way the ingest did before."""
+    with RecordLineReader(csvFilePath, start, end) as lines:
+        chunk = []
+        for row in csv.DictReader(lines, fieldnames=fieldnames):
+            chunk.append(row)
+            if len(chunk) == CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def tuple_chunks(csvFilePath, fieldnames, start, end, fields):
+    """Reads chunks of positional rows the way the ingest does now."""
+    with MappedCsvReader(csvFilePath, fieldnames, start, end, fields) as rows:
+        yield from rows.chunks(CHUNK_SIZE)
+
+
+def dict_failures(chunk):
+    return [{"row": row, "error": "Invalid review score"} for row in chunk]
+
+
+def tuple_failures(chunk):
+    return [FailedRow(row, "Invalid review score") for row in chunk]
+
+
+def time_chunks(chunks):
+    """Reads all chunks, returns the number of rows and the elapsed seconds."""
+    start = time.perf_counter()
+    count = sum(len(chunk) for chunk in chunks)
+    return count, time.perf_counter() - start
+
+
+def held_memory(chunks, failures):
+    """Average bytes allocated per chunk while chunks and failure records are held."""
+    tracemalloc.start()
+    held = [(chunk, failures(chunk)) for _, chunk in zip(range(MEMORY_CHUNKS), chunks)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / max(len(held), 1)
+
+
+def check_rows(dict_rows, tuple_rows, fields):
+    """Returns the first dict row whose values differ from its tuple, if any."""
+    for row, values in zip(dict_rows, tuple_rows):
+        if tuple(row[name] for name in fields) != values:
+            return row
+    return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        reviews_csvFilePath, products_csvFilePath = sys.argv[1], sys.argv[2]
+
+    print(
+        f"{'file':<10}{'rows':>10}{'dict (s)':>10}{'tuple (s)':>11}"
+        f"{'dict KB/chunk':>15}{'tuple KB/chunk':>16}"
+    )
+
+    for name, csvFilePath, fields in (
+        ("reviews", reviews_csvFilePath, REVIEW_SOURCE_FIELDS),
+        ("products", products_csvFilePath, PRODUCT_SOURCE_FIELDS),
+    ):
+        fieldnames, ranges = split_file_ranges(csvFilePath, 1)
+        start, end = ranges[0]
+
+        count, dict_seconds = time_chunks(
+            dict_chunks(csvFilePath, fieldnames, start, end)
+        )
+        _, tuple_seconds = time_chunks(
+            tuple_chunks(csvFilePath, fieldnames, start, end, fields)
+        )
+
+        dict_memory = held_memory(
+            dict_chunks(csvFilePath, fieldnames, start, end), dict_failures
+        )
+        tuple_memory = held_memory(
+            tuple_chunks(csvFilePath, fieldnames, start, end, fields), tuple_failures
+        )
+
+        print(
+            f"{name:<10}{count:>10}{dict_seconds:>10.2f}{tuple_seconds:>11.2f}"
+            f"{dict_memory / 1024:>15.0f}{tuple_memory / 1024:>16.0f}"
+        )
+
+        mismatch = check_rows(
+            (
+                row
+                for chunk in dict_chunks(csvFilePath, fieldnames, start, end)
+                for row in chunk
+            ),
+            (
+                row
+                for chunk in tuple_chunks(csvFilePath, fieldnames, start, end, fields)
+                for row in chunk
+            ),
+            fields,
+        )
+        if mismatch:
+            print(f"  rows differ, first: {mismatch!r}")
+            sys.exit(1)
@@ -0,0 +1,112 @@
+"""
+Micro-benchmark of sanitize_string and restore_string against the chained
+replace versions they replaced, over the text columns of the review file.
+Every value is checked to produce identical output.
+
+Run from the etl_ingest directory:
+    python3 -m benchmarks.sanitize_string [reviews_csv]
+"""
+
+import csv
+import re
+import sys
+import time
+
+from utils.data_utils import sanitize_string, restore_string
+
+reviews_csvFilePath = r"./data/reviews_Clothing_Shoes_and_Jewelry_5.csv"
+
+TEXT_COLUMNS = ["reviewText", "summary", "reviewerName"]
+
+
+def chained_sanitize_string(value):
+    """The previous sanitize_string implementation."""
+    replacements = {
+        "=\\ ": "__EQ_BACKSLASH__",
+        "\\": "__BACKSLASH__",
+        "'": "__SINGLE_QUOTE__",
+        '"': "__DOUBLE_QUOTE__",
+        "\n": "__NEWLINE__",
+        "\r": "__CARRIAGE_RETURN__",
+        "\t": "__TAB__",
+    }
+    for char, replacement in replacements.items():
+        value = value.replace(char, replacement)
+    return re.sub(r"\s{2,}", " ", value)
+
+
+def chained_restore_string(sanitized_value):
+    """The previous restore_string implementation, which left __TAB__ in place."""
+    replacements = {
+        "__EQ_BACKSLASH__": "=\\ ",
+        "__BACKSLASH__": "\\",
+        "__SINGLE_QUOTE__": "'",
+        "__DOUBLE_QUOTE__": '"',
+        "__NEWLINE__": "\n",
+        "__CARRIAGE_RETURN__": "\r",
+    }
+    for replacement, char in replacements.items():
+        sanitized_value = sanitized_value.replace(replacement, char)
+    return sanitized_value
+
+
+def read_columns(csvFilePath, columns):
+    """Reads the values of the given columns of a CSV file."""
+    values = {column: [] for column in columns}
+    with open(csvFilePath, encoding="utf-8") as csvf:
+        for row in csv.DictReader(csvf):
+            for column in columns:
+                values[column].append(row[column])
+    return values
+
+
+def time_function(function, values, repeat=3):
+    """Applies function to all values, returns the results and the best elapsed seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [function(value) for value in values]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return results, best
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        reviews_csvFilePath = sys.argv[1]
+
+    columns = read_columns(reviews_csvFilePath, TEXT_COLUMNS)
+
+    print(
+        f"{'function':<18}{'column':<14}{'old s/1M':>10}{'new s/1M':>10}{'speedup':>9}"
+    )
+
+    for column, values in columns.items():
+        per_million = 1_000_000 / max(len(values), 1)
+        benchmarks = [
+            ("sanitize_string", chained_sanitize_string, sanitize_string, values),
+        ]
+        sanitized = [chained_sanitize_string(value) for value in values]
+        benchmarks.append(
+            ("restore_string", chained_restore_string, restore_string, sanitized)
+        )
+
+        for name, old_function, new_function, inputs in benchmarks:
+            expected, old_seconds = time_function(old_function, inputs)
+            results, new_seconds = time_function(new_function, inputs)
+
+            # The old restore_string did not restore tabs
+            mismatches = [
+                value
+                for value, a, b in zip(inputs, expected, results)
+                if a != b and "__TAB__" not in value
+            ]
+
+            print(
+                f"{name:<18}{column:<14}{old_seconds * per_million:>10.2f}"
+                f"{new_seconds * per_million:>10.2f}"
+                f"{old_seconds / max(new_seconds, 1e-9):>8.1f}x"
+            )
+            if mismatches:
+                print(f"  {len(mismatches)} mismatches, first: {mismatches[0]!r}")
+                sys.exit(1)
@@ -1,39 +1,585 @@
-import csv
-from itertools import islice
+import threading
+from collections import deque
+from functools import partial
 
-from utils.db_utills import connect_to_db, write_to_db, DB_ADW
+from utils.db_utills import connect_to_db, DB_ADW
 from utils.data_utils import sanitize_string, convert_value
-from utils.output_utils import write_failed_rows
+from utils.source_utils import (
+    open_source,
+    transform_source_chunk,
+    failed_row_dicts,
+    FailedRow,
+)
+from utils.compression_utils import format_decompression_stats
+from utils.checkpoint_utils import plan_ingest_ranges
+from utils.delta_utils import RowHashFilter, check_file_unchanged, complete_delta_ingest
+from utils.parallel_utils import run_tasks, merge_counts
+from utils.pipeline_utils import run_pipeline, format_pipeline_stats, TableWriter
+from utils.output_utils import write_failed_rows, close_failure_logs
+from utils.dictionary_utils import (
+    RelationPairs,
+    new_dictionaries,
+    merge_dictionaries,
+    format_dictionary_stats,
+    write_dictionary,
+)
+from utils.transform_utils import (
+    Column,
+    RowError,
+    target_columns,
+    compile_row_transform,
+)
 from utils.metadata_utils import (
     create_import_batch_process_task,
     update_import_batch_process_task,
+    update_import_batch_process_task_rate,
     update_import_batch_process,
+    update_ingest_checkpoint,
+)
+
+# Fields of the product CSV and their keys in the meta_*.json.gz dumps,
+# the metadata id is the line number of the record
+PRODUCT_SOURCE_FIELDS = {
+    "metadataid": None,
+    "asin": "asin",
+    "salesrank": "salesRank",
+    "imurl": "imUrl",
+    "categories": "categories",
+    "title": "title",
+    "description": "description",
+    "price": "price",
+    "brand": "brand",
+    "related": "related",
+}
+
+
+def parse_sales_rank(value):
+    """Returns the category and rank of a sales rank like {'Clothing': 656116}."""
+    try:
+        salesrank = convert_value(value)
+        if isinstance(salesrank, dict):
+            return next(iter(salesrank.items()))
+    except Exception:
+        pass
+    return "*Unknown category", -1
+
+
+# Columns of s1_product, checked and transformed in this order
+PRODUCT_SPEC = [
+    Column(
+        "p_product_metadata_id",
+        "metadataid",
+        max_length=7,
+        error="product_metadata_id too long",
+    ),
+    Column(
+        "p_product_source_key",
+        "asin",
+        max_length=10,
+        error="product_source_key too long",
+    ),
+    Column(
+        ("p_sales_rank_category", "p_sales_rank"),
+        "salesrank",
+        parser=parse_sales_rank,
+        max_length=50,
+        error="sales_rank_category too long",
+    ),
+    Column(
+        "p_image_url",
+        "imurl",
+        default="*Unknown URL",
+        max_length=225,
+        error="image_url too long",
+    ),
+    Column(
+        "p_title",
+        "title",
+        default="*Unknown title",
+        sanitizer=sanitize_string,
+        # max_length=100,
+    ),
+    Column(
+        "p_description",
+        "description",
+        default="*Unknown description",
+        sanitizer=sanitize_string,
+        # max_length=225,
+    ),
+    Column("p_price", "price", default=-1.00, parser=float),
+    Column(
+        "p_brand",
+        "brand",
+        default="*Unknown brand",
+        sanitizer=sanitize_string,
+        max_length=150,
+        error="brand too long",
+    ),
+]
+
+PRODUCT_COLUMNS = target_columns(PRODUCT_SPEC)
+
+transform_product_row = compile_row_transform(
+    PRODUCT_SPEC, PRODUCT_SOURCE_FIELDS, "transform_product_row"
 )
 
-# Max lengths for columns
+# Positions of the values the category and related product rows are built from
+PRODUCT_SOURCE_KEY = PRODUCT_COLUMNS.index("p_product_source_key")
+CATEGORIES_FIELD = list(PRODUCT_SOURCE_FIELDS).index("categories")
+RELATED_FIELD = list(PRODUCT_SOURCE_FIELDS).index("related")
+
+# Values that repeat across most products are dictionary encoded per run,
+# every table merges the dictionaries of the rows it writes
+TABLE_DICTIONARIES = {
+    "p": ("sales_rank_category", "brand"),
+    "pc": ("category",),
+    "rp": ("relation",),
+}
+DICTIONARY_ATTRIBUTES = ("category", "relation", "sales_rank_category", "brand")
+SALES_RANK_CATEGORY = PRODUCT_COLUMNS.index("p_sales_rank_category")
+BRAND = PRODUCT_COLUMNS.index("p_brand")
+
+# Max lengths for the category and related product columns
 MAX_LENGTHS = {
-    "p_product_metadata_id": 7,
-    "p_product_source_key": 10,
-    "p_sales_rank_category": 50,
-    "p_image_url": 225,
-    # "p_title": 100,
-    # "p_description": 225,
-    "p_brand": 150,
-    "pc_product_source_key": 10,
     "pc_category": 150,
-    "rl_product_source_key": 10,
     "rl_related_product_source_key": 10,
     "rl_relation": 20,
 }
 
+PRODUCT_CATEGORY_COLUMNS = ["pc_product_source_key", "pc_category"]
+
+RELATED_PRODUCT_COLUMNS = [
+    "rl_product_source_key",
+    "rl_related_product_source_key",
+    "rl_relation",
+]
+
+# Rows per COPY and commit, every product fans out into many related products
+BATCH_SIZES = {
+    "s1_product": 1000,
+    "s1_product_category": 5000,
+    "s1_related_product": 20000,
+}
+
+
+def flatten_categories(categories):
+    """Helper function to flatten any nested arrays within categories"""
+    flattened = []
+    for item in categories:
+        if isinstance(item, list):  # If the item is a list, recursively flatten it
+            flattened.extend(flatten_categories(item))  # Unroll nested arrays
+        else:
+            flattened.append(item)  # Otherwise, just add the item
+    return flattened
+
+
+def transform_product_chunk(chunk, ibpt_ids):
+    """
+    Transforms a chunk of raw product rows into product, category and
+    related product rows.
+
+    :param chunk: List of raw rows, tuples in the order of PRODUCT_SOURCE_FIELDS.
+    :param ibpt_ids: Task IDs of the product, category and related product tasks.
+    :return: Transformed rows and FailedRows as (products, categories,
+        related_products, failed_rows_p, failed_rows_pc, failed_rows_rp,
+        dictionaries). The values of DICTIONARY_ATTRIBUTES are interned
+        in the ValueDictionaries of the chunk, by attribute.
+    """
+    transformed_products = []
+    transformed_categories = []
+    transformed_related_products = []
+    failed_rows_p = []
+    failed_rows_pc = []
+    failed_rows_rp = []
+
+    dictionaries = new_dictionaries(DICTIONARY_ATTRIBUTES)
+    intern_category = dictionaries["category"].intern
+    intern_relation = dictionaries["relation"].intern
+    intern_sales_rank_category = dictionaries["sales_rank_category"].intern
+    intern_brand = dictionaries["brand"].intern
+
+    max_category_length = MAX_LENGTHS["pc_category"]
+    max_related_length = MAX_LENGTHS["rl_related_product_source_key"]
+    max_relation_length = MAX_LENGTHS["rl_relation"]
+
+    for row in chunk:
+        try:
+            # First select fields for product table, and transform
+            product = transform_product_row(row)
+            product[SALES_RANK_CATEGORY] = intern_sales_rank_category(
+                product[SALES_RANK_CATEGORY]
+            )
+            product[BRAND] = intern_brand(product[BRAND])
+            transformed_products.append(product)
+            product_source_key = product[PRODUCT_SOURCE_KEY]
+
+            # Flatten categories and transform.
+            categories = convert_value(row[CATEGORIES_FIELD])
+            valid_categories = []
+
+            if isinstance(categories, list):
+                flat_categories = flatten_categories(categories)
+
+                # A category listed in several paths of a product counts once
+                for category in dict.fromkeys(flat_categories):
+                    if len(category) <= max_category_length:
+                        valid_categories.append(
+                            [product_source_key, intern_category(category)]
+                        )
+                    else:
+                        failed_rows_pc.append(
+                            FailedRow(row, "category too long", ibpt_ids[1])
+                        )
+                transformed_categories.extend(valid_categories)
+            else:
+                failed_rows_pc.append(
+                    FailedRow(row, "invalid categories format", ibpt_ids[1])
+                )
+                continue
+
+            # Flatten related products, extract relation
+            related_products = convert_value(row[RELATED_FIELD])
+            if isinstance(related_products, dict):
+                valid_related_products = []
+
+                for relation_type, products in related_products.items():
+                    relation = intern_relation(str(relation_type))
+                    relation_fits = len(relation) <= max_relation_length
+                    for related_product in products:
+                        related_product_source_key = str(related_product)
+                        if (
+                            relation_fits
+                            and len(related_product_source_key) <= max_related_length
+                        ):
+                            valid_related_products.append(
+                                [
+                                    product_source_key,
+                                    related_product_source_key,
+                                    relation,
+                                ]
+                            )
+                        else:
+                            failed_rows_rp.append(
+                                FailedRow(
+                                    row, "related product fields too long", ibpt_ids[2]
+                                )
+                            )
+
+                transformed_related_products.extend(valid_related_products)
+
+        except RowError as e:
+            failed_rows_p.append(FailedRow(row, e.reason, ibpt_ids[0]))
+            continue
+        except Exception as e:
+            failed_rows_p.append(FailedRow(row, str(e), ibpt_ids[0]))
+            continue
+
+    return (
+        transformed_products,
+        transformed_categories,
+        transformed_related_products,
+        failed_rows_p,
+        failed_rows_pc,
+        failed_rows_rp,
+        dictionaries,
+    )
+
+
+def export_categories(dictionary, replace=False):
+    """
+    Writes the distinct categories to s1_category with the number of
+    products per category, so the category dimension is built from them
+    instead of the whole s1_product_category. With replace, after a bulk
+    load, the bridge holds only this run and the table is rewritten from
+    its dictionary. Otherwise the bridge also holds the rows of earlier,
+    resumed or delta runs, which the dictionary has not seen, so the
+    categories and their counts are recomputed from the bridge. A failed
+    export is logged, the categories are still in the bridge.
+    """
+    conn = connect_to_db()
+    try:
+        with conn.cursor() as cursor:
+            if replace:
+                cursor.execute("TRUNCATE s1_category")
+                write_dictionary(
+                    cursor, "s1_category", "c_category", "c_product_count", dictionary
+                )
+            else:
+                cursor.execute(
+                    """
+                    INSERT INTO s1_category (c_category, c_product_count)
+                    SELECT pc_category, COUNT(DISTINCT pc_product_source_key)
+                    FROM s1_product_category
+                    GROUP BY pc_category
+                    ON CONFLICT (c_category) DO UPDATE
+                    SET c_product_count = EXCLUDED.c_product_count
+                    """
+                )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error exporting the product categories: {e}")
+        write_failed_rows(
+            "./logs/product_error_logs.ndjson",
+            [{"export_error": str(e), "entity": "categories"}],
+        )
+    finally:
+        conn.close()
+
 
 # Process: take 1000 rows, transform each column value in each row
 # Write transformed rows to tables in S1
 # Log rows that were invalid
-def ingest_products(csvFilePath, ibp_id):
+def ingest_product_range(
+    csvFilePath,
+    fieldnames,
+    start,
+    end,
+    ibpt_ids,
+    checkpoints,
+    log_suffix="",
+    transform_workers=0,
+    delta=False,
+    bulk=False,
+    unlogged=False,
+):
+    """
+    Ingests the products in one byte range of the CSV file and returns the
+    record counts and rows per second of every table of the range.
+
+    Reading, transforming and writing run as a pipeline. The writer stage
+    hands the rows of every table to its own TableWriter, so the three
+    tables are copied concurrently over separate stage1 connections.
+    Every table checkpoints the file offset it has committed, and skips the
+    chunks before the (offset, chunk_count) it resumes from in `checkpoints`.
+    The dictionaries of the chunks a table writes are merged into the
+    dictionaries of the range, returned in the counts as "dictionaries".
+    A related product pair, or its mirror, is written once per range.
+    With bulk, every TableWriter truncates and loads its table in one
+    transaction, nothing is checkpointed.
+    """
+    conn_meta = connect_to_db(DB_ADW)
+    meta_lock = threading.Lock()
+
+    counts = {
+        "in": 0,
+        "failed_p": 0,
+        "out_p": 0,
+        "failed_pc": 0,
+        "out_pc": 0,
+        "failed_rp": 0,
+        "out_rp": 0,
+        "skipped_rp": 0,
+    }
+
+    chunk_size = 1000  # Process in chunks of 1000
+
+    dictionaries = new_dictionaries(DICTIONARY_ATTRIBUTES)
+    related_pairs = RelationPairs()
+
+    keys = ("p", "pc", "rp")
+    resume_offsets = {key: offset for key, (offset, _) in zip(keys, checkpoints)}
+    chunk_counts = {key: count for key, (_, count) in zip(keys, checkpoints)}
+
+    # File offsets after every chunk, the writer gets the chunks in this order
+    offsets = deque()
+
+    # In delta mode only rows that were not ingested before are passed on
+    row_filter = None
+    if delta:
+        row_filter = RowHashFilter(csvFilePath, f"{ibpt_ids[0]}_{start}", keys)
+
+    def read_chunks():
+        with open_source(
+            csvFilePath, fieldnames, start, end, PRODUCT_SOURCE_FIELDS
+        ) as rows:
+            # Transform workers parse their chunks from a shared mapping of
+            # the file, row hashes are taken from the parsed rows
+            shared = bool(transform_workers) and row_filter is None
+            # Chunks end at the checkpoints, a table skips exactly the
+            # chunks it committed before a resume
+            stops = resume_offsets.values()
+            for chunk in rows.chunks(chunk_size, shared, stops):
+                if row_filter:
+                    # A chunk without new rows still advances the checkpoint
+                    chunk = row_filter.new_rows(chunk, rows.offset)
+                offsets.append(rows.offset)
+                yield chunk
+
+            stats = rows.decompression_stats()
+            if stats:
+                print(
+                    f"Product source{log_suffix}: {format_decompression_stats(stats)}"
+                )
+
+    def save_checkpoint(ibpt_id, key):
+        # Called from the writer threads, which share the metadata connection
+        def on_commit(checkpoint, committed):
+            with meta_lock:
+                update_ingest_checkpoint(conn_meta, ibpt_id, start, *checkpoint)
+            if row_filter:
+                row_filter.commit(checkpoint[0], key, committed)
+
+        return on_commit
+
+    writers = {
+        "p": TableWriter(
+            "s1_product",
+            PRODUCT_COLUMNS,
+            BATCH_SIZES["s1_product"],
+            binary=True,
+            entity="products",
+            on_commit=None if bulk else save_checkpoint(ibpt_ids[0], "p"),
+            bulk=bulk,
+            unlogged=unlogged,
+        ),
+        "pc": TableWriter(
+            "s1_product_category",
+            PRODUCT_CATEGORY_COLUMNS,
+            BATCH_SIZES["s1_product_category"],
+            entity="categories",
+            on_commit=None if bulk else save_checkpoint(ibpt_ids[1], "pc"),
+            bulk=bulk,
+            unlogged=unlogged,
+        ),
+        "rp": TableWriter(
+            "s1_related_product",
+            RELATED_PRODUCT_COLUMNS,
+            BATCH_SIZES["s1_related_product"],
+            entity="retaled_products",
+            on_commit=None if bulk else save_checkpoint(ibpt_ids[2], "rp"),
+            bulk=bulk,
+            unlogged=unlogged,
+            # Pairs of other ranges and earlier runs are skipped by the pair index
+            skip_conflicts=True,
+        ),
+    }
+
+    def write_chunk(result):
+        row_count, (
+            transformed_products,
+            transformed_categories,
+            transformed_related_products,
+            failed_rows_p,
+            failed_rows_pc,
+            failed_rows_rp,
+            chunk_dictionaries,
+        ) = result
+        counts["in"] += row_count
+
+        offset = offsets.popleft()
+        tables = (
+            ("p", transformed_products, failed_rows_p, "product_failed_rows"),
+            (
+                "pc",
+                transformed_categories,
+                failed_rows_pc,
+                "product_categories_failed_rows",
+            ),
+            (
+                "rp",
+                transformed_related_products,
+                failed_rows_rp,
+                "related_products_failed_rows",
+            ),
+        )
+
+        if row_filter:
+            # Rows that failed in any table are read again by the next run
+            for _, _, failed_rows, _ in tables:
+                row_filter.exclude(offset, [failed.row for failed in failed_rows])
+
+        for key, rows, failed_rows, log_name in tables:
+            # Chunks a table committed before a resume are not written again
+            if offset <= resume_offsets[key]:
+                if row_filter:
+                    row_filter.commit(offset, key)
+                continue
+
+            if key == "rp":
+                rows = related_pairs.new_rows(rows)
+
+            chunk_counts[key] += 1
+            writers[key].put(rows, (offset, chunk_counts[key]))
+            for attribute in TABLE_DICTIONARIES[key]:
+                dictionaries[attribute].merge(chunk_dictionaries[attribute])
+
+            if failed_rows:
+                write_failed_rows(
+                    f"./logs/{log_name}{log_suffix}.ndjson",
+                    failed_row_dicts(failed_rows, PRODUCT_SOURCE_FIELDS),
+                )
+                counts[f"failed_{key}"] += len(failed_rows)
+
+    failed = True
+    try:
+        pipeline_stats = run_pipeline(
+            read_chunks(),
+            partial(
+                transform_source_chunk,
+                partial(transform_product_chunk, ibpt_ids=ibpt_ids),
+            ),
+            write_chunk,
+            transform_workers,
+        )
+        print(f"Product pipeline{log_suffix}: {format_pipeline_stats(pipeline_stats)}")
+        failed = False
+
+    finally:
+        for writer in writers.values():
+            writer.close(discard=failed)
+
+        conn_meta.close()
+        if row_filter:
+            counts["unchanged"] = row_filter.unchanged
+            row_filter.close()
+
+        error_logs = [log for w in writers.values() for log in w.error_logs]
+        if error_logs:
+            write_failed_rows(
+                f"./logs/product_error_logs{log_suffix}.ndjson", error_logs
+            )
+        close_failure_logs()
+
+    # Ranges run at the same time, so the rates of the ranges add up
+    for key, writer in writers.items():
+        if writer.error:
+            raise writer.error
+        counts[f"out_{key}"] = writer.rows_out
+        counts[f"rate_{key}"] = writer.rows_per_second()
+    counts["skipped_rp"] = related_pairs.skipped + writers["rp"].skipped
+    counts["dictionaries"] = dictionaries
+
+    return counts
+
+
+def ingest_products(
+    csvFilePath,
+    ibp_id,
+    workers=1,
+    transform_workers=0,
+    resume=False,
+    delta=False,
+    bulk=False,
+    unlogged=False,
+):
+    """
+    Ingests the product CSV into s1_product, s1_product_category and
+    s1_related_product. With more than one worker the file is split into
+    byte ranges on record boundaries and every range is ingested by its own
+    process, each worker logging to its own files. Every range transforms
+    its chunks in a pool of `transform_workers` processes, or inline when it is 0.
+    With resume, an unfinished previous run of the file is continued from
+    the checkpoints of its three tasks. With delta, an unchanged file is
+    skipped and only new or modified rows are ingested. With bulk, the
+    three tables are truncated and reloaded by a single range, each in one
+    transaction, see ingest_product_range, optionally as unlogged tables.
+    """
+    if bulk:
+        # A load in one transaction has nothing to resume or compare against
+        workers, resume, delta = 1, False, False
 
     conn_meta = connect_to_db(DB_ADW)
-    conn = connect_to_db()
 
     ibpt_id_products = create_import_batch_process_task(
         conn_meta, ibp_id, "s1_product", "Running"
@@ -47,347 +593,92 @@ def ingest_products(csvFilePath, ibp_id):
         conn_meta, ibp_id, "s1_related_products", "Running"
     )
 
-    chunk_size = 1000  # Process in chunks of 1000
-    chunk_count = 0
-
-    records_in_count = 0
-    records_failed_count_p = 0
-    records_out_count_p = 0
-
-    records_failed_count_pc = 0
-    records_out_count_pc = 0
-
-    records_failed_count_rp = 0
-    records_out_count_rp = 0
+    counts = {
+        "in": 0,
+        "failed_p": 0,
+        "out_p": 0,
+        "failed_pc": 0,
+        "out_pc": 0,
+        "failed_rp": 0,
+        "out_rp": 0,
+        "skipped_rp": 0,
+        "rate_p": 0.0,
+        "rate_pc": 0.0,
+        "rate_rp": 0.0,
+    }
 
     try:
-
         print("Product ingestion starting...")
 
-        with open(csvFilePath, encoding="utf-8") as csvf:
-            cursor = conn.cursor()
-            csvReader = csv.DictReader(csvf)
-
-            while True:
-                chunk = list(islice(csvReader, chunk_size))
-                records_in_count += len(chunk)
-                if not chunk:
-                    break
-
-                transformed_products = []
-                transformed_categories = []
-                transformed_related_products = []
-                failed_rows_p = []
-                failed_rows_pc = []
-                failed_rows_rp = []
-
-                error_logs = []
-
-                for row in chunk:
-                    try:
-                        # First select fields for product table, and transform
-                        product_metadata_id = str(row["metadataid"])
-                        product_source_key = str(row["asin"])
-
-                        try:
-                            salesrank = convert_value(row["salesrank"])
-                            if isinstance(salesrank, dict):
-
-                                sales_rank_category, sales_rank = next(
-                                    iter(salesrank.items())
-                                )
-                            else:
-                                sales_rank_category = "*Unknown category"
-                                sales_rank = -1
-                        except Exception as e:
-                            sales_rank_category = "*Unknown category"
-                            sales_rank = -1
-
-                        image_url = (
-                            str(row["imurl"]) if row["imurl"] else "*Unknown URL"
-                        )
-                        title = (
-                            sanitize_string(str(row["title"]))
-                            if row["title"]
-                            else "*Unknown title"
-                        )
-                        description = (
-                            sanitize_string(str(row["description"]))
-                            if row["description"]
-                            else "*Unknown description"
-                        )
-                        price = float(row["price"]) if row["price"] else -1.00
-                        brand = (
-                            sanitize_string(str(row["brand"]))
-                            if row["brand"]
-                            else "*Unknown brand"
-                        )
-
-                        if (
-                            len(product_metadata_id)
-                            > MAX_LENGTHS["p_product_metadata_id"]
-                        ):
-                            failed_rows_p.append(
-                                {
-                                    "row": row,
-                                    "error": "product_metadata_id too long",
-                                    "ibpt_id": ibpt_id_products,
-                                }
-                            )
-                            continue
-                        if (
-                            len(product_source_key)
-                            > MAX_LENGTHS["p_product_source_key"]
-                        ):
-                            failed_rows_p.append(
-                                {
-                                    "row": row,
-                                    "error": "product_source_key too long",
-                                    "ibpt_id": ibpt_id_products,
-                                }
-                            )
-                            continue
-                        if (
-                            len(sales_rank_category)
-                            > MAX_LENGTHS["p_sales_rank_category"]
-                        ):
-                            failed_rows_p.append(
-                                {
-                                    "row": row,
-                                    "error": "sales_rank_category too long",
-                                    "ibpt_id": ibpt_id_products,
-                                }
-                            )
-                            continue
-                        if len(image_url) > MAX_LENGTHS["p_image_url"]:
-                            failed_rows_p.append(
-                                {
-                                    "row": row,
-                                    "error": "image_url too long",
-                                    "ibpt_id": ibpt_id_products,
-                                }
-                            )
-                            continue
-                        if len(brand) > MAX_LENGTHS["p_brand"]:
-                            failed_rows_p.append(
-                                {
-                                    "row": row,
-                                    "error": "brand too long",
-                                    "ibpt_id": ibpt_id_products,
-                                }
-                            )
-                            continue
-
-                        transformed_products.append(
-                            [
-                                product_metadata_id,
-                                product_source_key,
-                                sales_rank_category,
-                                sales_rank,
-                                image_url,
-                                title,
-                                description,
-                                price,
-                                brand,
-                            ]
-                        )
-
-                        # Flatten categories and transform.
-                        categories = convert_value(row["categories"])
-                        valid_categories = []
-
-                        def flatten_categories(categories):
-                            """Helper function to flatten any nested arrays within categories"""
-                            flattened = []
-                            for item in categories:
-                                if isinstance(
-                                    item, list
-                                ):  # If the item is a list, recursively flatten it
-                                    flattened.extend(
-                                        flatten_categories(item)
-                                    )  # Unroll nested arrays
-                                else:
-                                    flattened.append(
-                                        item
-                                    )  # Otherwise, just add the item
-                            return flattened
-
-                        if isinstance(categories, list):
-                            flat_categories = flatten_categories(categories)
-
-                            for category in flat_categories:
-                                if len(category) <= MAX_LENGTHS["pc_category"]:
-                                    valid_categories.append(
-                                        [product_source_key, category]
-                                    )
-                                else:
-                                    failed_rows_pc.append(
-                                        {
-                                            "row": row,
-                                            "error": "category too long",
-                                            "ibpt_id": ibpt_id_product_categories,
-                                        }
-                                    )
-                            transformed_categories.extend(valid_categories)
-                        else:
-                            failed_rows_pc.append(
-                                {
-                                    "row": row,
-                                    "error": "invalid categories format",
-                                    "ibpt_id": ibpt_id_product_categories,
-                                }
-                            )
-                            continue
-
-                        # Flatten related products, extract relation
-                        related_products = convert_value(row["related"])
-                        if isinstance(related_products, dict):
-                            valid_related_products = []
-
-                            for relation_type, products in related_products.items():
-                                for related_product in products:
-                                    related_product_source_key = str(related_product)
-                                    relation = str(relation_type)
-                                    if (
-                                        len(related_product_source_key)
-                                        <= MAX_LENGTHS["rl_product_source_key"]
-                                        and len(relation) <= MAX_LENGTHS["rl_relation"]
-                                    ):
-                                        valid_related_products.append(
-                                            [
-                                                product_source_key,
-                                                related_product_source_key,
-                                                relation,
-                                            ]
-                                        )
-                                    else:
-                                        failed_rows_rp.append(
-                                            {
-                                                "row": row,
-                                                "error": "related product fields too long",
-                                                "ibpt_id": ibpt_id_related_products,
-                                            }
-                                        )
-
-                        transformed_related_products.extend(valid_related_products)
-
-                    except Exception as e:
-                        failed_rows_p.append({"row": row, "error": str(e)})
-                        continue
-
-                # Write transformed products to DB
-                if transformed_products:
-                    try:
-                        write_to_db(
-                            cursor,
-                            "s1_product",
-                            [
-                                "p_product_metadata_id",
-                                "p_product_source_key",
-                                "p_sales_rank_category",
-                                "p_sales_rank",
-                                "p_image_url",
-                                "p_title",
-                                "p_description",
-                                "p_price",
-                                "p_brand",
-                            ],
-                            transformed_products,
-                        )
-                        conn.commit()
-                        records_out_count_p += len(transformed_products)
-
-                    except Exception as e:
-                        error_logs.append(
-                            {
-                                "chunk_error": str(e),
-                                "chunk": chunk_count,
-                                "entity": "products",
-                            }
-                        )
-
-                # Write transformed categories to DB
-                if transformed_categories:
-                    try:
-                        write_to_db(
-                            cursor,
-                            "s1_product_category",
-                            ["pc_product_source_key", "pc_category"],
-                            transformed_categories,
-                        )
-                        conn.commit()
-                        records_out_count_pc += len(transformed_categories)
-
-                    except Exception as e:
-                        error_logs.append(
-                            {
-                                "chunk_error": str(e),
-                                "chunk": chunk_count,
-                                "entity": "categories",
-                            }
-                        )
-
-                    # with open(
-                    #     "pc_output.csv", "w", newline="", encoding="utf-8"
-                    # ) as file:
-                    #     writer = csv.writer(file)
-                    #     writer.writerows(
-                    #         transformed_categories
-                    #     )
-                    # break
-
-                # Write related products to DB
-                if transformed_related_products:
-                    try:
-                        write_to_db(
-                            cursor,
-                            "s1_related_product",
-                            [
-                                "rl_product_source_key",
-                                "rl_related_product_source_key",
-                                "rl_relation",
-                            ],
-                            transformed_related_products,
-                        )
-                        conn.commit()
-                        records_out_count_rp += len(transformed_related_products)
-
-                    except Exception as e:
-                        error_logs.append(
-                            {
-                                "chunk_error": str(e),
-                                "chunk": chunk_count,
-                                "entity": "retaled_products",
-                            }
-                        )
-
-                if failed_rows_p:
-                    write_failed_rows("./logs/product_failed_rows.json", failed_rows_pc)
-                    records_failed_count_p += len(failed_rows_p)
-                if failed_rows_pc:
-                    write_failed_rows(
-                        "./logs/product_categories_failed_rows.json", failed_rows_pc
-                    )
-                    records_failed_count_pc += len(failed_rows_pc)
-
-                if failed_rows_rp:
-                    write_failed_rows(
-                        "./logs/related_products_failed_rows.json", failed_rows_pc
+        if delta:
+            unchanged, fingerprint = check_file_unchanged(conn_meta, csvFilePath)
+            if unchanged:
+                print("Product file unchanged since its last ingest, skipping.")
+                complete_delta_ingest(conn_meta, csvFilePath, fingerprint)
+                for ibpt_id in (
+                    ibpt_id_products,
+                    ibpt_id_product_categories,
+                    ibpt_id_related_products,
+                ):
+                    update_import_batch_process_task(
+                        conn_meta, ibpt_id, "Skipped", 0, 0, 0, None, None, None
                     )
-                    records_failed_count_rp += len(failed_rows_rp)
+                return
 
-                if error_logs:
-                    write_failed_rows("./logs/product_error_logs.json", error_logs)
+        ibpt_ids = (
+            ibpt_id_products,
+            ibpt_id_product_categories,
+            ibpt_id_related_products,
+        )
+        fieldnames, ranges = plan_ingest_ranges(
+            conn_meta,
+            csvFilePath,
+            workers,
+            ibpt_ids,
+            ["s1_product", "s1_product_category", "s1_related_products"],
+            resume,
+        )
 
-                chunk_count += 1
+        # Workers write to their own log files, their buffered lines would interleave
+        tasks = [
+            (
+                csvFilePath,
+                fieldnames,
+                start,
+                end,
+                ibpt_ids,
+                checkpoints,
+                f"_part{part}" if len(ranges) > 1 else "",
+                transform_workers,
+                delta,
+                bulk,
+                unlogged,
+            )
+            for part, (start, end, checkpoints) in enumerate(ranges)
+            if start < end
+        ]
+
+        dictionaries = new_dictionaries(DICTIONARY_ATTRIBUTES)
+        for result in run_tasks(ingest_product_range, tasks):
+            merge_dictionaries(dictionaries, result.pop("dictionaries"))
+            merge_counts(counts, result)
+
+        if delta:
+            complete_delta_ingest(conn_meta, csvFilePath, fingerprint)
+            print(f"Skipped {counts.get('unchanged', 0)} unchanged products.")
+
+        print(f"Skipped {counts['skipped_rp']} duplicate or mirrored related products.")
+
+        print(f"Product dictionaries: {format_dictionary_stats(dictionaries)}")
+        export_categories(dictionaries["category"], replace=bulk)
 
         update_import_batch_process_task(
             conn_meta,
             ibpt_id_products,
             "Completed",
-            records_in_count,
-            records_failed_count_p,
-            records_out_count_p,
+            counts["in"],
+            counts["failed_p"],
+            counts["out_p"],
             None,
             None,
             None,
@@ -397,9 +688,9 @@ def ingest_products(csvFilePath, ibp_id):
             conn_meta,
             ibpt_id_product_categories,
             "Completed",
-            records_in_count,
-            records_failed_count_pc,
-            records_out_count_pc,
+            counts["in"],
+            counts["failed_pc"],
+            counts["out_pc"],
             None,
             None,
             None,
@@ -409,14 +700,25 @@ def ingest_products(csvFilePath, ibp_id):
             conn_meta,
             ibpt_id_related_products,
             "Completed",
-            records_in_count,
-            records_failed_count_rp,
-            records_out_count_rp,
+            counts["in"],
+            counts["failed_rp"],
+            counts["out_rp"],
             None,
             None,
             None,
         )
 
+        # Rows per second of every table
+        update_import_batch_process_task_rate(
+            conn_meta, ibpt_id_products, counts["rate_p"]
+        )
+        update_import_batch_process_task_rate(
+            conn_meta, ibpt_id_product_categories, counts["rate_pc"]
+        )
+        update_import_batch_process_task_rate(
+            conn_meta, ibpt_id_related_products, counts["rate_rp"]
+        )
+
         print("Product ingestion complete.")
 
     except KeyboardInterrupt:
@@ -424,9 +726,9 @@ def ingest_products(csvFilePath, ibp_id):
             conn_meta,
             ibpt_id_products,
             "Aborted",
-            records_in_count,
-            records_failed_count_p,
-            records_out_count_p,
+            counts["in"],
+            counts["failed_p"],
+            counts["out_p"],
             None,
             None,
             None,
@@ -436,9 +738,9 @@ def ingest_products(csvFilePath, ibp_id):
             conn_meta,
             ibpt_id_product_categories,
             "Aborted",
-            records_in_count,
-            records_failed_count_pc,
-            records_out_count_pc,
+            counts["in"],
+            counts["failed_pc"],
+            counts["out_pc"],
             None,
             None,
             None,
@@ -448,15 +750,15 @@ def ingest_products(csvFilePath, ibp_id):
             conn_meta,
             ibpt_id_related_products,
             "Aborted",
-            records_in_count,
-            records_failed_count_rp,
-            records_out_count_rp,
+            counts["in"],
+            counts["failed_rp"],
+            counts["out_rp"],
             None,
             None,
             None,
         )
 
-        update_import_batch_process(conn, ibp_id, "Aborted")
+        update_import_batch_process(conn_meta, ibp_id, "Aborted")
 
     except Exception as e:
         print(f"Error during product ingestion: {e}")
@@ -464,9 +766,9 @@ def ingest_products(csvFilePath, ibp_id):
             conn_meta,
             ibpt_id_products,
             "Failed",
-            records_in_count,
-            records_failed_count_p,
-            records_out_count_p,
+            counts["in"],
+            counts["failed_p"],
+            counts["out_p"],
             None,
             None,
             None,
@@ -476,9 +778,9 @@ def ingest_products(csvFilePath, ibp_id):
             conn_meta,
             ibpt_id_product_categories,
             "Failed",
-            records_in_count,
-            records_failed_count_pc,
-            records_out_count_pc,
+            counts["in"],
+            counts["failed_pc"],
+            counts["out_pc"],
             None,
             None,
             None,
@@ -488,16 +790,15 @@ def ingest_products(csvFilePath, ibp_id):
             conn_meta,
             ibpt_id_related_products,
             "Failed",
-            records_in_count,
-            records_failed_count_rp,
-            records_out_count_rp,
+            counts["in"],
+            counts["failed_rp"],
+            counts["out_rp"],
             None,
             None,
             None,
         )
 
-        update_import_batch_process(conn, ibp_id, "Failed")
+        update_import_batch_process(conn_meta, ibp_id, "Failed")
 
     finally:
         conn_meta.close()
-        conn.close()
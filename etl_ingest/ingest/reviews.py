@@ -1,210 +1,520 @@
-import csv
+import re
+from collections import deque, namedtuple
 from datetime import datetime
-from itertools import islice
+from functools import partial
 
-from utils.db_utills import connect_to_db, write_to_db, DB_ADW
+from utils.db_utills import (
+    connect_to_db,
+    write_to_db,
+    truncate_for_bulk_load,
+    DB_ADW,
+)
 from utils.data_utils import sanitize_string, convert_value
-from utils.output_utils import write_failed_rows
+from utils.source_utils import (
+    open_source,
+    transform_source_chunk,
+    failed_row_dicts,
+    FailedRow,
+)
+from utils.compression_utils import format_decompression_stats
+from utils.checkpoint_utils import plan_ingest_ranges
+from utils.delta_utils import RowHashFilter, check_file_unchanged, complete_delta_ingest
+from utils.parallel_utils import run_tasks, merge_counts
+from utils.pipeline_utils import run_pipeline, format_pipeline_stats
+from utils.output_utils import write_failed_rows, close_failure_logs
+from utils.transform_utils import Column, target_columns, compile_row_transform
+from utils.columnar_utils import (
+    np,
+    require_numpy,
+    parse_column,
+    round_column,
+    local_datetimes,
+    date_keys,
+    MIN_TIMESTAMP,
+    MAX_TIMESTAMP,
+)
 from utils.metadata_utils import (
     create_import_batch_process_task,
     update_import_batch_process_task,
     update_import_batch_process,
+    update_ingest_checkpoint,
 )
 
 
-# Max lengths for columns
-MAX_LENGTHS = {
-    "r_reviewer_source_key": 21,
-    "r_product_key": 10,
-    # "r_reviewer_name": 100,
-    # "r_review_text": 225,
-    # "r_review_title": 150,
-    "r_review_dateTime": 19,
+# Fields of the review CSV the transform reads and their keys in the
+# reviews_*.json.gz dumps, other columns are not decoded
+REVIEW_SOURCE_FIELDS = {
+    "reviewerID": "reviewerID",
+    "asin": "asin",
+    "reviewerName": "reviewerName",
+    "helpful": "helpful",
+    "reviewText": "reviewText",
+    "overall": "overall",
+    "summary": "summary",
+    "unixReviewTime": "unixReviewTime",
 }
 
 
+def parse_helpfulness_rating(value):
+    """Turns a [helpful, total] vote pair into a rating, None without votes."""
+    rating_array = convert_value(value)
+    if rating_array[1] == 0:
+        return None
+    return float(round(rating_array[0] / rating_array[1], 2))
+
+
+def parse_review_datetime(value):
+    return datetime.fromtimestamp(int(value))
+
+
+def parse_review_title(value):
+    return str(value).strip()
+
+
+# Columns of s1_review, checked and transformed in this order
+REVIEW_SPEC = [
+    Column(
+        "r_reviewer_source_key",
+        "reviewerID",
+        max_length=21,
+        error="reviewer_id too long",
+    ),
+    Column("r_product_key", "asin", max_length=10, error="product_key too long"),
+    Column(
+        "r_reviewer_name",
+        "reviewerName",
+        default="*Unknown username",
+        sanitizer=sanitize_string,
+        # max_length=100,
+    ),
+    Column(
+        "r_review_text",
+        "reviewText",
+        default="*Unknown review text",
+        sanitizer=sanitize_string,
+        # max_length=225,
+    ),
+    Column(
+        "r_review_title",
+        "summary",
+        default="*Unknown review title",
+        parser=parse_review_title,
+        sanitizer=sanitize_string,
+        # max_length=150,
+    ),
+    Column("r_review_score", "overall", parser=float, error="Invalid review score"),
+    Column(
+        "r_helpfulness_rating",
+        "helpful",
+        parser=parse_helpfulness_rating,
+        error="Invalid helpful rating",
+    ),
+    Column(
+        "r_review_datetime",
+        "unixReviewTime",
+        parser=parse_review_datetime,
+        error="Invalid review date time rating",
+    ),
+]
+
+REVIEW_COLUMNS = target_columns(REVIEW_SPEC)
+
+transform_review_row = compile_row_transform(
+    REVIEW_SPEC, REVIEW_SOURCE_FIELDS, "transform_review_row"
+)
+
+
+def transform_review_chunk(chunk):
+    """
+    Transforms a chunk of raw review rows, tuples in the order of
+    REVIEW_SOURCE_FIELDS, returns the transformed and failed rows.
+    """
+    transformed_reviews = []
+    failed_rows = []
+
+    for row in chunk:
+        try:
+            transformed_reviews.append(transform_review_row(row))
+        except Exception as e:
+            failed_rows.append(FailedRow(row, str(e)))
+
+    return transformed_reviews, failed_rows
+
+
+# Columns computed per chunk with NumPy in columnar mode, they are the last
+# columns of REVIEW_SPEC, so both transforms produce rows in the same order
+COLUMNAR_TARGETS = ("r_review_score", "r_helpfulness_rating", "r_review_datetime")
+
+transform_review_text = compile_row_transform(
+    [column for column in REVIEW_SPEC if column.target not in COLUMNAR_TARGETS],
+    REVIEW_SOURCE_FIELDS,
+    "transform_review_text",
+)
+
+OVERALL_FIELD = list(REVIEW_SOURCE_FIELDS).index("overall")
+HELPFUL_FIELD = list(REVIEW_SOURCE_FIELDS).index("helpful")
+UNIX_REVIEW_TIME_FIELD = list(REVIEW_SOURCE_FIELDS).index("unixReviewTime")
+
+# A column of helpful vote pairs as the review CSV writes them, e.g. [2, 8][0, 0]
+HELPFUL_PAIRS = re.compile(r"(?:\[\d+, \d+\])*")
+
+# Numeric columns of a chunk of reviews, with a mask of the rows that fail
+ReviewColumns = namedtuple(
+    "ReviewColumns",
+    [
+        "scores",
+        "ratings",
+        "datetimes",
+        "date_keys",
+        "valid_scores",
+        "valid_ratings",
+        "valid_datetimes",
+        "invalid",
+    ],
+)
+
+
+def helpfulness_column(values):
+    """
+    Computes the helpfulness ratings of a column of helpful vote pairs, NaN
+    for pairs without votes, and a mask of the valid pairs. A column in
+    the usual format is split and divided at once, any other column is
+    parsed pair by pair.
+    """
+    if values and all(type(value) is str for value in values):
+        joined = "".join(values)
+        if HELPFUL_PAIRS.fullmatch(joined):
+            try:
+                pairs = np.array(
+                    joined[1:-1].replace("][", ", ").split(", "), dtype=np.int64
+                ).reshape(-1, 2)
+            except OverflowError:
+                pairs = None
+            if pairs is not None:
+                helpful, total = pairs[:, 0], pairs[:, 1]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    ratings = round_column(helpful / total, 2)
+                ratings[total == 0] = np.nan
+                return ratings, np.ones(len(values), dtype=bool)
+
+    ratings = np.full(len(values), np.nan)
+    valid = np.ones(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            rating = parse_helpfulness_rating(value)
+        except Exception:
+            valid[i] = False
+            continue
+        if rating is not None:
+            ratings[i] = rating
+    return ratings, valid
+
+
+def review_columns(chunk):
+    """
+    Computes the score, helpfulness rating, local review datetime and
+    YYYYMMDD date key of a chunk of raw review rows as NumPy arrays.
+    """
+    scores, valid_scores = parse_column(
+        [row[OVERALL_FIELD] for row in chunk], np.float64, float
+    )
+    ratings, valid_ratings = helpfulness_column([row[HELPFUL_FIELD] for row in chunk])
+
+    seconds, valid_datetimes = parse_column(
+        [row[UNIX_REVIEW_TIME_FIELD] for row in chunk], np.int64, int
+    )
+    valid_datetimes &= (seconds >= MIN_TIMESTAMP) & (seconds <= MAX_TIMESTAMP)
+    datetimes = local_datetimes(np.where(valid_datetimes, seconds, 0))
+
+    return ReviewColumns(
+        scores,
+        ratings,
+        datetimes,
+        date_keys(datetimes),
+        valid_scores,
+        valid_ratings,
+        valid_datetimes,
+        ~(valid_scores & valid_ratings & valid_datetimes),
+    )
+
+
+def transform_review_chunk_columnar(chunk):
+    """
+    Transforms a chunk of raw review rows like transform_review_chunk, with
+    the numeric columns computed for the whole chunk by review_columns.
+    """
+    transformed_reviews = []
+    failed_rows = []
+
+    columns = review_columns(chunk)
+    ratings = np.where(np.isnan(columns.ratings), None, columns.ratings)
+
+    for row, score, rating, review_datetime, invalid, i in zip(
+        chunk,
+        columns.scores.tolist(),
+        ratings.tolist(),
+        columns.datetimes.tolist(),
+        columns.invalid.tolist(),
+        range(len(chunk)),
+    ):
+        try:
+            review = transform_review_text(row)
+        except Exception as e:
+            failed_rows.append(FailedRow(row, str(e)))
+            continue
+
+        if invalid:
+            if not columns.valid_scores[i]:
+                failed_rows.append(FailedRow(row, "Invalid review score"))
+            elif not columns.valid_ratings[i]:
+                failed_rows.append(FailedRow(row, "Invalid helpful rating"))
+            else:
+                failed_rows.append(FailedRow(row, "Invalid review date time rating"))
+            continue
+
+        review += (score, rating, review_datetime)
+        transformed_reviews.append(review)
+
+    return transformed_reviews, failed_rows
+
+
 # Process: take 1000 rows, transform each column value in each row
 # Write transformed rows to tables in S1
 # Log rows that were invalid
-def ingest_reviews(csvFilePath, ibp_id):
+def ingest_review_range(
+    csvFilePath,
+    fieldnames,
+    start,
+    end,
+    ibpt_id,
+    chunk_count=0,
+    log_suffix="",
+    transform_workers=0,
+    delta=False,
+    columnar=False,
+    bulk=False,
+    unlogged=False,
+):
+    """
+    Ingests the reviews in one byte range of the CSV file over its own
+    stage1 connection and returns the record counts of the range.
+
+    Reading, transforming and writing run as a pipeline, the writer thread
+    owns the stage1 connection while the next chunks are read and transformed.
+    After every chunk the file offset it ends at is checkpointed.
+    With bulk, s1_review is truncated and the whole range is copied with
+    FREEZE in one transaction, committed at the end, so chunks are neither
+    committed nor checkpointed and a failed chunk fails the load.
+    """
+    conn = connect_to_db()
+    conn_meta = connect_to_db(DB_ADW)
+
+    counts = {"in": 0, "failed": 0, "out": 0}
+
+    chunk_size = 1000  # Process in chunks of 1000
+
+    # File offsets after every chunk, the writer gets the chunks in this order
+    offsets = deque()
+
+    # In delta mode only rows that were not ingested before are passed on
+    row_filter = RowHashFilter(csvFilePath, f"{ibpt_id}_{start}") if delta else None
+
+    if columnar:
+        transform = transform_review_chunk_columnar
+    else:
+        transform = transform_review_chunk
+
+    def read_chunks():
+        with open_source(
+            csvFilePath, fieldnames, start, end, REVIEW_SOURCE_FIELDS
+        ) as rows:
+            # Transform workers parse their chunks from a shared mapping of
+            # the file, row hashes are taken from the parsed rows
+            shared = bool(transform_workers) and row_filter is None
+            for chunk in rows.chunks(chunk_size, shared):
+                if row_filter:
+                    # A chunk without new rows still advances the checkpoint
+                    chunk = row_filter.new_rows(chunk, rows.offset)
+                offsets.append(rows.offset)
+                yield chunk
+
+            stats = rows.decompression_stats()
+            if stats:
+                print(f"Review source{log_suffix}: {format_decompression_stats(stats)}")
+
+    def write_chunk(result):
+        nonlocal chunk_count
+        row_count, (transformed_reviews, failed_rows) = result
+        counts["in"] += row_count
+        error_logs = []
+
+        if transformed_reviews and bulk:
+            write_to_db(
+                cursor,
+                "s1_review",
+                REVIEW_COLUMNS,
+                transformed_reviews,
+                binary=True,
+                freeze=True,
+            )
+            counts["out"] += len(transformed_reviews)
+        elif transformed_reviews:
+            try:
+                write_to_db(
+                    cursor,
+                    "s1_review",
+                    REVIEW_COLUMNS,
+                    transformed_reviews,
+                    binary=True,
+                )
+                conn.commit()
+                counts["out"] += len(transformed_reviews)
+            except Exception as e:
+                conn.rollback()
+                error_logs.append(
+                    {
+                        "chunk_error": str(e),
+                        "chunk": chunk_count,
+                        "entity": "reviews",
+                    }
+                )
+
+        if failed_rows:
+            write_failed_rows(
+                f"./logs/review_failed_rows{log_suffix}.ndjson",
+                failed_row_dicts(failed_rows, REVIEW_SOURCE_FIELDS),
+            )
+            counts["failed"] += len(failed_rows)
+
+        if error_logs:
+            write_failed_rows(
+                f"./logs/review_error_logs{log_suffix}.ndjson", error_logs
+            )
+
+        # Written or logged, the chunk is not read again on a resume
+        chunk_count += 1
+        offset = offsets.popleft()
+        if row_filter:
+            # Only the rows committed now are skipped by the next delta run
+            row_filter.exclude(offset, [failed.row for failed in failed_rows])
+            row_filter.commit(offset, committed=not error_logs)
+        if not bulk:
+            update_ingest_checkpoint(conn_meta, ibpt_id, start, offset, chunk_count)
+
+    try:
+        cursor = conn.cursor()
+        if bulk:
+            truncate_for_bulk_load(cursor, "s1_review", unlogged)
+        pipeline_stats = run_pipeline(
+            read_chunks(),
+            partial(transform_source_chunk, transform),
+            write_chunk,
+            transform_workers,
+        )
+        print(f"Review pipeline{log_suffix}: {format_pipeline_stats(pipeline_stats)}")
+        if bulk:
+            conn.commit()
+
+    finally:
+        conn.close()
+        conn_meta.close()
+        if row_filter:
+            counts["unchanged"] = row_filter.unchanged
+            row_filter.close()
+        close_failure_logs()
+
+    return counts
+
+
+def ingest_reviews(
+    csvFilePath,
+    ibp_id,
+    workers=1,
+    transform_workers=0,
+    resume=False,
+    delta=False,
+    columnar=False,
+    bulk=False,
+    unlogged=False,
+):
+    """
+    Ingests the review CSV into s1_review. With more than one worker the file
+    is split into byte ranges on record boundaries and every range is
+    ingested by its own process, each worker logging to its own files.
+    Every range transforms its chunks in a pool of `transform_workers`
+    processes, or inline when it is 0. With resume, an unfinished previous
+    run of the file is continued from its checkpoints. With delta, an
+    unchanged file is skipped and only new or modified rows are ingested.
+    With columnar, the numeric columns of every chunk are computed with
+    NumPy, see transform_review_chunk_columnar. With bulk, s1_review is
+    truncated and reloaded in one transaction by a single range, see
+    ingest_review_range, optionally as an unlogged table.
+    """
+    if columnar:
+        require_numpy()
+    if bulk:
+        # A load in one transaction has nothing to resume or compare against
+        workers, resume, delta = 1, False, False
 
     conn_meta = connect_to_db(DB_ADW)
-    conn = connect_to_db()
 
     ibpt_id = create_import_batch_process_task(
         conn_meta, ibp_id, "s1_review", "Running"
     )
 
-    records_in_count = 0
-    records_failed_count = 0
-    records_out_count = 0
+    counts = {"in": 0, "failed": 0, "out": 0}
 
     try:
-
         print("Review ingestion starting...")
 
-        chunk_size = 1000  # Process in chunks of 1000
-        chunk_count = 0
-
-        with open(csvFilePath, encoding="utf-8") as csvf:
-
-            cursor = conn.cursor()
-            csvReader = csv.DictReader(csvf)
-
-            while True:
-                chunk = list(islice(csvReader, chunk_size))
-                records_in_count += len(chunk)
-                if not chunk:
-                    break
-
-                transformed_reviews = []
-                failed_rows = []
-                error_logs = []
-
-                for row in chunk:
-
-                    try:
-                        # Extract and transform review data
-                        reviewer_id = str(row["reviewerID"])
-                        product_key = str(row["asin"])
-                        reviewer_name = sanitize_string(
-                            (
-                                str(row["reviewerName"])
-                                if row["reviewerName"]
-                                else "*Unknown username"
-                            )
-                        )
-
-                        if len(reviewer_id) > MAX_LENGTHS["r_reviewer_source_key"]:
-                            failed_rows.append(
-                                {"row": row, "error": "reviewer_id too long"}
-                            )
-                            continue
-                        if len(product_key) > MAX_LENGTHS["r_product_key"]:
-                            failed_rows.append(
-                                {"row": row, "error": "product_key too long"}
-                            )
-                            continue
-                        # if len(reviewer_name) > MAX_LENGTHS["r_reviewer_name"]:
-                        #     failed_rows.append(
-                        #         {"row": row, "error": "reviewer_name too long"}
-                        #     )
-                        #     continue
-
-                        review_text = sanitize_string(
-                            str(row["reviewText"])
-                            if row["reviewText"]
-                            else "*Unknown review text"
-                        )
-
-                        review_title = sanitize_string(
-                            str(row["summary"]).strip()
-                            if row["summary"]
-                            else "*Unknown review title"
-                        )
-                        # if len(review_title) > MAX_LENGTHS["r_review_title"]:
-                        #     failed_rows.append(
-                        #         {
-                        #             "row": row,
-                        #             "error": "review_title too long",
-                        #             "title_length": len(review_title),
-                        #         }
-                        #     )
-                        #     continue
-
-                        try:
-                            review_score = float(row["overall"])
-                        except (ValueError, TypeError):
-                            failed_rows.append(
-                                {"row": row, "error": "Invalid review score"}
-                            )
-                            continue
-
-                        try:
-                            rating_array = convert_value(row["helpful"])
-                            if rating_array[1] == 0:
-                                helpfullness_rating = None
-                            else:
-                                helpfullness_rating = float(
-                                    round(rating_array[0] / rating_array[1], 2)
-                                )
-                        except:
-                            failed_rows.append(
-                                {"row": row, "error": "Invalid helpful rating"}
-                            )
-                            continue
-
-                        try:
-                            review_datetime = datetime.fromtimestamp(
-                                int(row["unixReviewTime"])
-                            )
-                        except:
-                            failed_rows.append(
-                                {"row": row, "error": "Invalid review date time rating"}
-                            )
-                            continue
-
-                        transformed_reviews.append(
-                            [
-                                reviewer_id,
-                                product_key,
-                                reviewer_name,
-                                helpfullness_rating,
-                                review_text,
-                                review_score,
-                                review_title,
-                                review_datetime,
-                            ]
-                        )
-
-                    except Exception as e:
-                        failed_rows.append({"row": row, "error": str(e)})
-                        continue
-
-                if transformed_reviews:
-                    try:
-                        write_to_db(
-                            cursor,
-                            "s1_review",
-                            [
-                                "r_reviewer_source_key",
-                                "r_product_key",
-                                "r_reviewer_name",
-                                "r_helpfulness_rating",
-                                "r_review_text",
-                                "r_review_score",
-                                "r_review_title",
-                                "r_review_datetime",
-                            ],
-                            transformed_reviews,
-                        )
-                        conn.commit()
-                        records_out_count += len(transformed_reviews)
-                    except Exception as e:
-                        error_logs.append(
-                            {
-                                "chunk_error": str(e),
-                                "chunk": chunk_count,
-                                "entity": "reviews",
-                            }
-                        )
-
-                if failed_rows:
-                    write_failed_rows("./logs/review_failed_rows.json", failed_rows)
-                    records_failed_count += len(failed_rows)
-
-                if error_logs:
-                    write_failed_rows("./logs/review_error_logs.json", error_logs)
-
-                chunk_count += 1
+        if delta:
+            unchanged, fingerprint = check_file_unchanged(conn_meta, csvFilePath)
+            if unchanged:
+                print("Review file unchanged since its last ingest, skipping.")
+                complete_delta_ingest(conn_meta, csvFilePath, fingerprint)
+                update_import_batch_process_task(
+                    conn_meta, ibpt_id, "Skipped", 0, 0, 0, None, None, None
+                )
+                return
+
+        fieldnames, ranges = plan_ingest_ranges(
+            conn_meta, csvFilePath, workers, [ibpt_id], ["s1_review"], resume
+        )
+
+        # Workers write to their own log files, their buffered lines would interleave
+        tasks = [
+            (
+                csvFilePath,
+                fieldnames,
+                start,
+                end,
+                ibpt_id,
+                checkpoints[0][1],
+                f"_part{part}" if len(ranges) > 1 else "",
+                transform_workers,
+                delta,
+                columnar,
+                bulk,
+                unlogged,
+            )
+            for part, (start, end, checkpoints) in enumerate(ranges)
+            if start < end
+        ]
+
+        for result in run_tasks(ingest_review_range, tasks):
+            merge_counts(counts, result)
+
+        if delta:
+            complete_delta_ingest(conn_meta, csvFilePath, fingerprint)
+            print(f"Skipped {counts.get('unchanged', 0)} unchanged reviews.")
 
         update_import_batch_process_task(
             conn_meta,
             ibpt_id,
             "Completed",
-            records_in_count,
-            records_failed_count,
-            records_out_count,
+            counts["in"],
+            counts["failed"],
+            counts["out"],
             None,
             None,
             None,
@@ -216,14 +526,14 @@ def ingest_reviews(csvFilePath, ibp_id):
             conn_meta,
             ibpt_id,
             "Aborted",
-            records_in_count,
-            records_failed_count,
-            records_out_count,
+            counts["in"],
+            counts["failed"],
+            counts["out"],
             None,
             None,
             None,
         )
-        update_import_batch_process(conn, ibp_id, "Aborted")
+        update_import_batch_process(conn_meta, ibp_id, "Aborted")
 
     except Exception as e:
         print(f"Error during review ingestion: {e}")
@@ -231,9 +541,9 @@ def ingest_reviews(csvFilePath, ibp_id):
             conn_meta,
             ibpt_id,
             "Failed",
-            records_in_count,
-            records_failed_count,
-            records_out_count,
+            counts["in"],
+            counts["failed"],
+            counts["out"],
             None,
             None,
             None,
@@ -242,4 +552,3 @@ def ingest_reviews(csvFilePath, ibp_id):
 
     finally:
         conn_meta.close()
-        conn.close()
@@ -1,3 +1,4 @@
+import os
 import time
 from datetime import datetime
 
@@ -5,6 +6,7 @@ from ingest.products import ingest_products
 from ingest.reviews import ingest_reviews
 
 from utils.db_utills import DB_ADW, connect_to_db
+from utils.bulk_load_utils import drop_indexes, rebuild_indexes
 from utils.metadata_utils import (
     create_import_batch,
     create_import_batch_process,
@@ -13,9 +15,32 @@ from utils.metadata_utils import (
 )
 
 
-# Run the ingestion
-reviews_csvFilePath = r"./data/reviews_Clothing_Shoes_and_Jewelry_5.csv"
-products_csvFilePath = r"./data/metadata_category_clothing_shoes_and_jewelry_only.csv"
+# Run the ingestion, the CSVs or the original reviews_*.json.gz and meta_*.json.gz dumps,
+# .gz, .bz2 and .xz files are decompressed while they are read
+reviews_csvFilePath = os.environ.get(
+    "INGEST_REVIEWS_FILE", r"./data/reviews_Clothing_Shoes_and_Jewelry_5.csv"
+)
+products_csvFilePath = os.environ.get(
+    "INGEST_PRODUCTS_FILE",
+    r"./data/metadata_category_clothing_shoes_and_jewelry_only.csv",
+)
+
+# Number of worker processes per CSV file, 1 ingests on a single core
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 1))
+# Transform processes per worker, 0 transforms in the worker itself
+INGEST_TRANSFORM_WORKERS = int(os.environ.get("INGEST_TRANSFORM_WORKERS", 0))
+# Continue an unfinished previous run of a file from its checkpoints
+INGEST_RESUME = os.environ.get("INGEST_RESUME", "false").lower() == "true"
+# Skip unchanged files and only ingest new or modified rows
+INGEST_DELTA = os.environ.get("INGEST_DELTA", "false").lower() == "true"
+# Compute the numeric review columns per chunk with NumPy
+INGEST_COLUMNAR = os.environ.get("INGEST_COLUMNAR", "false").lower() == "true"
+# Truncate and reload the stage1 tables with COPY FREEZE, indexes built after
+INGEST_BULK_LOAD = os.environ.get("INGEST_BULK_LOAD", "false").lower() == "true"
+# Make the bulk loaded tables unlogged, they are lost on a database crash
+INGEST_BULK_UNLOGGED = os.environ.get("INGEST_BULK_UNLOGGED", "false").lower() == "true"
+# Sessions that rebuild the indexes after a bulk load at the same time
+INGEST_INDEX_WORKERS = int(os.environ.get("INGEST_INDEX_WORKERS", 4))
 
 
 if __name__ == "__main__":
@@ -28,8 +53,35 @@ if __name__ == "__main__":
     ibp_id = create_import_batch_process(conn, ib_id, "Ingest", "Running")
 
     try:
-        ingest_reviews(reviews_csvFilePath, ibp_id)
-        ingest_products(products_csvFilePath, ibp_id)
+        # A bulk load builds every index once, instead of row by row
+        indexes = drop_indexes(conn, ibp_id) if INGEST_BULK_LOAD else []
+
+        try:
+            ingest_reviews(
+                reviews_csvFilePath,
+                ibp_id,
+                INGEST_WORKERS,
+                INGEST_TRANSFORM_WORKERS,
+                INGEST_RESUME,
+                INGEST_DELTA,
+                INGEST_COLUMNAR,
+                INGEST_BULK_LOAD,
+                INGEST_BULK_UNLOGGED,
+            )
+            ingest_products(
+                products_csvFilePath,
+                ibp_id,
+                INGEST_WORKERS,
+                INGEST_TRANSFORM_WORKERS,
+                INGEST_RESUME,
+                INGEST_DELTA,
+                INGEST_BULK_LOAD,
+                INGEST_BULK_UNLOGGED,
+            )
+
+        finally:
+            if indexes:
+                rebuild_indexes(conn, ibp_id, indexes, INGEST_INDEX_WORKERS)
 
         update_import_batch_process(conn, ibp_id, "Completed")
 
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from utils import checkpoint_utils
+from utils.checkpoint_utils import plan_ingest_ranges
+
+DESCRIPTIONS = ["s1_product", "s1_product_category", "s1_related_products"]
+
+
+class PlanIngestRangesTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "products.csv")
+        with open(self.path, "w", newline="") as f:
+            f.write("asin,title\n" + "".join(f"A{i},T{i}\n" for i in range(100)))
+
+        self.created = []
+        patcher = mock.patch.object(
+            checkpoint_utils,
+            "create_ingest_checkpoint",
+            lambda conn, *checkpoint: self.created.append(checkpoint),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def plan(self, previous, workers=2):
+        with mock.patch.object(
+            checkpoint_utils,
+            "get_resume_checkpoints",
+            lambda conn, description, path: previous.get(description, {}),
+        ):
+            return plan_ingest_ranges(
+                None, self.path, workers, (1, 2, 3), DESCRIPTIONS, resume=True
+            )
+
+    def test_new_run_starts_every_task_at_its_range(self):
+        fieldnames, ranges = self.plan({})
+
+        self.assertEqual(fieldnames, ["asin", "title"])
+        self.assertEqual(len(ranges), 2)
+        for start, _, checkpoints in ranges:
+            self.assertEqual(checkpoints, [(start, 0)] * 3)
+        self.assertEqual(len(self.created), 6)
+
+    def test_resume_reads_from_the_lowest_checkpoint_of_a_range(self):
+        previous = {
+            "s1_product": {11: (400, 250, 5), 400: (700, 700, 9)},
+            "s1_product_category": {11: (400, 120, 2), 400: (700, 650, 8)},
+            # The related products of the second range were never checkpointed
+            "s1_related_products": {11: (400, 180, 3)},
+        }
+        _, ranges = self.plan(previous)
+
+        self.assertEqual(
+            ranges,
+            [
+                (120, 400, [(250, 5), (120, 2), (180, 3)]),
+                (400, 700, [(700, 9), (650, 8), (400, 0)]),
+            ],
+        )
+        # The checkpoints are carried over to the tasks of the new run
+        self.assertIn((1, self.path, 120, 400, 250, 5), self.created)
+        self.assertIn((3, self.path, 400, 700, 400, 0), self.created)
+
+
+if __name__ == "__main__":
+    unittest.main()
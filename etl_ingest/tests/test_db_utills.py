@@ -0,0 +1,37 @@
+import unittest
+
+from utils.db_utills import CopyStream, encode_copy_row, encode_copy_value
+
+
+class CopyTextTest(unittest.TestCase):
+    def test_escapes_the_separators_of_the_text_format(self):
+        self.assertEqual(encode_copy_value("a\tb"), "a\\tb")
+        self.assertEqual(encode_copy_value("a\nb\r"), "a\\nb\\r")
+        self.assertEqual(encode_copy_value("C:\\dir"), "C:\\\\dir")
+        self.assertEqual(encode_copy_value("\\N"), "\\\\N")
+
+    def test_none_is_null_and_other_values_are_formatted(self):
+        self.assertEqual(encode_copy_value(None), "\\N")
+        self.assertEqual(encode_copy_value(""), "")
+        self.assertEqual(encode_copy_value(4.5), "4.5")
+        self.assertEqual(encode_copy_value("plain text"), "plain text")
+
+    def test_row_is_one_line(self):
+        self.assertEqual(
+            encode_copy_row(("a\tb", None, 3, "x\ny")), "a\\tb\t\\N\t3\tx\\ny\n"
+        )
+
+    def test_stream_returns_every_row_across_small_reads(self):
+        rows = [("a", None), ("b\tc", 2)]
+        stream = CopyStream(rows)
+        data = ""
+        while True:
+            part = stream.read(3)
+            if not part:
+                break
+            data += part
+        self.assertEqual(data, "a\t\\N\nb\\tc\t2\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from utils import delta_utils
+from utils.delta_utils import RowHashFilter, merge_row_hashes, row_hash
+
+
+class RowHashFilterTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patcher = mock.patch.object(
+            delta_utils, "STATE_DIR", os.path.join(directory, "state")
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.path = os.path.join(directory, "reviews.csv")
+
+    def run_filter(self, chunks, tables=(None,)):
+        """Filters chunks by offset, returns the filter to commit them."""
+        row_filter = RowHashFilter(self.path, "1_0", tables)
+        new = [row_filter.new_rows(rows, offset) for offset, rows in chunks]
+        return row_filter, new
+
+    def test_row_hash_is_stable_and_separates_fields(self):
+        self.assertEqual(row_hash(("a", 1)), row_hash(["a", "1"]))
+        self.assertNotEqual(row_hash(("ab", "c")), row_hash(("a", "bc")))
+
+    def test_committed_rows_are_skipped_by_the_next_run(self):
+        row_filter, new = self.run_filter([(10, [("a",), ("b",)])])
+        self.assertEqual(new, [[("a",), ("b",)]])
+        row_filter.commit(10)
+        row_filter.close()
+        merge_row_hashes(self.path)
+
+        row_filter, new = self.run_filter([(10, [("a",), ("c",)])])
+        row_filter.close()
+        self.assertEqual(new, [[("c",)]])
+        self.assertEqual(row_filter.unchanged, 1)
+
+    def test_failed_and_rolled_back_rows_are_read_again(self):
+        row_filter, _ = self.run_filter(
+            [(10, [("a",), ("failed",)]), (20, [("rolled back",)])]
+        )
+        row_filter.exclude(10, [("failed",)])
+        row_filter.commit(10)
+        row_filter.commit(20, committed=False)
+        row_filter.close()
+        merge_row_hashes(self.path)
+
+        row_filter, new = self.run_filter(
+            [(10, [("a",), ("failed",), ("rolled back",)])]
+        )
+        row_filter.close()
+        self.assertEqual(new, [[("failed",), ("rolled back",)]])
+
+    def test_rows_are_recorded_once_every_table_committed(self):
+        row_filter, _ = self.run_filter(
+            [(10, [("a",)]), (20, [("b",)])], tables=("p", "pc")
+        )
+        # The product writer commits both chunks, the category writer one
+        row_filter.commit(20, "p")
+        row_filter.commit(10, "pc")
+        row_filter.close()
+        merge_row_hashes(self.path)
+
+        row_filter, new = self.run_filter([(10, [("a",), ("b",)])])
+        row_filter.close()
+        self.assertEqual(new, [[("b",)]])
+
+
+if __name__ == "__main__":
+    unittest.main()
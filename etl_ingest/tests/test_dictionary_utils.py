@@ -0,0 +1,66 @@
+import pickle
+import unittest
+
+from utils.dictionary_utils import RelationPairs, ValueDictionary
+
+
+class ValueDictionaryTest(unittest.TestCase):
+    def test_encode_counts_and_interns(self):
+        dictionary = ValueDictionary()
+        first = "".join(["Bo", "oks"])
+        self.assertEqual(dictionary.encode(first), 0)
+        self.assertEqual(dictionary.encode("Music"), 1)
+        self.assertIs(dictionary.intern("".join(["Boo", "ks"])), first)
+        self.assertEqual(dictionary.values, ["Books", "Music"])
+        self.assertEqual(dictionary.counts, [2, 1])
+
+    def test_merge_returns_the_codes_of_the_other_dictionary(self):
+        total = ValueDictionary()
+        total.encode("Music")
+        chunk = ValueDictionary()
+        chunk.encode("Books")
+        chunk.encode("Music", 3)
+
+        self.assertEqual(total.merge(chunk), [1, 0])
+        self.assertEqual(total.values, ["Music", "Books"])
+        self.assertEqual(total.counts, [4, 1])
+
+    def test_pickles_values_and_counts(self):
+        dictionary = ValueDictionary()
+        dictionary.encode("Books", 2)
+        copy = pickle.loads(pickle.dumps(dictionary))
+        self.assertEqual(copy.codes, {"Books": 0})
+        self.assertEqual(copy.counts, [2])
+
+
+class RelationPairsTest(unittest.TestCase):
+    def test_mirrored_and_repeated_pairs_are_written_once(self):
+        pairs = RelationPairs()
+        rows = [
+            ["A1", "A2", "also_bought"],
+            ["A2", "A1", "also_bought"],
+            ["A1", "A2", "also_bought"],
+            ["A1", "A2", "also_viewed"],
+            ["A2", "A3", "also_bought"],
+        ]
+
+        self.assertEqual(
+            pairs.new_rows(rows),
+            [
+                ["A1", "A2", "also_bought"],
+                ["A1", "A2", "also_viewed"],
+                ["A2", "A3", "also_bought"],
+            ],
+        )
+        self.assertEqual(pairs.skipped, 2)
+        self.assertEqual(len(pairs), 3)
+
+    def test_pairs_of_earlier_chunks_are_skipped(self):
+        pairs = RelationPairs()
+        pairs.new_rows([["A1", "A2", "bought_together"]])
+        self.assertEqual(pairs.new_rows([["A2", "A1", "bought_together"]]), [])
+        self.assertEqual(pairs.skipped, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
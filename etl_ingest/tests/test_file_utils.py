@@ -0,0 +1,51 @@
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.file_utils import record_chunk_end, sample_record_size
+
+
+class RecordChunkEndTest(unittest.TestCase):
+    def map(self, data):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "records.csv")
+        with open(path, "wb") as f:
+            f.write(data)
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.addCleanup(mapped.close)
+        return mapped
+
+    def test_ends_after_the_record_of_the_target(self):
+        mapped = self.map(b"a,1\nb,2\nc,3\n")
+        self.assertEqual(record_chunk_end(mapped, 0, len(mapped), 5), 8)
+
+    def test_newline_in_quotes_does_not_end_a_record(self):
+        data = b'a,"x\ny\nz"\nb,2\n'
+        mapped = self.map(data)
+        # The target falls between the quoted newlines
+        self.assertEqual(record_chunk_end(mapped, 0, len(mapped), 5), data.index(b"b"))
+
+    def test_quotes_before_the_target_are_counted_from_the_start(self):
+        data = b'a,"q"\nb,"x\ny"\nc,3\n'
+        mapped = self.map(data)
+        start = data.index(b"b")
+        self.assertEqual(
+            record_chunk_end(mapped, start, len(mapped), 4), data.index(b"c")
+        )
+
+    def test_never_ends_past_the_range(self):
+        mapped = self.map(b"a,1\nb,2\nc,3\n")
+        self.assertEqual(record_chunk_end(mapped, 0, 8, 100), 8)
+        self.assertEqual(record_chunk_end(mapped, 0, 6, 5), 6)
+
+    def test_sample_record_size(self):
+        mapped = self.map(b"ab,1\ncd,2\n")
+        self.assertEqual(sample_record_size(mapped, 0, len(mapped)), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from ingest.products import transform_product_chunk
+
+
+def product_row(asin, categories, related="{}"):
+    return ("1", asin, "{'Books': 5}", "", categories, "Title", "", "9.99", "", related)
+
+
+class TransformProductChunkTest(unittest.TestCase):
+    def test_category_of_several_paths_counts_once_per_product(self):
+        chunk = [
+            product_row("A1", "[['Books', 'Fiction'], ['Books', 'Mystery']]"),
+            product_row("A2", "[['Books']]"),
+        ]
+        _, categories, _, failed, _, _, dictionaries = transform_product_chunk(
+            chunk, (1, 2, 3)
+        )
+
+        self.assertEqual(failed, [])
+        self.assertEqual(
+            categories,
+            [
+                ["A1", "Books"],
+                ["A1", "Fiction"],
+                ["A1", "Mystery"],
+                ["A2", "Books"],
+            ],
+        )
+        category = dictionaries["category"]
+        self.assertEqual(
+            dict(zip(category.values, category.counts)),
+            {
+                "Books": 2,
+                "Fiction": 1,
+                "Mystery": 1,
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import csv
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.file_utils import split_file_ranges
+from utils.source_utils import CsvReader, MappedCsvReader, open_source
+
+FIELDNAMES = ["asin", "title", "description"]
+
+
+def write_csv(path, records):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(FIELDNAMES)
+        writer.writerows(records)
+
+
+def sample_records(count):
+    # The first records are longer, so a range resumed past them samples a
+    # smaller record size and cuts its chunks at other offsets
+    return [
+        (
+            f"A{index:05d}",
+            "title" * (40 if index < 30 else 1 + index % 7),
+            f"line one\nline, two {index}" if index % 3 == 0 else "plain",
+        )
+        for index in range(count)
+    ]
+
+
+class SourceTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "products.csv")
+
+    def read_chunks(self, start, end, chunk_size, stops=()):
+        """Returns (end offset, rows) of every chunk of a range."""
+        with open_source(self.path, FIELDNAMES, start, end, FIELDNAMES) as rows:
+            return [
+                (rows.offset, chunk) for chunk in rows.chunks(chunk_size, stops=stops)
+            ]
+
+
+class MappedChunkTest(SourceTest):
+    def test_quoted_newline_across_a_chunk_boundary(self):
+        description = "first line\n" + "x" * 200 + "\nlast line"
+        records = [("A1", "short", "plain"), ("A2", "long", description)] + [
+            (f"B{index}", "short", "plain") for index in range(20)
+        ]
+        write_csv(self.path, records)
+        _, [(start, end)] = split_file_ranges(self.path, 1)
+
+        with MappedCsvReader(self.path, FIELDNAMES, start, end, FIELDNAMES) as rows:
+            # The first records are short, the chunk target ends inside the quotes
+            rows.record_size = 20
+            chunks = list(rows.chunks(2))
+
+        self.assertEqual([row for chunk in chunks for row in chunk], records)
+        self.assertIn(("A2", "long", description), chunks[0])
+
+    def test_chunks_match_csv_reader(self):
+        records = sample_records(200)
+        write_csv(self.path, records)
+        _, [(start, end)] = split_file_ranges(self.path, 1)
+
+        with MappedCsvReader(self.path, FIELDNAMES, start, end, FIELDNAMES) as rows:
+            mapped = [row for chunk in rows.chunks(7) for row in chunk]
+        self.assertEqual(mapped, records)
+
+
+class ResumeTest(SourceTest):
+    def resume(self, start, end, checkpoints, chunk_size):
+        """
+        Reads a range again from the lowest checkpoint, like a resumed
+        ingest_product_range, and returns the rows every table writes.
+        """
+        written = {key: [] for key in checkpoints}
+        resume_start = min(checkpoints.values())
+        for offset, chunk in self.read_chunks(
+            resume_start, end, chunk_size, checkpoints.values()
+        ):
+            for key, checkpoint in checkpoints.items():
+                if offset <= checkpoint:
+                    continue
+                written[key].extend(chunk)
+        return written
+
+    def test_resume_from_unaligned_checkpoints(self):
+        records = sample_records(300)
+        write_csv(self.path, records)
+        _, [(start, end)] = split_file_ranges(self.path, 1)
+
+        # The first run is interrupted after its tables committed different chunks
+        first_run = self.read_chunks(start, end, 10)
+        committed = {"p": 9, "pc": 4, "rp": 2}
+        checkpoints = {}
+        for key, chunks in committed.items():
+            checkpoints[key] = first_run[chunks - 1][0] if chunks else start
+
+        written = self.resume(start, end, checkpoints, 10)
+
+        for key, chunks in committed.items():
+            already = sum(len(chunk) for _, chunk in first_run[:chunks])
+            self.assertEqual(written[key], records[already:], key)
+
+    def test_chunks_end_at_the_stops_of_a_compressed_source(self):
+        records = sample_records(50)
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows([FIELDNAMES] + records)
+        compressed = self.path + ".gz"
+        with gzip.open(compressed, "wt", encoding="utf-8", newline="") as f:
+            f.write(buffer.getvalue())
+
+        start = len(",".join(FIELDNAMES)) + 1
+        with CsvReader(compressed, FIELDNAMES, start, 1 << 62, FIELDNAMES) as rows:
+            stop = [rows.offset for _ in rows.chunks(8)][2]
+
+        ends = []
+        chunks = []
+        with CsvReader(compressed, FIELDNAMES, start, 1 << 62, FIELDNAMES) as rows:
+            for chunk in rows.chunks(5, stops=[stop]):
+                ends.append(rows.offset)
+                chunks.append(chunk)
+
+        self.assertIn(stop, ends)
+        self.assertEqual([row for chunk in chunks for row in chunk], records)
+
+
+if __name__ == "__main__":
+    unittest.main()
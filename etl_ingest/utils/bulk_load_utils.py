@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import sql
+
+from utils.db_utills import connect_to_db
+from utils.metadata_utils import (
+    create_import_batch_process_task,
+    update_import_batch_process_task,
+)
+
+# Tables reloaded by a bulk load, their indexes are dropped while they load
+BULK_LOAD_TABLES = (
+    "s1_review",
+    "s1_product",
+    "s1_product_category",
+    "s1_related_product",
+)
+
+
+def get_table_indexes(cursor, tables):
+    """
+    Returns the names and CREATE INDEX statements of the indexes of tables,
+    except those of primary keys and other constraints.
+    """
+    cursor.execute(
+        """
+        SELECT i.indexname, i.indexdef
+        FROM pg_indexes i
+        WHERE i.schemaname = current_schema()
+            AND i.tablename = ANY(%s)
+            AND NOT EXISTS (
+                SELECT 1
+                FROM pg_constraint c
+                WHERE c.conindid = format('%%I.%%I', i.schemaname, i.indexname)::regclass
+            )
+        ORDER BY i.indexname
+        """,
+        [list(tables)],
+    )
+    return cursor.fetchall()
+
+
+def drop_indexes(conn_meta, ibp_id, tables=BULK_LOAD_TABLES):
+    """
+    Drops the indexes of the bulk loaded tables before they are loaded, in
+    a task of its own, so the time of the phase is recorded.
+
+    :return: The (name, CREATE INDEX statement) of every dropped index, to
+             rebuild them with rebuild_indexes.
+    """
+    ibpt_id = create_import_batch_process_task(
+        conn_meta, ibp_id, "s1_drop_indexes", "Running"
+    )
+
+    conn = connect_to_db()
+    try:
+        with conn.cursor() as cursor:
+            indexes = get_table_indexes(cursor, tables)
+            for name, _ in indexes:
+                cursor.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(name)))
+        conn.commit()
+
+    except Exception:
+        conn.rollback()
+        update_import_batch_process_task(
+            conn_meta, ibpt_id, "Failed", 0, 0, 0, None, None, None
+        )
+        raise
+
+    finally:
+        conn.close()
+
+    update_import_batch_process_task(
+        conn_meta, ibpt_id, "Completed", len(indexes), 0, len(indexes), None, None, None
+    )
+    print(f"Dropped {len(indexes)} indexes before the bulk load.")
+    return indexes
+
+
+def rebuild_indexes(conn_meta, ibp_id, indexes, workers):
+    """
+    Creates the indexes dropped by drop_indexes again after the bulk load,
+    `workers` at a time, every index in its own session and task. A
+    s1_rebuild_indexes task records the time of the whole phase.
+
+    :return: The names of the indexes that failed to build.
+    """
+    ibpt_id = create_import_batch_process_task(
+        conn_meta, ibp_id, "s1_rebuild_indexes", "Running"
+    )
+    meta_lock = threading.Lock()
+
+    def build(index):
+        name, statement = index
+        with meta_lock:
+            index_ibpt_id = create_import_batch_process_task(
+                conn_meta, ibp_id, f"s1_index {name}", "Running"
+            )
+
+        start = time.perf_counter()
+        status = "Completed"
+        conn = connect_to_db()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(statement)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error building index {name}: {e}")
+            status = "Failed"
+        finally:
+            conn.close()
+
+        with meta_lock:
+            update_import_batch_process_task(
+                conn_meta, index_ibpt_id, status, None, None, None, None, None, None
+            )
+        print(f"Index {name}: {status.lower()} in {time.perf_counter() - start:.1f}s")
+        return name, status
+
+    failed = []
+    if indexes:
+        with ThreadPoolExecutor(max(1, min(workers, len(indexes)))) as executor:
+            for name, status in executor.map(build, indexes):
+                if status != "Completed":
+                    failed.append(name)
+
+    update_import_batch_process_task(
+        conn_meta,
+        ibpt_id,
+        "Failed" if failed else "Completed",
+        len(indexes),
+        len(failed),
+        len(indexes) - len(failed),
+        None,
+        None,
+        None,
+    )
+    return failed
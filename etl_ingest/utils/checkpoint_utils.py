@@ -0,0 +1,52 @@
+from utils.source_utils import split_source
+from utils.metadata_utils import create_ingest_checkpoint, get_resume_checkpoints
+
+
+def plan_ingest_ranges(
+    conn_meta, csvFilePath, workers, ibpt_ids, descriptions, resume=False
+):
+    """
+    Splits a CSV file into the byte ranges to ingest and creates the
+    checkpoints of the new tasks for every range.
+
+    In resume mode the ranges of the latest unfinished run of the file are
+    continued, every task at the offset it committed last. Ranges are read
+    from the lowest offset of their tasks.
+
+    :param ibpt_ids: Task IDs of the new run, one per table.
+    :param descriptions: Task descriptions matching ibpt_ids.
+    :return: Header fieldnames and a list of (start, end, checkpoints) with
+             an (offset, chunk_count) checkpoint per task.
+    """
+    previous = []
+    if resume:
+        previous = [
+            get_resume_checkpoints(conn_meta, description, csvFilePath)
+            for description in descriptions
+        ]
+
+    if previous and previous[0]:
+        fieldnames, _ = split_source(csvFilePath, 1)
+        ranges = []
+        for range_start, (end, _, _) in previous[0].items():
+            checkpoints = [
+                checkpoint.get(range_start, (end, range_start, 0))[1:]
+                for checkpoint in previous
+            ]
+            start = min(offset for offset, _ in checkpoints)
+            ranges.append((start, end, checkpoints))
+        print(f"Resuming {csvFilePath} from its last committed offsets.")
+    else:
+        fieldnames, byte_ranges = split_source(csvFilePath, workers)
+        ranges = [
+            (start, end, [(start, 0)] * len(ibpt_ids)) for start, end in byte_ranges
+        ]
+
+    # Finished ranges are recorded too, so a later resume skips them again
+    for start, end, checkpoints in ranges:
+        for ibpt_id, (offset, chunk_count) in zip(ibpt_ids, checkpoints):
+            create_ingest_checkpoint(
+                conn_meta, ibpt_id, csvFilePath, start, end, offset, chunk_count
+            )
+
+    return fieldnames, ranges
@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+except ImportError:  # Only the columnar transforms need NumPy
+    np = None
+
+# Offsets from UTC change on a multiple of this many seconds
+UTC_OFFSET_STEP = 900
+
+# Range of the seconds datetime.fromtimestamp accepts
+MIN_TIMESTAMP = -62135596800
+MAX_TIMESTAMP = 253402300799
+
+# Scaled values this close to .5 are rounded again the way round() does
+TIE_TOLERANCE = 1e-6
+
+
+def require_numpy():
+    """Raises when NumPy is not installed, before a columnar transform runs."""
+    if np is None:
+        raise ImportError("Columnar transforms need numpy, pip install numpy")
+
+
+def parse_column(values, dtype, parse):
+    """
+    Converts a column of source values into an array, with a mask of the
+    values that could be converted. The whole column is converted at once,
+    value by value with `parse` only when one of them fails.
+    """
+    try:
+        return np.array(values, dtype=dtype), np.ones(len(values), dtype=bool)
+    except (ValueError, TypeError, OverflowError):
+        pass
+
+    array = np.zeros(len(values), dtype=dtype)
+    valid = np.ones(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            array[i] = parse(value)
+        except (ValueError, TypeError, OverflowError):
+            valid[i] = False
+    return array, valid
+
+
+def round_column(values, decimals):
+    """
+    Rounds like round(value, decimals). Scaling by 10 ** decimals moves some
+    values onto or off a tie, those are rounded again with round().
+    """
+    scale = 10.0**decimals
+    scaled = values * scale
+    rounded = np.round(scaled) / scale
+
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) < TIE_TOLERANCE
+    if ties.any():
+        rounded[ties] = [round(value, decimals) for value in values[ties].tolist()]
+    return rounded
+
+
+def local_datetimes(seconds):
+    """
+    Converts Unix timestamps to naive local datetime64 values, the way
+    datetime.fromtimestamp does. The UTC offset is looked up once per
+    distinct UTC_OFFSET_STEP of the timestamps.
+    """
+    steps, inverse = np.unique(seconds // UTC_OFFSET_STEP, return_inverse=True)
+    offsets = np.array(
+        [
+            (
+                datetime.fromtimestamp(step * UTC_OFFSET_STEP)
+                - datetime.fromtimestamp(step * UTC_OFFSET_STEP, timezone.utc).replace(
+                    tzinfo=None
+                )
+            ).total_seconds()
+            for step in steps.tolist()
+        ],
+        dtype=np.int64,
+    )
+    return (seconds + offsets[inverse.ravel()]).astype("datetime64[s]")
+
+
+def date_keys(datetimes):
+    """Returns YYYYMMDD integer keys of datetime64 values."""
+    days = datetimes.astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+    years = months.astype("datetime64[Y]").astype(np.int64) + 1970
+    month_numbers = months.astype(np.int64) % 12 + 1
+    day_numbers = (days - months).astype(np.int64) + 1
+    return (years * 10000 + month_numbers * 100 + day_numbers).astype(np.int32)
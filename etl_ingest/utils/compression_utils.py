@@ -0,0 +1,171 @@
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import threading
+import time
+
+# Decompressed data is handed to the parser in blocks of this size
+DECOMPRESS_BLOCK_SIZE = 1 << 20
+# Maximum number of decompressed blocks waiting for the parser
+DECOMPRESS_QUEUE_SIZE = 8
+
+# Decompressing readers by file suffix, each wraps an open binary file
+DECOMPRESSORS = {
+    ".gz": lambda f: gzip.GzipFile(fileobj=f, mode="rb"),
+    ".bz2": bz2.BZ2File,
+    ".xz": lzma.LZMAFile,
+}
+
+
+def compression_suffix(file_path):
+    """Returns the compression suffix of a file, or an empty string."""
+    for suffix in DECOMPRESSORS:
+        if file_path.lower().endswith(suffix):
+            return suffix
+    return ""
+
+
+def strip_compression_suffix(file_path):
+    """Returns the file path without its compression suffix."""
+    suffix = compression_suffix(file_path)
+    return file_path[: -len(suffix)] if suffix else file_path
+
+
+def open_binary(file_path):
+    """
+    Opens a file for reading bytes. A compressed file is decompressed on a
+    background thread, see DecompressingStream, and cannot seek.
+    """
+    if compression_suffix(file_path):
+        return io.BufferedReader(DecompressingStream(file_path), DECOMPRESS_BLOCK_SIZE)
+    return open(file_path, "rb")
+
+
+def skip_bytes(file, count):
+    """Reads past the first `count` bytes of a file that cannot seek."""
+    skipped = 0
+    while skipped < count:
+        block = file.read(min(DECOMPRESS_BLOCK_SIZE, count - skipped))
+        if not block:
+            break
+        skipped += len(block)
+    return skipped
+
+
+def decompression_stats(file):
+    """Returns the stats of a file opened by open_binary, None if not compressed."""
+    stream = getattr(file, "raw", None)
+    if isinstance(stream, DecompressingStream):
+        return stream.stats()
+    return None
+
+
+def format_decompression_stats(stats):
+    """Formats the stats of a DecompressingStream as a single line."""
+    elapsed = max(stats["elapsed"], 1e-9)
+    return (
+        f"{stats['compressed_bytes'] / 1e6:.1f} MB compressed "
+        f"({stats['compressed_bytes'] / 1e6 / elapsed:.1f} MB/s), "
+        f"{stats['uncompressed_bytes'] / 1e6:.1f} MB uncompressed "
+        f"({stats['uncompressed_bytes'] / 1e6 / elapsed:.1f} MB/s) in {elapsed:.1f}s, "
+        f"decompress busy {stats['busy']:.1f}s, parser waited {stats['read_wait']:.1f}s"
+    )
+
+
+class DecompressingStream(io.RawIOBase):
+    """
+    Decompresses a .gz, .bz2 or .xz file on a background thread.
+
+    The thread fills a bounded queue of decompressed blocks that reads are
+    served from, so the parser works on one block while the next ones are
+    decompressed. zlib, bz2 and lzma release the GIL while decompressing,
+    so both run on separate cores.
+    """
+
+    def __init__(self, file_path, queue_size=DECOMPRESS_QUEUE_SIZE):
+        super().__init__()
+        self.file = open(file_path, "rb")
+        self.decompressor = DECOMPRESSORS[compression_suffix(file_path)](self.file)
+
+        self.compressed_bytes = 0
+        self.uncompressed_bytes = 0
+        self.busy = 0.0
+        self.read_wait = 0.0
+        self.started = time.perf_counter()
+        self.finished = None
+        self.error = None
+
+        self.block = memoryview(b"")
+        self.at_end = False
+        self.blocks = queue.Queue(queue_size)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _put(self, block):
+        while not self.stop.is_set():
+            try:
+                self.blocks.put(block, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self):
+        try:
+            while not self.stop.is_set():
+                start = time.perf_counter()
+                block = self.decompressor.read(DECOMPRESS_BLOCK_SIZE)
+                self.busy += time.perf_counter() - start
+                self.compressed_bytes = self.file.tell()
+                if not block:
+                    break
+                self.uncompressed_bytes += len(block)
+                self._put(block)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = time.perf_counter()
+            # An empty block marks the end of the stream
+            self._put(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.block:
+            if self.at_end:
+                return 0
+            start = time.perf_counter()
+            block = self.blocks.get()
+            self.read_wait += time.perf_counter() - start
+            if not block:
+                self.at_end = True
+                if self.error:
+                    raise self.error
+                return 0
+            self.block = memoryview(block)
+
+        size = min(len(buffer), len(self.block))
+        buffer[:size] = self.block[:size]
+        self.block = self.block[size:]
+        return size
+
+    def stats(self):
+        """Bytes read and decompressed so far, with the elapsed and wait times."""
+        return {
+            "compressed_bytes": self.compressed_bytes,
+            "uncompressed_bytes": self.uncompressed_bytes,
+            "elapsed": (self.finished or time.perf_counter()) - self.started,
+            "busy": self.busy,
+            "read_wait": self.read_wait,
+        }
+
+    def close(self):
+        if not self.closed:
+            self.stop.set()
+            self.thread.join()
+            self.decompressor.close()
+            self.file.close()
+        super().close()
@@ -1,49 +1,187 @@
 import re
 import ast
+from functools import lru_cache
 
+# Values up to this length are cached, longer ones (related product lists) rarely repeat
+CONVERT_CACHE_MAX_LENGTH = 1024
+CONVERT_CACHE_SIZE = 65536
 
-def convert_value(value):
-    """Safely convert string representations of Python structures."""
+_STRING = re.compile(r"""'(?:[^'\\\r\n]|\\.)*'|"(?:[^"\\\r\n]|\\.)*\"""")
+_NUMBER = re.compile(r"-?(?:0|[1-9][0-9]*)(\.[0-9]+)?(?![0-9.eEjJxXoObB_])")
+_SPACE = re.compile(r"[ \t\n]*")
+_TRAILING_SPACE = re.compile(r"[ \t]*\Z")
+_PLAIN_STRING = re.compile(r"'([^'\\\r\n]*)'")
+_PLAIN_STRING_LIST = re.compile(
+    r"\[[ \t\n]*'[^'\\\r\n]*'(?:[ \t\n]*,[ \t\n]*'[^'\\\r\n]*')*[ \t\n]*\]"
+)
+_LITERAL_START = "[{'\"-0123456789"
+
+
+class _LiteralError(Exception):
+    """Raised when a value is outside the grammar of the literal parser."""
+
+
+def _parse_literal(text, pos):
+    """Parses the literal that starts at pos, returns the value and the position after it."""
+    char = text[pos : pos + 1]
+
+    if char == "[":
+        # Flat lists of plain strings (categories, ASINs) are split in one go
+        match = _PLAIN_STRING_LIST.match(text, pos)
+        if match:
+            return _PLAIN_STRING.findall(match.group()), match.end()
+
+        items = []
+        pos = _SPACE.match(text, pos + 1).end()
+        if text.startswith("]", pos):
+            return items, pos + 1
+        while True:
+            item, pos = _parse_literal(text, pos)
+            items.append(item)
+            pos = _SPACE.match(text, pos).end()
+            char = text[pos : pos + 1]
+            if char == "]":
+                return items, pos + 1
+            if char != ",":
+                raise _LiteralError
+            pos = _SPACE.match(text, pos + 1).end()
+
+    if char == "{":
+        items = {}
+        pos = _SPACE.match(text, pos + 1).end()
+        if text.startswith("}", pos):
+            return items, pos + 1
+        while True:
+            key, pos = _parse_literal(text, pos)
+            pos = _SPACE.match(text, pos).end()
+            if not text.startswith(":", pos):
+                raise _LiteralError
+            pos = _SPACE.match(text, pos + 1).end()
+            items[key], pos = _parse_literal(text, pos)
+            pos = _SPACE.match(text, pos).end()
+            char = text[pos : pos + 1]
+            if char == "}":
+                return items, pos + 1
+            if char != ",":
+                raise _LiteralError
+            pos = _SPACE.match(text, pos + 1).end()
+
+    if char == "'" or char == '"':
+        match = _STRING.match(text, pos)
+        if not match:
+            raise _LiteralError
+        token = match.group()
+        # Escape sequences are rare, leave them to the Python tokenizer
+        value = ast.literal_eval(token) if "\\" in token else token[1:-1]
+        return value, match.end()
+
+    match = _NUMBER.match(text, pos)
+    if match:
+        value = float(match.group()) if match.group(1) else int(match.group())
+        return value, match.end()
+
+    raise _LiteralError
+
+
+def _literal_eval_value(value):
+    """Converts a value with ast.literal_eval, returns it as-is if conversion fails."""
     try:
         return ast.literal_eval(value)  # Converts dicts, lists, tuples safely
     except (ValueError, SyntaxError):
         return value  # Return as-is if conversion fails
 
 
+def _convert(value):
+    """Parses the literals of the source files, falls back to ast.literal_eval otherwise."""
+    if value[:1] in _LITERAL_START:
+        try:
+            result, pos = _parse_literal(value, 0)
+            if _TRAILING_SPACE.match(value, pos):
+                return result
+        except (_LiteralError, TypeError):
+            pass
+    return _literal_eval_value(value)
+
+
+_convert_cached = lru_cache(maxsize=CONVERT_CACHE_SIZE)(_convert)
+
+
+def convert_value(value):
+    """
+    Safely convert string representations of Python structures.
+
+    The int pairs, dicts and nested string lists found in the source files
+    are read by a small parser, anything else goes through ast.literal_eval.
+    Short values are cached, so the returned lists and dicts are shared
+    between calls and must not be modified. Values that are not strings,
+    like the lists and dicts of JSON-lines sources, are returned as-is.
+    """
+    if not isinstance(value, str):
+        return value
+    if len(value) <= CONVERT_CACHE_MAX_LENGTH:
+        return _convert_cached(value)
+    return _convert(value)
+
+
+# Replacements applied by sanitize_string, in order
+SANITIZE_REPLACEMENTS = [
+    ("=\\ ", "__EQ_BACKSLASH__"),
+    ("\\", "__BACKSLASH__"),
+    ("'", "__SINGLE_QUOTE__"),
+    ('"', "__DOUBLE_QUOTE__"),
+    ("\n", "__NEWLINE__"),
+    ("\r", "__CARRIAGE_RETURN__"),
+    ("\t", "__TAB__"),
+]
+
+# Newlines, carriage returns and tabs only occur in non-printable strings
+_PRINTABLE_REPLACEMENTS = SANITIZE_REPLACEMENTS[:4]
+
+# Replacements applied by restore_string, in order
+RESTORE_REPLACEMENTS = [
+    ("__EQ_BACKSLASH__", "=\\ "),
+    ("__BACKSLASH__", "\\"),
+    ("__SINGLE_QUOTE__", "'"),
+    ("__DOUBLE_QUOTE__", '"'),
+    ("__NEWLINE__", "\n"),
+    ("__CARRIAGE_RETURN__", "\r"),
+    ("__TAB__", "\t"),
+]
+
+_WHITESPACE_RUN = re.compile(r"\s{2,}")
+
+
 def sanitize_string(value):
-    """Function that replaces problimatic characters in strings."""
-    replacements = {
-        "=\ ": "__EQ_BACKSLASH__",
-        "\\": "__BACKSLASH__",
-        "'": "__SINGLE_QUOTE__",
-        '"': "__DOUBLE_QUOTE__",
-        "\n": "__NEWLINE__",
-        "\r": "__CARRIAGE_RETURN__",
-        "\t": "__TAB__",
-    }
+    """
+    Function that replaces problimatic characters in strings.
+
+    Every replacement is only applied when its character occurs, so clean
+    strings are scanned at C speed and returned without copies. Any
+    whitespace other than a plain space makes a string non-printable, so
+    the whitespace regex only runs when there is something to collapse.
+    """
+    printable = value.isprintable()
+    replacements = _PRINTABLE_REPLACEMENTS if printable else SANITIZE_REPLACEMENTS
 
     # Replace values
-    for char, replacement in replacements.items():
-        value = value.replace(char, replacement)
+    for char, replacement in replacements:
+        if char in value:
+            value = value.replace(char, replacement)
 
     # Remove spaces that could be interpreted as tabs
-    value = re.sub(r"\s{2,}", " ", value)
+    if not printable or "  " in value:
+        value = _WHITESPACE_RUN.sub(" ", value)
 
     return value
 
 
 def restore_string(sanitized_value):
+    """Reverses the replacements of sanitize_string, except for collapsed whitespace."""
+    if "__" not in sanitized_value:
+        return sanitized_value
 
-    replacements = {
-        "__EQ_BACKSLASH__": "=\ ",
-        "__BACKSLASH__": "\\",
-        "__SINGLE_QUOTE__": "'",
-        "__DOUBLE_QUOTE__": '"',
-        "__NEWLINE__": "\n",
-        "__CARRIAGE_RETURN__": "\r",
-    }
-
-    for replacement, char in replacements.items():
-        sanitized_value = sanitized_value.replace(replacement, char)
+    for replacement, char in RESTORE_REPLACEMENTS:
+        if replacement in sanitized_value:
+            sanitized_value = sanitized_value.replace(replacement, char)
 
     return sanitized_value
@@ -0,0 +1,200 @@
+import glob
+import hashlib
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+
+from utils.metadata_utils import get_file_fingerprint, save_file_fingerprint
+
+# Row hashes of the ingested files are kept here between runs
+STATE_DIR = "./state"
+
+# Block size used when hashing the content of a file
+HASH_BLOCK_SIZE = 1 << 20
+
+ROW_HASH_SIZE = 8
+FIELD_SEPARATOR = "\x1f"
+
+
+def file_fingerprint(file_path, content_hash=True):
+    """Returns the size, modification time and content hash of a file."""
+    stat = os.stat(file_path)
+    digest = None
+
+    if content_hash:
+        blake = hashlib.blake2b()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                blake.update(block)
+        digest = blake.hexdigest()
+
+    return stat.st_size, stat.st_mtime_ns, digest
+
+
+def check_file_unchanged(conn_meta, file_path):
+    """
+    Compares a file with the fingerprint of its last completed ingest.
+
+    A matching size and modification time is trusted without reading the
+    file. Otherwise the content is hashed, so a file that was only touched
+    still counts as unchanged.
+
+    :return: Whether the file is unchanged and its current fingerprint.
+    """
+    stored = get_file_fingerprint(conn_meta, file_path)
+    size, mtime, _ = file_fingerprint(file_path, content_hash=False)
+
+    if stored and stored[0] == size and stored[1] == mtime:
+        return True, stored
+
+    fingerprint = file_fingerprint(file_path)
+    unchanged = stored is not None and stored[0] == size and stored[2] == fingerprint[2]
+    return unchanged, fingerprint
+
+
+def complete_delta_ingest(conn_meta, file_path, fingerprint):
+    """Merges the row hashes of the run into the baseline and saves the fingerprint."""
+    merge_row_hashes(file_path)
+    save_file_fingerprint(conn_meta, file_path, *fingerprint)
+
+
+def row_hash(row):
+    """64 bit hash of the field values of a source row, stable between runs."""
+    values = FIELD_SEPARATOR.join(map(str, row)).encode("utf-8")
+    return int.from_bytes(
+        hashlib.blake2b(values, digest_size=ROW_HASH_SIZE).digest(), "little"
+    )
+
+
+def _baseline_path(file_path):
+    return os.path.join(STATE_DIR, os.path.basename(file_path) + ".rows")
+
+
+def _part_paths(file_path):
+    return glob.glob(_baseline_path(file_path) + ".*.part")
+
+
+class RowHashFilter:
+    """
+    Filters the rows of a CSV file down to the ones not ingested before.
+
+    The sorted row hashes of the previous completed runs are mapped from
+    disk and searched in place, so every worker shares the same pages.
+    The hashes of the new rows are held per chunk until every table of
+    `tables` committed the chunk, then appended to a part file of the
+    worker, which is merged into the baseline when the whole file
+    completes. Rows of a chunk that was rolled back, or that failed, are
+    not recorded, so the next run reads them again.
+    """
+
+    def __init__(self, file_path, part_name, tables=(None,)):
+        os.makedirs(STATE_DIR, exist_ok=True)
+
+        self.mapped = None
+        self.hashes = ()
+        baseline = _baseline_path(file_path)
+        if os.path.exists(baseline) and os.path.getsize(baseline):
+            with open(baseline, "rb") as f:
+                self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.hashes = memoryview(self.mapped).cast("Q")
+
+        self.part = open(f"{baseline}.{part_name}.part", "ab")
+        self.unchanged = 0
+        self.tables = tuple(tables)
+        # Hashes, tables still to commit and whether all committed, per chunk
+        self.pending = {}
+        # The writer threads of the tables commit chunks concurrently
+        self.lock = threading.Lock()
+
+    def is_new(self, value):
+        """Whether a row hash is not in the baseline."""
+        index = bisect_left(self.hashes, value)
+        return index == len(self.hashes) or self.hashes[index] != value
+
+    def new_rows(self, rows, key):
+        """
+        Returns the rows that are new or modified. Their hashes are held
+        under `key`, the file offset the chunk ends at, until it commits.
+        """
+        new_rows = []
+        new_hashes = array("Q")
+        for row in rows:
+            value = row_hash(row)
+            if self.is_new(value):
+                new_rows.append(row)
+                new_hashes.append(value)
+
+        self.unchanged += len(rows) - len(new_rows)
+        with self.lock:
+            self.pending[key] = [new_hashes, set(self.tables), True]
+        return new_rows
+
+    def exclude(self, key, rows):
+        """Leaves the hashes of rows, e.g. failed rows, out of the chunk `key`."""
+        excluded = set(map(row_hash, rows))
+        with self.lock:
+            entry = self.pending.get(key)
+            if entry is not None and excluded:
+                entry[0] = array("Q", (v for v in entry[0] if v not in excluded))
+
+    def commit(self, key, table=None, committed=True):
+        """
+        Marks the chunks up to `key` as written to `table`, committed or
+        rolled back. The hashes of a chunk are recorded once all tables
+        wrote it, unless one of them rolled it back.
+        """
+        with self.lock:
+            for chunk_key in sorted(k for k in self.pending if k <= key):
+                entry = self.pending[chunk_key]
+                if table not in entry[1]:
+                    continue
+                entry[1].discard(table)
+                entry[2] = entry[2] and committed
+                if not entry[1]:
+                    del self.pending[chunk_key]
+                    if entry[2]:
+                        entry[0].tofile(self.part)
+            self.part.flush()
+
+    def close(self):
+        self.part.close()
+        if self.mapped is not None:
+            self.hashes.release()
+            self.mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def merge_row_hashes(file_path):
+    """
+    Merges the part files of a file into its sorted baseline of row hashes.
+    The hashes are sorted per bucket of their top byte, so only one bucket
+    is held as Python ints at a time.
+    """
+    baseline = _baseline_path(file_path)
+    parts = _part_paths(file_path)
+
+    buckets = [array("Q") for _ in range(256)]
+    for path in parts + [baseline]:
+        if not os.path.exists(path):
+            continue
+        hashes = array("Q")
+        with open(path, "rb") as f:
+            hashes.frombytes(f.read())
+        for value in hashes:
+            buckets[value >> 56].append(value)
+
+    temp_path = baseline + ".tmp"
+    with open(temp_path, "wb") as f:
+        for bucket in buckets:
+            array("Q", sorted(set(bucket))).tofile(f)
+    os.replace(temp_path, baseline)
+
+    for path in parts:
+        os.remove(path)
@@ -0,0 +1,159 @@
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+
+class ValueDictionary:
+    """
+    Dictionary encoding of the values of one attribute.
+
+    Every distinct value gets the next integer code, `values` maps the codes
+    back to their values and `counts` holds how often every code was
+    encoded. Values are interned, an encoded copy of a value is replaced by
+    the first one, so repeated values share a single string. Only the
+    values and counts are pickled, a dictionary sent between processes
+    carries every value once.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+        self.counts = []
+
+    def encode(self, value, count=1):
+        """Returns the code of a value, adding it when it is new."""
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            self.counts.append(count)
+        else:
+            self.counts[code] += count
+        return code
+
+    def intern(self, value):
+        """Encodes a value and returns its first copy."""
+        return self.values[self.encode(value)]
+
+    def merge(self, other):
+        """
+        Adds the values and counts of another dictionary, e.g. of a chunk.
+
+        :return: The codes of its values in this dictionary, by its codes.
+        """
+        return [
+            self.encode(value, count)
+            for value, count in zip(other.values, other.counts)
+        ]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getstate__(self):
+        return self.values, self.counts
+
+    def __setstate__(self, state):
+        self.values, self.counts = state
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+
+class RelationPairs:
+    """
+    Canonical set of the related product pairs written by a run, so every
+    relation between two products is written once, in the direction it
+    was seen first. ASINs are mapped to compact integer ids in a
+    ValueDictionary, whose values list maps the ids back. A pair and its
+    mirror share one key, their (min id, max id, relation code) packed
+    into a single integer.
+    """
+
+    # Bits of a packed key per product id and per relation code
+    ID_BITS = 32
+    RELATION_BITS = 16
+
+    def __init__(self):
+        self.ids = ValueDictionary()
+        self.relations = ValueDictionary()
+        self.keys = set()
+        self.skipped = 0
+
+    def new_rows(self, rows):
+        """
+        Returns the rows of (product, related product, relation) whose pair
+        was not seen before, and adds their pairs.
+        """
+        ids = self.ids.codes
+        encode_id = self.ids.encode
+        relations = self.relations.codes
+        encode_relation = self.relations.encode
+        keys = self.keys
+        id_bits = self.ID_BITS
+        relation_bits = self.RELATION_BITS
+
+        new_rows = []
+        for row in rows:
+            product, related_product, relation = row
+            first = ids.get(product)
+            if first is None:
+                first = encode_id(product)
+            second = ids.get(related_product)
+            if second is None:
+                second = encode_id(related_product)
+            code = relations.get(relation)
+            if code is None:
+                code = encode_relation(relation)
+
+            if first > second:
+                first, second = second, first
+            key = (((first << id_bits) | second) << relation_bits) | code
+            if key in keys:
+                continue
+            keys.add(key)
+            new_rows.append(row)
+
+        self.skipped += len(rows) - len(new_rows)
+        return new_rows
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def new_dictionaries(attributes):
+    """Returns an empty ValueDictionary for every attribute."""
+    return {attribute: ValueDictionary() for attribute in attributes}
+
+
+def merge_dictionaries(total, dictionaries):
+    """Adds dictionaries by attribute to the running dictionaries of a run."""
+    for attribute, dictionary in dictionaries.items():
+        total.setdefault(attribute, ValueDictionary()).merge(dictionary)
+    return total
+
+
+def format_dictionary_stats(dictionaries):
+    """Formats the distinct and encoded values of every dictionary."""
+    return ", ".join(
+        f"{attribute} {len(dictionary)} distinct of {sum(dictionary.counts)}"
+        for attribute, dictionary in dictionaries.items()
+    )
+
+
+def write_dictionary(cursor, table_name, value_column, count_column, dictionary):
+    """
+    Writes the values of a dictionary with their counts to a table keyed on
+    the value. Values written by an earlier run have the counts added.
+    """
+    if not dictionary:
+        return
+
+    query = sql.SQL(
+        """
+        INSERT INTO {table} ({value}, {count}) VALUES %s
+        ON CONFLICT ({value}) DO UPDATE
+        SET {count} = {table}.{count} + EXCLUDED.{count}
+        """
+    ).format(
+        table=sql.Identifier(table_name),
+        value=sql.Identifier(value_column),
+        count=sql.Identifier(count_column),
+    )
+    execute_values(cursor, query, list(zip(dictionary.values, dictionary.counts)))
@@ -0,0 +1,150 @@
+import csv
+import mmap
+import os
+
+from utils.compression_utils import open_binary, skip_bytes
+
+QUOTE = b'"'
+NEWLINE = b"\n"
+
+# Block size used when counting quotes over large spans of the file
+SCAN_BLOCK_SIZE = 1 << 20
+# Bytes at the start of a range the average record size is taken from
+SAMPLE_SIZE = 1 << 16
+
+
+def _count_quotes(mm, start, end):
+    """Counts the quote characters between two offsets of a mapped file."""
+    count = 0
+    for pos in range(start, end, SCAN_BLOCK_SIZE):
+        count += mm[pos : min(pos + SCAN_BLOCK_SIZE, end)].count(QUOTE)
+    return count
+
+
+def _next_record_end(mm, pos, in_quotes):
+    """
+    Returns the offset just after the first newline at or after pos that
+    ends a record. A newline inside a quoted field does not end a record,
+    so the quote parity is carried along while searching.
+    """
+    size = len(mm)
+    while True:
+        newline = mm.find(NEWLINE, pos)
+        if newline == -1:
+            return size
+        in_quotes ^= bool(mm[pos:newline].count(QUOTE) & 1)
+        pos = newline + 1
+        if not in_quotes:
+            return pos
+
+
+def record_chunk_end(mm, start, end, size):
+    """
+    Returns the end of a chunk of about `size` bytes of whole records,
+    starting at the record boundary `start` and ending at or before `end`.
+    """
+    target = start + size
+    if target >= end:
+        return end
+    in_quotes = bool(_count_quotes(mm, start, target) & 1)
+    return min(_next_record_end(mm, target, in_quotes), end)
+
+
+def sample_record_size(mm, start, end):
+    """Estimates the average record size from the lines at the start of a range."""
+    sample = mm[start : min(start + SAMPLE_SIZE, end)]
+    return max(len(sample) // max(sample.count(NEWLINE), 1), 1)
+
+
+def split_file_ranges(file_path, parts):
+    """
+    Splits a CSV file into at most `parts` byte ranges that start and end on
+    record boundaries, skipping the header line.
+
+    :param file_path: Path of the CSV file.
+    :param parts: Number of ranges wanted.
+    :return: Header fieldnames and a list of (start, end) byte offsets.
+    """
+    if os.path.getsize(file_path) == 0:
+        return [], []
+
+    with open(file_path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        size = len(mm)
+        header_end = _next_record_end(mm, 0, False)
+
+        boundaries = [header_end]
+        pos = header_end
+        in_quotes = False
+
+        for part in range(1, parts):
+            target = header_end + (size - header_end) * part // parts
+            if target <= pos:
+                continue
+
+            # Quote parity at the target decides whether its newline ends a record
+            in_quotes ^= bool(_count_quotes(mm, pos, target) & 1)
+            pos = _next_record_end(mm, target, in_quotes)
+            in_quotes = False
+
+            if pos >= size:
+                break
+            boundaries.append(pos)
+
+        boundaries.append(size)
+
+    with RecordLineReader(file_path, 0, header_end) as lines:
+        fieldnames = next(csv.reader(lines), [])
+
+    ranges = [
+        (start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start
+    ]
+    return fieldnames, ranges
+
+
+class RecordLineReader:
+    """
+    Iterates over the decoded lines of a byte range of a file while keeping
+    track of the byte offset consumed so far. Line endings are translated
+    the same way as a file opened in text mode.
+
+    Offsets of a compressed file count decompressed bytes, a range starting
+    past 0 is read up to its start first.
+    """
+
+    def __init__(self, file_path, start, end, encoding="utf-8"):
+        self.file = open_binary(file_path)
+        if self.file.seekable():
+            self.file.seek(start)
+        else:
+            skip_bytes(self.file, start)
+        self.offset = start
+        self.end = end
+        self.encoding = encoding
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.offset >= self.end:
+            raise StopIteration
+
+        line = self.file.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+
+        line = line.decode(self.encoding)
+        if "\r" in line:
+            line = line.replace("\r\n", "\n").replace("\r", "\n")
+        return line
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
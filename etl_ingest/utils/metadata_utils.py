@@ -114,6 +114,116 @@ def update_import_batch_process_task(
         conn.commit()
 
 
+def update_import_batch_process_task_rate(conn, ibpt_id, rows_per_second):
+    """Records the rows written per second by an import batch process task."""
+    query = """
+        UPDATE import_batch_process_task
+        SET ibpt_rows_per_second = %s
+        WHERE ibpt_id = %s;
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(query, (rows_per_second, ibpt_id))
+        conn.commit()
+
+
+def create_ingest_checkpoint(
+    conn, ibpt_id, file_path, range_start, range_end, offset, chunk_count
+):
+    """Creates the checkpoint of one byte range of an ingest task."""
+    query = """
+        INSERT INTO import_batch_process_task_checkpoint (
+            ibpt_id, ibptc_file_path, ibptc_range_start, ibptc_range_end,
+            ibptc_offset, ibptc_chunk_count, ibptc_updated
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, NOW());
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(
+            query,
+            (ibpt_id, file_path, range_start, range_end, offset, chunk_count),
+        )
+        conn.commit()
+
+
+def update_ingest_checkpoint(conn, ibpt_id, range_start, offset, chunk_count):
+    """Records the file offset up to which a byte range has been committed."""
+    query = """
+        UPDATE import_batch_process_task_checkpoint
+        SET ibptc_offset = %s, ibptc_chunk_count = %s, ibptc_updated = NOW()
+        WHERE ibpt_id = %s AND ibptc_range_start = %s;
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(query, (offset, chunk_count, ibpt_id, range_start))
+        conn.commit()
+
+
+def get_resume_checkpoints(conn, description, file_path):
+    """
+    Returns the checkpoints of the latest ingest task of a file, if that task
+    did not complete, as {range_start: (range_end, offset, chunk_count)}.
+    """
+    task_query = """
+        SELECT t.ibpt_id, t.ib_status
+        FROM import_batch_process_task t
+        WHERE t.ib_description = %s
+          AND EXISTS (
+            SELECT 1 FROM import_batch_process_task_checkpoint c
+            WHERE c.ibpt_id = t.ibpt_id AND c.ibptc_file_path = %s
+          )
+        ORDER BY t.ib_start DESC
+        LIMIT 1;
+    """
+
+    checkpoint_query = """
+        SELECT ibptc_range_start, ibptc_range_end, ibptc_offset, ibptc_chunk_count
+        FROM import_batch_process_task_checkpoint
+        WHERE ibpt_id = %s
+        ORDER BY ibptc_range_start;
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(task_query, (description, file_path))
+        task = cur.fetchone()
+        if task is None or task[1] == "Completed":
+            return {}
+
+        cur.execute(checkpoint_query, (task[0],))
+        return {row[0]: tuple(row[1:]) for row in cur.fetchall()}
+
+
+def get_file_fingerprint(conn, file_path):
+    """Returns the size, modification time and content hash stored for a file."""
+    query = """
+        SELECT iff_size, iff_mtime_ns, iff_content_hash
+        FROM import_file_fingerprint
+        WHERE iff_file_path = %s;
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(query, (file_path,))
+        return cur.fetchone()
+
+
+def save_file_fingerprint(conn, file_path, size, mtime_ns, content_hash):
+    """Stores the fingerprint of a file after it has been ingested completely."""
+    query = """
+        INSERT INTO import_file_fingerprint (
+            iff_file_path, iff_size, iff_mtime_ns, iff_content_hash, iff_updated
+        )
+        VALUES (%s, %s, %s, %s, NOW())
+        ON CONFLICT (iff_file_path) DO UPDATE
+        SET iff_size = EXCLUDED.iff_size, iff_mtime_ns = EXCLUDED.iff_mtime_ns,
+            iff_content_hash = EXCLUDED.iff_content_hash, iff_updated = NOW();
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(query, (file_path, size, mtime_ns, content_hash))
+        conn.commit()
+
+
 def record_failure(conn):
     """Finds the latest running batch, process, or task and marks it as 'Failed'."""
 
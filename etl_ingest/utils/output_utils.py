@@ -1,32 +1,183 @@
 import os
+import re
+import glob
+import gzip
 import json
+import atexit
+import threading
+from datetime import date, datetime
 
+# Logs are rotated once this many bytes of JSON have been written to them
+FAILURE_LOG_MAX_BYTES = 64 << 20
+# Buffered rows are written out in batches of this size
+FAILURE_LOG_FLUSH_ROWS = 1000
+FAILURE_LOG_COMPRESS = os.environ.get("FAILURE_LOG_COMPRESS", "false").lower() == "true"
 
-def write_failed_rows(file_path, failed_rows):
 
-    # If file does not exist, create
-    if not os.path.exists(file_path):
-        with open(file_path, "w", encoding="utf-8") as jsonf:
-            jsonf.write("[\n")
+def _json_default(obj):
+    """Handles datetime serialization, anything else is logged as a string."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
 
-    # Check if file is empty, if empty create json array and write
-    # If not empty, remove array syntax, add rows, close array syntax
-    with open(file_path, "r+", encoding="utf-8") as jsonf:
-        jsonf.seek(0, os.SEEK_END)
-        file_size = jsonf.tell()
 
-        if file_size > 2:
-            jsonf.seek(file_size - 2)
-            jsonf.truncate()
-            jsonf.write(",\n")
+_encoder = json.JSONEncoder(ensure_ascii=False, default=_json_default)
+
+
+class FailureLogWriter:
+    """
+    Appends rows to a newline delimited JSON log through a handle that stays
+    open. Rows are encoded once, buffered and written per `flush_rows` rows.
+    When the log reaches `max_bytes` it is renamed to the next numbered file,
+    e.g. failed.1.ndjson, and a new log is started. With compress, every file
+    is a gzip stream with .gz appended to its name.
+    """
+
+    def __init__(
+        self,
+        file_path,
+        max_bytes=FAILURE_LOG_MAX_BYTES,
+        compress=FAILURE_LOG_COMPRESS,
+        flush_rows=FAILURE_LOG_FLUSH_ROWS,
+    ):
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.flush_rows = flush_rows
+
+        self.lines = []
+        self.lock = threading.Lock()
+        self.file = None
+        self._open()
+
+    def _active_path(self):
+        return self.file_path + ".gz" if self.compress else self.file_path
+
+    def _open(self):
+        path = self._active_path()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.size = _json_size(path, self.compress)
+        if self.compress:
+            self.file = gzip.open(path, "ab")
         else:
-            jsonf.seek(0, os.SEEK_END)
+            self.file = open(path, "ab")
+
+    def write(self, rows, columns=None):
+        """Appends rows, sequences are turned into dicts when columns are given."""
+        lines = [
+            _encoder.encode(dict(zip(columns, row)) if columns else row) + "\n"
+            for row in rows
+        ]
+
+        with self.lock:
+            self.lines.extend(lines)
+            if len(self.lines) >= self.flush_rows:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.lines:
+            data = "".join(self.lines).encode("utf-8")
+            self.lines = []
+            self.file.write(data)
+            self.size += len(data)
+        self.file.flush()
+
+        if self.size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self.file.close()
+        base, ext = os.path.splitext(self.file_path)
+        suffix = ".gz" if self.compress else ""
+        number = max((n for n, _ in _rotated_logs(self.file_path)), default=0) + 1
+        os.replace(self._active_path(), f"{base}.{number}{ext}{suffix}")
+        self._open()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self._flush()
+                self.file.close()
+                self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _json_size(path, compress):
+    """Bytes of JSON in a log, the uncompressed size of a gzip stream."""
+    if not os.path.exists(path):
+        return 0
+    if not compress:
+        return os.path.getsize(path)
+
+    size = 0
+    with gzip.open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            size += len(block)
+    return size
+
+
+def _rotated_logs(file_path):
+    """Returns the numbers and paths of the rotated files of a log, oldest first."""
+    base, ext = os.path.splitext(file_path)
+    pattern = re.compile(re.escape(base) + r"\.(\d+)" + re.escape(ext) + r"(\.gz)?\Z")
+
+    logs = []
+    for path in glob.glob(glob.escape(base) + ".*"):
+        match = pattern.match(path)
+        if match:
+            logs.append((int(match.group(1)), path))
+    return sorted(logs)
+
+
+def read_failure_log(file_path):
+    """Streams the rows of a log and its rotated files, oldest first."""
+    paths = [path for _, path in _rotated_logs(file_path)]
+    paths += [path for path in (file_path, file_path + ".gz") if os.path.exists(path)]
+
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+# Open logs by path, so every write appends to the same buffered handle
+_failure_logs = {}
+_failure_logs_lock = threading.Lock()
+
+
+def write_failed_rows(file_path, failed_rows, columns=None):
+    """Appends rows to a newline delimited JSON log, see FailureLogWriter."""
+    with _failure_logs_lock:
+        writer = _failure_logs.get(file_path)
+        if writer is None:
+            writer = _failure_logs[file_path] = FailureLogWriter(file_path)
+    writer.write(failed_rows, columns)
+
+
+def close_failure_logs():
+    """
+    Writes the buffered rows and closes every open log. Worker processes do
+    not run exit handlers, so they have to call this before returning.
+    """
+    with _failure_logs_lock:
+        writers = list(_failure_logs.values())
+        _failure_logs.clear()
+    for writer in writers:
+        writer.close()
 
-        for i, row in enumerate(failed_rows):
-            jsonf.write(json.dumps(row, indent=4))
-            if i < len(failed_rows) - 1:
-                jsonf.write(",\n")
-            else:
-                jsonf.write("\n")
 
-        jsonf.write("]")
+atexit.register(close_failure_logs)
@@ -0,0 +1,28 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def run_tasks(worker, tasks):
+    """
+    Runs worker(*task) for every task and yields the results as they finish.
+    A single task runs inline, more tasks run in a pool of worker processes.
+    The pool processes are not daemonic, so workers can start pools of their own.
+
+    :param worker: Module level function, so it can be sent to the pool.
+    :param tasks: List of argument tuples.
+    """
+    if len(tasks) <= 1:
+        for task in tasks:
+            yield worker(*task)
+        return
+
+    with ProcessPoolExecutor(len(tasks)) as executor:
+        futures = [executor.submit(worker, *task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def merge_counts(total, counts):
+    """Adds the record counts returned by a worker to the running totals."""
+    for key, value in counts.items():
+        total[key] = total.get(key, 0) + value
+    return total
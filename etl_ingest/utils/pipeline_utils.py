@@ -0,0 +1,341 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.db_utills import (
+    connect_to_db,
+    write_to_db,
+    write_new_rows,
+    truncate_for_bulk_load,
+)
+
+STAGES = ("read", "transform", "write")
+QUEUES = ("raw", "transformed")
+
+_DONE = object()
+
+
+def run_pipeline(items, transform, write, transform_workers=0, queue_size=4):
+    """
+    Runs a read, transform and write stage concurrently, connected by bounded
+    queues so a slow stage holds back the stages before it.
+
+    The reader thread pulls items from `items`, the calling thread transforms
+    them (or fans them out to a process pool) and a writer thread passes the
+    results to `write` in order.
+
+    :param items: Iterable of raw items, consumed in the reader thread.
+    :param transform: Module level function applied to every item.
+    :param write: Callable receiving every transformed item, runs in the writer thread.
+    :param transform_workers: Size of the transform process pool, 0 transforms inline.
+    :param queue_size: Maximum number of items waiting between two stages.
+    :return: Busy and wait times per stage and the depths of both queues.
+    """
+    raw_items = queue.Queue(queue_size)
+    results = queue.Queue(queue_size)
+    stop = threading.Event()
+    errors = []
+
+    stats = {
+        stage: {"items": 0, "busy": 0.0, "input_wait": 0.0, "output_wait": 0.0}
+        for stage in STAGES
+    }
+    depths = {name: {"max": 0, "total": 0, "samples": 0} for name in QUEUES}
+
+    def put(target, name, stage, item):
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats[stage]["output_wait"] += time.perf_counter() - start
+
+        depth = target.qsize()
+        depths[name]["max"] = max(depths[name]["max"], depth)
+        depths[name]["total"] += depth
+        depths[name]["samples"] += 1
+
+    def get(source, stage):
+        start = time.perf_counter()
+        item = _DONE
+        while not stop.is_set():
+            try:
+                item = source.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        stats[stage]["input_wait"] += time.perf_counter() - start
+        return item
+
+    def read():
+        try:
+            source = iter(items)
+            while not stop.is_set():
+                start = time.perf_counter()
+                item = next(source, _DONE)
+                stats["read"]["busy"] += time.perf_counter() - start
+                if item is _DONE:
+                    break
+                stats["read"]["items"] += 1
+                put(raw_items, "raw", "read", item)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(raw_items, "raw", "read", _DONE)
+
+    def write_results():
+        try:
+            while True:
+                item = get(results, "write")
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                write(item)
+                stats["write"]["busy"] += time.perf_counter() - start
+                stats["write"]["items"] += 1
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    def transformed(result):
+        put(results, "transformed", "transform", result)
+        stats["transform"]["items"] += 1
+
+    reader = threading.Thread(target=read, daemon=True)
+    writer = threading.Thread(target=write_results, daemon=True)
+    executor = ProcessPoolExecutor(transform_workers) if transform_workers else None
+    pending = deque()
+
+    reader.start()
+    writer.start()
+
+    try:
+        while True:
+            item = get(raw_items, "transform")
+            if item is _DONE:
+                break
+
+            if executor is None:
+                start = time.perf_counter()
+                result = transform(item)
+                stats["transform"]["busy"] += time.perf_counter() - start
+                transformed(result)
+                continue
+
+            # Keep every pool worker busy, results are passed on in order
+            pending.append(executor.submit(transform, item))
+            if len(pending) >= 2 * transform_workers:
+                start = time.perf_counter()
+                result = pending.popleft().result()
+                stats["transform"]["busy"] += time.perf_counter() - start
+                transformed(result)
+
+        while pending and not stop.is_set():
+            start = time.perf_counter()
+            result = pending.popleft().result()
+            stats["transform"]["busy"] += time.perf_counter() - start
+            transformed(result)
+
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+
+    finally:
+        put(results, "transformed", "transform", _DONE)
+        reader.join()
+        writer.join()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if errors:
+        raise errors[0]
+
+    return {
+        "stages": stats,
+        "queues": {
+            name: {
+                "max_depth": depth["max"],
+                "avg_depth": depth["total"] / max(depth["samples"], 1),
+            }
+            for name, depth in depths.items()
+        },
+    }
+
+
+def format_pipeline_stats(pipeline_stats):
+    """Formats the stats returned by run_pipeline as a single line."""
+    stages = ", ".join(
+        f"{stage} {s['items']} items busy {s['busy']:.1f}s "
+        f"waited in {s['input_wait']:.1f}s out {s['output_wait']:.1f}s"
+        for stage, s in pipeline_stats["stages"].items()
+    )
+    queues = ", ".join(
+        f"{name} queue max {q['max_depth']} avg {q['avg_depth']:.1f}"
+        for name, q in pipeline_stats["queues"].items()
+    )
+    return f"{stages}; {queues}"
+
+
+class TableWriter:
+    """
+    Copies rows into one stage1 table from a thread with its own connection.
+
+    Rows are buffered and written and committed per `batch_size` rows. The
+    queue in front of the thread is bounded, so put() blocks when the
+    table falls behind. A failed batch is rolled back and logged in
+    `error_logs`, like a failed chunk. After every batch `on_commit` is
+    called from the thread with the checkpoint of its last rows and
+    whether the batch was committed.
+
+    With bulk, the table is truncated and loaded in one transaction with
+    COPY ... FREEZE, committed when the writer closes. A failed batch
+    fails the whole load, which is rolled back.
+
+    With skip_conflicts, rows that conflict with a unique index of the
+    table are counted in `skipped` instead of written, see write_new_rows.
+    """
+
+    def __init__(
+        self,
+        table_name,
+        columns,
+        batch_size,
+        binary=False,
+        queue_size=4,
+        entity=None,
+        on_commit=None,
+        bulk=False,
+        unlogged=False,
+        skip_conflicts=False,
+    ):
+        self.table_name = table_name
+        self.columns = columns
+        self.batch_size = batch_size
+        self.binary = binary
+        self.entity = entity or table_name
+        self.on_commit = on_commit
+        self.bulk = bulk
+        self.unlogged = unlogged
+        self.skip_conflicts = skip_conflicts
+
+        self.rows_out = 0
+        self.skipped = 0
+        self.batch_count = 0
+        self.elapsed = 0.0
+        self.error_logs = []
+        self.error = None
+        self.discard = False
+
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, rows, checkpoint=None):
+        """Queues rows for the table, blocks while the queue is full."""
+        if not rows and checkpoint is None:
+            return
+        while self.thread.is_alive():
+            try:
+                self.queue.put((rows, checkpoint), timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise self.error or Exception(f"Writer for {self.table_name} has stopped")
+
+    def close(self, discard=False):
+        """
+        Writes the buffered rows and waits for the thread, check `error` after.
+        With discard the rows not written yet are dropped, so a failed run
+        does not commit past the checkpoint it is resumed from.
+        """
+        self.discard = discard
+        while self.thread.is_alive():
+            try:
+                self.queue.put(_DONE, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.thread.join()
+
+    def rows_per_second(self):
+        """Rows written per second of the time the writer was running."""
+        return self.rows_out / self.elapsed if self.elapsed else 0.0
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            conn = connect_to_db()
+        except Exception as e:
+            self.error = e
+            return
+
+        buffer = []
+        checkpoint = None
+        try:
+            cursor = conn.cursor()
+            if self.bulk:
+                truncate_for_bulk_load(cursor, self.table_name, self.unlogged)
+            while True:
+                item = self.queue.get()
+                if item is _DONE or self.discard:
+                    break
+                rows, item_checkpoint = item
+                buffer.extend(rows)
+                if item_checkpoint is not None:
+                    checkpoint = item_checkpoint
+                if len(buffer) >= self.batch_size:
+                    self._flush(conn, cursor, buffer, checkpoint)
+                    buffer = []
+                    checkpoint = None
+
+            if (buffer or checkpoint is not None) and not self.discard:
+                self._flush(conn, cursor, buffer, checkpoint)
+            if self.bulk and not self.discard:
+                conn.commit()
+
+        except Exception as e:
+            self.error = e
+
+        finally:
+            conn.close()
+            self.elapsed = time.perf_counter() - start
+
+    def _flush(self, conn, cursor, rows, checkpoint):
+        if self.bulk:
+            write_to_db(
+                cursor, self.table_name, self.columns, rows, self.binary, freeze=True
+            )
+            self.rows_out += len(rows)
+            self.batch_count += 1
+            return
+
+        committed = True
+        try:
+            if rows and self.skip_conflicts:
+                written = write_new_rows(cursor, self.table_name, self.columns, rows)
+                conn.commit()
+                self.rows_out += written
+                self.skipped += len(rows) - written
+            elif rows:
+                write_to_db(cursor, self.table_name, self.columns, rows, self.binary)
+                conn.commit()
+                self.rows_out += len(rows)
+        except Exception as e:
+            conn.rollback()
+            committed = False
+            self.error_logs.append(
+                {
+                    "chunk_error": str(e),
+                    "batch": self.batch_count,
+                    "entity": self.entity,
+                }
+            )
+        self.batch_count += 1
+
+        if checkpoint is not None and self.on_commit:
+            self.on_commit(checkpoint, committed)
@@ -0,0 +1,362 @@
+import csv
+import io
+import json
+import mmap
+import os
+import sys
+from collections import namedtuple
+from itertools import islice
+from operator import itemgetter
+
+from utils.data_utils import convert_value
+from utils.file_utils import (
+    split_file_ranges,
+    record_chunk_end,
+    sample_record_size,
+    RecordLineReader,
+)
+from utils.compression_utils import (
+    compression_suffix,
+    strip_compression_suffix,
+    open_binary,
+    decompression_stats,
+)
+
+JSON_LINES_SUFFIXES = (".json", ".jsonl")
+
+# Rows per chunk when iterating over a mapped CSV row by row
+CHUNK_ROWS = 1000
+
+# Block size used when skipping to the offset a JSON-lines source resumes from
+SKIP_BLOCK_SIZE = 1 << 20
+
+
+def is_json_lines(file_path):
+    """Whether a source file is a (compressed) JSON-lines dump instead of a CSV."""
+    return strip_compression_suffix(file_path).lower().endswith(JSON_LINES_SUFFIXES)
+
+
+def split_source(file_path, parts):
+    """
+    Splits a source file into byte ranges, see split_file_ranges. A
+    compressed stream cannot be split, so it is read as one range that ends
+    at the end of the stream.
+
+    :return: CSV header fieldnames, empty for JSON lines, and the ranges.
+    """
+    if compression_suffix(file_path):
+        if is_json_lines(file_path):
+            return [], [(0, sys.maxsize)]
+        with RecordLineReader(file_path, 0, sys.maxsize) as lines:
+            fieldnames = next(csv.reader(lines), [])
+            return fieldnames, [(lines.offset, sys.maxsize)]
+
+    if not is_json_lines(file_path):
+        return split_file_ranges(file_path, parts)
+
+    size = os.path.getsize(file_path)
+    return [], [(0, size)] if size else []
+
+
+def open_source(file_path, fieldnames, start, end, fields):
+    """
+    Opens a byte range of a source file as an iterator of rows with the
+    current byte offset in `offset`. Rows are tuples of the values of
+    `fields`, in its order.
+
+    :param fieldnames: CSV header fieldnames.
+    :param fields: CSV column names mapped to their key in the JSON-lines
+                   records, None for the line number of the record.
+    """
+    if is_json_lines(file_path):
+        return JsonLinesReader(file_path, start, end, fields)
+    if compression_suffix(file_path):
+        return CsvReader(file_path, fieldnames, start, end, fields)
+    return MappedCsvReader(file_path, fieldnames, start, end, fields)
+
+
+def _select_columns(records, fieldnames, fields):
+    """
+    Turns parsed CSV records into tuples of the columns in `fields`, found
+    by their index in the header. Blank records are skipped, values missing
+    from a record or the header are None, like csv.DictReader.
+    """
+    indexes = [
+        fieldnames.index(name) if name in fieldnames else None for name in fields
+    ]
+    width = max((index for index in indexes if index is not None), default=-1) + 1
+
+    complete = None not in indexes
+    if complete and len(indexes) > 1:
+        select = itemgetter(*indexes)
+    else:
+        select = lambda record: tuple(record[index] for index in indexes)
+
+    for record in records:
+        if not record:
+            continue
+        if complete and len(record) >= width:
+            yield select(record)
+        else:
+            yield tuple(
+                record[index] if index is not None and index < len(record) else None
+                for index in indexes
+            )
+
+
+# A row that failed to transform, turned into a dict only when it is logged
+FailedRow = namedtuple("FailedRow", ["row", "error", "ibpt_id"], defaults=[None])
+
+
+def failed_row_dicts(failed_rows, fields):
+    """Turns FailedRows into the dicts written to the failure logs."""
+    names = list(fields)
+    logs = []
+    for failed in failed_rows:
+        log = {"row": dict(zip(names, failed.row)), "error": failed.error}
+        if failed.ibpt_id is not None:
+            log["ibpt_id"] = failed.ibpt_id
+        logs.append(log)
+    return logs
+
+
+def read_source_chunk(chunk):
+    """Returns the rows of a chunk, parsing it first if it is a MappedChunk."""
+    return chunk.rows() if isinstance(chunk, MappedChunk) else chunk
+
+
+def transform_source_chunk(transform, chunk):
+    """
+    Applies a chunk transform to the rows of a chunk read by a source,
+    see SourceReader.chunks. Runs in the transform workers.
+
+    :return: The number of rows read and the result of the transform.
+    """
+    rows = read_source_chunk(chunk)
+    return len(rows), transform(rows)
+
+
+def _pending_stops(stops, offset):
+    """Returns the sorted offsets of `stops` after `offset`."""
+    return sorted(set(stop for stop in stops if stop > offset))
+
+
+class SourceReader:
+    """Base of the source readers, which iterate over row tuples."""
+
+    def chunks(self, chunk_size, shared=False, stops=()):
+        """
+        Yields lists of `chunk_size` rows, `offset` is the end of the last
+        chunk yielded. A chunk also ends at every record boundary in
+        `stops`, e.g. the checkpoints of the tables of a resumed range, so
+        no chunk spans one. With shared a reader may yield chunks that are
+        only parsed by read_source_chunk, in a transform worker.
+        """
+        stops = _pending_stops(stops, self.offset)
+        if not stops:
+            while True:
+                chunk = list(islice(self, chunk_size))
+                if not chunk:
+                    break
+                yield chunk
+            return
+
+        chunk = []
+        for row in self:
+            chunk.append(row)
+            at_stop = bool(stops) and self.offset >= stops[0]
+            while stops and self.offset >= stops[0]:
+                stops.pop(0)
+            if at_stop or len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def decompression_stats(self):
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvReader(SourceReader):
+    """Reads the rows of a byte range of a (compressed) CSV file."""
+
+    def __init__(self, file_path, fieldnames, start, end, fields):
+        self.lines = RecordLineReader(file_path, start, end)
+        self.rows = _select_columns(csv.reader(self.lines), fieldnames, fields)
+
+    @property
+    def offset(self):
+        return self.lines.offset
+
+    def __iter__(self):
+        return self.rows
+
+    def decompression_stats(self):
+        return decompression_stats(self.lines.file)
+
+    def close(self):
+        self.lines.close()
+
+
+# Mappings of the CSV files the chunks of this process are parsed from
+_mapped_files = {}
+
+
+def _map_file(file_path):
+    mapped = _mapped_files.get(file_path)
+    if mapped is None:
+        with open(file_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _mapped_files[file_path] = mapped
+    return mapped
+
+
+def parse_records(data, fieldnames, fields):
+    """
+    Parses a buffer of whole CSV records into row tuples of the columns in
+    `fields`. The buffer is decoded at once, without copying it to bytes.
+    The csv module has to scan every field to find the ones in `fields`,
+    decoding the fields it skips costs a small part of that scan.
+    """
+    text = str(data, "utf-8")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return list(_select_columns(csv.reader(io.StringIO(text)), fieldnames, fields))
+
+
+class MappedChunk:
+    """
+    A chunk of whole records of a mapped CSV file. Only its offsets are
+    passed to a worker process, which parses it from its own mapping of
+    the file, so all workers share the pages of the file.
+    """
+
+    __slots__ = ("file_path", "fieldnames", "fields", "start", "end")
+
+    def __init__(self, file_path, fieldnames, fields, start, end):
+        self.file_path = file_path
+        self.fieldnames = fieldnames
+        self.fields = fields
+        self.start = start
+        self.end = end
+
+    def rows(self):
+        with memoryview(_map_file(self.file_path))[self.start : self.end] as data:
+            return parse_records(data, self.fieldnames, self.fields)
+
+
+class MappedCsvReader(SourceReader):
+    """
+    Reads a byte range of a CSV file through a memory mapping.
+
+    Chunks are cut at record boundaries found in the mapping, respecting
+    quoted fields, and parsed from a memoryview of the whole chunk instead
+    of line by line. Only the columns in `fields` become row values.
+    """
+
+    def __init__(self, file_path, fieldnames, start, end, fields):
+        self.file_path = file_path
+        self.fieldnames = fieldnames
+        self.fields = list(fields)
+        self.offset = start
+
+        with open(file_path, "rb") as f:
+            self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.end = min(end, len(self.mapped))
+        self.record_size = sample_record_size(self.mapped, start, self.end)
+
+    def __iter__(self):
+        for chunk in self.chunks(CHUNK_ROWS):
+            yield from chunk
+
+    def chunks(self, chunk_size, shared=False, stops=()):
+        # Chunks are sized in bytes from the average record size
+        chunk_bytes = chunk_size * self.record_size
+        stops = _pending_stops(stops, self.offset)
+        while self.offset < self.end:
+            start = self.offset
+            while stops and stops[0] <= start:
+                stops.pop(0)
+            # A chunk ends at the next stop, the record size of a resumed
+            # range is sampled from its own start
+            limit = min(stops[0], self.end) if stops else self.end
+            self.offset = record_chunk_end(self.mapped, start, limit, chunk_bytes)
+            if shared:
+                yield MappedChunk(
+                    self.file_path, self.fieldnames, self.fields, start, self.offset
+                )
+                continue
+            with memoryview(self.mapped)[start : self.offset] as data:
+                rows = parse_records(data, self.fieldnames, self.fields)
+            if rows:
+                yield rows
+
+    def close(self):
+        self.mapped.close()
+
+
+class JsonLinesReader(SourceReader):
+    """
+    Streams the records of a JSON-lines file, compressed or not, as rows
+    like the ones of the converted CSVs. Nested values are passed on as the
+    lists and dicts they are, fields a record lacks are empty like in the
+    CSV. Records of the older dumps that are Python literals instead of
+    JSON are read with convert_value.
+
+    `offset` counts uncompressed bytes. A range starting past 0 is read up
+    to its start first, counting lines to keep the record numbers.
+    """
+
+    def __init__(self, file_path, start, end, fields):
+        self.file = open_binary(file_path)
+        self.keys = list(fields.values())
+        self.offset = 0
+        self.end = end
+        self.line_number = 0
+
+        while self.offset < start:
+            block = self.file.read(min(SKIP_BLOCK_SIZE, start - self.offset))
+            if not block:
+                break
+            self.offset += len(block)
+            self.line_number += block.count(b"\n")
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            if self.offset >= self.end:
+                raise StopIteration
+
+            line = self.file.readline()
+            if not line:
+                raise StopIteration
+            self.offset += len(line)
+            self.line_number += 1
+            if line.strip():
+                break
+
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = convert_value(line.decode("utf-8").strip())
+        if not isinstance(record, dict):
+            raise ValueError(f"Invalid record before offset {self.offset}")
+
+        # Records are numbered by their line, from 0
+        return tuple(
+            record.get(key, "") if key else self.line_number - 1 for key in self.keys
+        )
+
+    def decompression_stats(self):
+        return decompression_stats(self.file)
+
+    def close(self):
+        self.file.close()
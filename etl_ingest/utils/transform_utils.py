@@ -0,0 +1,101 @@
+from collections import namedtuple
+
+# Spec of a target column of a stage1 table:
+#   target:     Column of the table, or a tuple of columns filled from the
+#               tuple the parser returns.
+#   source:     Source field the value is read from.
+#   default:    Value used when the source value is empty, None parses it anyway.
+#   parser:     Turns the source value into the column value, str if None.
+#   sanitizer:  Applied to the parsed value, not to the default.
+#   max_length: Rows with a longer value fail, the first value for a tuple.
+#   error:      Failure reason of a value that is too long or cannot be
+#               parsed. Without it a value that cannot be parsed fails the
+#               row with the message of the exception.
+Column = namedtuple(
+    "Column",
+    ["target", "source", "default", "parser", "sanitizer", "max_length", "error"],
+    defaults=[None, None, None, None, None],
+)
+
+
+class RowError(Exception):
+    """Raised by a compiled row transform for a row that fails a column spec."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _targets(column):
+    return column.target if isinstance(column.target, tuple) else (column.target,)
+
+
+def target_columns(columns):
+    """Returns the table columns of a spec, in the order of the transformed rows."""
+    return [target for column in columns for target in _targets(column)]
+
+
+def compile_row_transform(columns, fields, name="transform_row"):
+    """
+    Compiles a table spec into a function that transforms one source row
+    into the list of its column values, in the order of the spec, and
+    raises RowError for a row that fails a column.
+
+    The function is generated as straight-line code, with the positions,
+    defaults, parsers and limits of every column bound once, so the row
+    loop does no lookups in the spec.
+
+    :param columns: List of Column specs.
+    :param fields: Source field names, in the order of the row tuples.
+    :param name: Name of the generated function.
+    """
+    fields = list(fields)
+    namespace = {"RowError": RowError}
+    lines = [f"def {name}(row):"]
+    values = []
+
+    for i, column in enumerate(columns):
+        names = [f"value_{len(values) + k}" for k in range(len(_targets(column)))]
+        values += names
+        value = ", ".join(names)
+        source = f"row[{fields.index(column.source)}]"
+
+        # The source value is only read into a local when the default needs it twice
+        if column.default is not None:
+            lines.append(f"    source_{i} = {source}")
+            source = f"source_{i}"
+
+        namespace[f"parse_{i}"] = column.parser or str
+        parsed = f"parse_{i}({source})"
+        if column.sanitizer:
+            namespace[f"sanitize_{i}"] = column.sanitizer
+            parsed = f"sanitize_{i}({parsed})"
+        if column.default is not None:
+            namespace[f"default_{i}"] = column.default
+            parsed = f"{parsed} if {source} else default_{i}"
+
+        if column.parser and column.error:
+            namespace[f"error_{i}"] = column.error
+            lines += [
+                "    try:",
+                f"        {value} = {parsed}",
+                "    except Exception:",
+                f"        raise RowError(error_{i}) from None",
+            ]
+        else:
+            lines.append(f"    {value} = {parsed}")
+
+        if column.max_length is not None:
+            namespace[f"error_{i}"] = column.error or f"{_targets(column)[0]} too long"
+            lines += [
+                f"    if len({names[0]}) > {int(column.max_length)}:",
+                f"        raise RowError(error_{i})",
+            ]
+
+    lines.append(f"    return [{', '.join(values)}]")
+
+    code = "\n".join(lines) + "\n"
+    exec(compile(code, f"<{name}>", "exec"), namespace)
+    transform = namespace[name]
+    transform.source = code
+    return transform
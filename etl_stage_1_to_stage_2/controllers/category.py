@@ -0,0 +1,104 @@
+from utils.db_utills import connect_to_db, DB_STAGE1, DB_STAGE2, DB_ADW, write_to_db
+from utils.output_utils import write_failed_rows
+from utils.metadata_utils import (
+    create_import_batch_process_task,
+    update_import_batch_process_task,
+    update_import_batch_process,
+)
+from utils.paging_utils import iter_batches, last_key
+
+conn_stage_1 = connect_to_db(DB_STAGE1)
+conn_stage_2 = connect_to_db(DB_STAGE2)
+conn_meta = connect_to_db(DB_ADW)
+
+stage_2_columns = ("c_category",)
+
+
+key_columns = ("c_category",)
+
+
+def fetch_batches(batch_size):
+    return iter_batches(
+        conn_stage_1, "v_s1_category", stage_2_columns, key_columns, batch_size
+    )
+
+
+def migrate_category(ibp_id):
+    ibpt_id = create_import_batch_process_task(
+        conn_meta, ibp_id, "s2_category", "Running"
+    )
+
+    batch_size = 100000
+
+    records_in_count = 0
+    records_failed_count = 0
+    records_out_count = 0
+
+    print("Categories migration starting...")
+
+    try:
+        for batch in fetch_batches(batch_size):
+            records_in_count += len(batch)
+
+            try:
+                with conn_stage_2.cursor() as cursor:
+                    write_to_db(cursor, "s2_category", stage_2_columns, batch)
+                    conn_stage_2.commit()
+
+                records_out_count += len(batch)
+
+            except Exception as e:
+                print(f"Error during category batch migration: {e}")
+                conn_stage_2.rollback()
+
+                write_failed_rows(
+                    "./logs/s2_category_failed_records.ndjson",
+                    batch,
+                    stage_2_columns,
+                )
+                records_failed_count += len(batch)
+                write_failed_rows(
+                    "./logs/s2_category_error_logs.ndjson",
+                    [
+                        {
+                            "batch_error": str(e),
+                            "last_key": last_key(batch, stage_2_columns, key_columns),
+                            "entity": "s2_category",
+                        }
+                    ],
+                )
+
+        update_import_batch_process_task(
+            conn_meta,
+            ibpt_id,
+            "Completed",
+            records_in_count,
+            records_failed_count,
+            records_out_count,
+            None,
+            None,
+            None,
+        )
+        print("Categories migration complete.")
+
+    except Exception as e:
+        print(f"Error during category migration: {e}")
+        update_import_batch_process_task(
+            conn_meta,
+            ibpt_id,
+            "Failed",
+            records_in_count,
+            records_failed_count,
+            records_out_count,
+            None,
+            None,
+            None,
+        )
+        update_import_batch_process(conn_meta, ibp_id, "Failed")
+        raise
+
+    # Close connections
+    finally:
+        conn_stage_1.close()
+        conn_stage_2.close()
+        conn_meta.close()
@@ -0,0 +1,71 @@
+from utils.db_utills import connect_to_db, DB_STAGE1, DB_ADW
+from utils.dedup_utils import dedupe_table
+from utils.output_utils import write_failed_rows
+from utils.metadata_utils import (
+    create_import_batch_process_task,
+    update_import_batch_process_task,
+    update_import_batch_process,
+)
+
+# Rows are streamed over one connection and deleted over the other
+conn_stage_1 = connect_to_db(DB_STAGE1)
+conn_stage_1_delete = connect_to_db(DB_STAGE1)
+conn_meta = connect_to_db(DB_ADW)
+
+# Tables read without DISTINCT by the migrations, related products are
+# deduped by the ingest
+DEDUP_TABLES = ("s1_product", "s1_review", "s1_product_category")
+
+
+def dedupe_stage_1(ibp_id):
+    """
+    Deletes the repeated rows of the stage1 tables before they are migrated,
+    see dedupe_table. Every table gets its own task, the deleted rows are
+    its failed records and the rows that remain its records out.
+    """
+    print("Stage 1 dedup starting...")
+
+    try:
+        for table_name in DEDUP_TABLES:
+            ibpt_id = create_import_batch_process_task(
+                conn_meta, ibp_id, f"{table_name}_dedup", "Running"
+            )
+
+            try:
+                rows_in, deleted = dedupe_table(
+                    conn_stage_1, conn_stage_1_delete, table_name
+                )
+                print(f"Deleted {deleted} of {rows_in} rows of {table_name}.")
+                update_import_batch_process_task(
+                    conn_meta,
+                    ibpt_id,
+                    "Completed",
+                    rows_in,
+                    deleted,
+                    rows_in - deleted,
+                    None,
+                    None,
+                    None,
+                )
+
+            except Exception as e:
+                print(f"Error during dedup of {table_name}: {e}")
+                conn_stage_1.rollback()
+                conn_stage_1_delete.rollback()
+                write_failed_rows(
+                    "./logs/s1_dedup_error_logs.ndjson",
+                    [{"dedup_error": str(e), "entity": table_name}],
+                )
+                update_import_batch_process_task(
+                    conn_meta, ibpt_id, "Failed", 0, 0, 0, None, None, None
+                )
+                update_import_batch_process(conn_meta, ibp_id, "Failed")
+                raise
+
+        print("Stage 1 dedup complete.")
+
+    # Close connections
+    finally:
+        conn_stage_1.close()
+        conn_stage_1_delete.close()
+        conn_meta.close()
@@ -1,14 +1,17 @@
 import psycopg2
 import io
-from psycopg2 import sql
 
 from utils.db_utills import connect_to_db, DB_STAGE1, DB_STAGE2, DB_ADW, write_to_db
-from utils.output_utils import write_failed_rows, convert_to_json
+from utils.output_utils import write_failed_rows
 from utils.metadata_utils import (
     create_import_batch_process_task,
     update_import_batch_process_task,
     update_import_batch_process,
+    update_import_batch_process_task_bytes,
 )
+from utils.paging_utils import iter_batches, last_key
+from utils.partition_utils import run_partitions
+from utils.transfer_utils import STAGE_DIRECT_COPY, transfer_table
 
 
 conn_stage_1 = connect_to_db(DB_STAGE1)
@@ -29,73 +32,110 @@ stage_2_columns = (
 )
 
 
-def fetch_batch(batch_size, offset):
-    with conn_stage_1.cursor() as cursor:
-        query = sql.SQL(
-            """
-            SELECT 
-                p_product_metadata_id, 
-                p_product_source_key, 
-                p_sales_rank_category, 
-                p_sales_rank,
-                p_image_url,
-                p_title,
-                p_description,
-                p_price,
-                p_brand
-              FROM v_s1_product LIMIT %s OFFSET %s
-              """
-        )
-        cursor.execute(query, [batch_size, offset])
-        return cursor.fetchall()
+# Stage 1 has no keys, the row id makes the order of repeated keys unique
+key_columns = ("p_product_source_key", "p_product_metadata_id", "p_row_id")
+partition_key = "p_product_source_key"
 
 
-def migrate_product(ibp_id):
+def fetch_batches(conn, batch_size, partition):
+    return iter_batches(
+        conn,
+        "v_s1_product",
+        stage_2_columns,
+        key_columns,
+        batch_size,
+        partition.predicate(),
+    )
 
-    ibpt_id = create_import_batch_process_task(
-        conn_meta, ibp_id, "s2_product", "Running"
+
+def transfer_partition(partition, conn_read, conn_write):
+    """Copies a partition with one COPY, see transfer_table."""
+    return transfer_table(
+        conn_read,
+        conn_write,
+        "v_s1_product",
+        "s2_product",
+        stage_2_columns,
+        where=partition.predicate(),
     )
 
+
+def migrate_partition(partition, conn_read, conn_write):
+    """
+    Migrates the rows of a partition in batches.
+
+    :return: Records in, failed and out of the partition.
+    """
     batch_size = 10000
-    offset = 0
 
     records_in_count = 0
     records_failed_count = 0
     records_out_count = 0
 
-    print("Product migration starting...")
-
-    try:
-
-        while True:
+    for batch in fetch_batches(conn_read, batch_size, partition):
+        records_in_count += len(batch)
+
+        try:
+            with conn_write.cursor() as cursor:
+                write_to_db(cursor, "s2_product", stage_2_columns, batch, binary=True)
+                conn_write.commit()
+
+            records_out_count += len(batch)
+
+        except Exception as e:
+            print(f"Error during product batch migration: {e}")
+            conn_write.rollback()
+
+            write_failed_rows(
+                "./logs/s2_product_failed_records.ndjson",
+                batch,
+                stage_2_columns,
+            )
+            records_failed_count += len(batch)
+            write_failed_rows(
+                "./logs/s2_product_error_logs.ndjson",
+                [
+                    {
+                        "batch_error": str(e),
+                        "last_key": last_key(batch, stage_2_columns, key_columns),
+                        "partition": partition.index,
+                        "entity": "s2_product",
+                    }
+                ],
+            )
+
+    return records_in_count, records_failed_count, records_out_count
 
-            try:
-                batch = fetch_batch(batch_size, offset)
-                records_in_count += len(batch)
 
-                if not batch:
-                    break
-
-                with conn_stage_2.cursor() as cursor:
-                    write_to_db(cursor, "s2_product", stage_2_columns, batch)
-                    conn_stage_2.commit()
-
-                records_out_count += len(batch)
+def migrate_product(ibp_id):
+    ibpt_id = create_import_batch_process_task(
+        conn_meta, ibp_id, "s2_product", "Running"
+    )
 
-            except Exception as e:
-                print(f"Error during product batch migration: {e}")
+    records_in_count = 0
+    records_failed_count = 0
+    records_out_count = 0
 
-                write_failed_rows(
-                    "./logs/s2_product_failed_records.json",
-                    convert_to_json(batch),
-                )
-                records_failed_count += len(batch)
-                write_failed_rows(
-                    "./logs/s2_product_error_logs.json",
-                    [{"batch_error": str(e), "offset": offset, "entity": "s2_product"}],
-                )
+    print("Product migration starting...")
 
-            offset += batch_size
+    try:
+        if STAGE_DIRECT_COPY:
+            records_in_count, records_out_count, transferred = run_partitions(
+                transfer_partition,
+                partition_key,
+                (conn_stage_1, conn_stage_2),
+                (DB_STAGE1, DB_STAGE2),
+            )
+            update_import_batch_process_task_bytes(conn_meta, ibpt_id, transferred)
+            print(f"Copied {records_out_count} rows, {transferred} bytes.")
+        else:
+            counts = run_partitions(
+                migrate_partition,
+                partition_key,
+                (conn_stage_1, conn_stage_2),
+                (DB_STAGE1, DB_STAGE2),
+            )
+            records_in_count, records_failed_count, records_out_count = counts
 
         update_import_batch_process_task(
             conn_meta,
@@ -108,7 +148,7 @@ def migrate_product(ibp_id):
             None,
             None,
         )
-        print("Review migration complete.")
+        print("Product migration complete.")
 
     except Exception as e:
         print(f"Error during product migration: {e}")
@@ -124,7 +164,9 @@ def migrate_product(ibp_id):
             None,
         )
         update_import_batch_process(conn_meta, ibp_id, "Failed")
+        raise
 
+    # Close connections
     finally:
         conn_stage_1.close()
         conn_stage_2.close()
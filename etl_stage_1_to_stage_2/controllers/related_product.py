@@ -4,7 +4,7 @@ from psycopg2 import sql
 import csv
 
 from utils.db_utills import connect_to_db, DB_STAGE1, DB_STAGE2, DB_ADW, write_to_db
-from utils.output_utils import write_failed_rows, convert_to_json
+from utils.output_utils import write_failed_rows
 from utils.late_arriving_products import (
     get_missing_products,
     insert_placeholder_products,
@@ -14,6 +14,8 @@ from utils.metadata_utils import (
     update_import_batch_process_task,
     update_import_batch_process,
 )
+from utils.paging_utils import iter_batches, last_key
+from utils.partition_utils import run_partitions
 
 
 conn_stage_1 = connect_to_db(DB_STAGE1)
@@ -27,83 +29,120 @@ stage_2_columns = (
 )
 
 
-def fetch_batch(batch_size, offset):
-    with conn_stage_1.cursor() as cursor:
-        query = sql.SQL(
-            """
-            SELECT 
-                rl_product_source_key,
-                rl_related_product_source_key,
-                rl_relation
-            FROM v_s1_related_product
-            LIMIT %s OFFSET %s
-        """
-        )
-        cursor.execute(query, [batch_size, offset])
-        return cursor.fetchall()
+# In the order of idx_s1_related_product, the row id makes it unique
+key_columns = (
+    sql.SQL("LEAST(rl_product_source_key, rl_related_product_source_key)"),
+    sql.SQL("GREATEST(rl_product_source_key, rl_related_product_source_key)"),
+    "rl_relation",
+    "rl_row_id",
+)
 
 
-def migrate_related_product(ibp_id):
+# Placeholders are inserted per related product, partitioning by it keeps
+# two partitions from inserting the same placeholder
+partition_key = "rl_related_product_source_key"
 
-    ibpt_id = create_import_batch_process_task(
-        conn_meta, ibp_id, "s2_review", "Running"
+
+def fetch_batches(conn, batch_size, partition):
+    return iter_batches(
+        conn,
+        "v_s1_related_product",
+        stage_2_columns,
+        key_columns,
+        batch_size,
+        partition.predicate(),
     )
 
+
+def migrate_partition(partition, conn_read, conn_write):
+    """
+    Migrates the rows of a partition in batches.
+
+    :return: Records in, failed and out of the partition.
+    """
     batch_size = 100000
-    offset = 0
 
     records_in_count = 0
     records_failed_count = 0
     records_out_count = 0
 
-    print("Related product migration starting...")
+    for batch in fetch_batches(conn_read, batch_size, partition):
+        records_in_count += len(batch)
 
-    try:
-        while True:
+        try:
+            product_keys = list(set(row[1] for row in batch))
+            missing_products = get_missing_products(product_keys, conn_write)
+
+            if missing_products:
+                insert_placeholder_products(missing_products, conn_write)
+                records_out_count += len(missing_products)
+
+            with conn_write.cursor() as cursor:
+                write_to_db(cursor, "s2_related_product", stage_2_columns, batch)
+                conn_write.commit()
 
-            try:
-                batch = fetch_batch(batch_size, offset)
-                records_in_count += len(batch)
+            records_out_count += len(batch)
 
-                if not batch:
-                    break
+        except Exception as e:
+            print(f"Error during related product batch migration: {e}")
+            conn_write.rollback()
 
-                product_keys = list(set(row[1] for row in batch))
-                missing_products = get_missing_products(product_keys, conn_stage_2)
+            write_failed_rows(
+                "./logs/s2_related_product_failed_records.ndjson",
+                batch,
+                stage_2_columns,
+            )
+            records_failed_count += len(batch)
+            write_failed_rows(
+                "./logs/s2_related_product_error_logs.ndjson",
+                [
+                    {
+                        "batch_error": str(e),
+                        "last_key": last_key(batch, stage_2_columns, stage_2_columns),
+                        "partition": partition.index,
+                        "entity": "s2_related_product",
+                    }
+                ],
+            )
 
-                if missing_products:
-                    insert_placeholder_products(missing_products, conn_stage_2)
-                    records_out_count += len(missing_products)
+    return records_in_count, records_failed_count, records_out_count
 
-                with conn_stage_2.cursor() as cursor:
-                    write_to_db(cursor, "s2_related_product", stage_2_columns, batch)
-                    conn_stage_2.commit()
 
-                records_out_count += len(batch)
+def migrate_related_product(ibp_id):
+    ibpt_id = create_import_batch_process_task(
+        conn_meta, ibp_id, "s2_related_product", "Running"
+    )
+
+    records_in_count = 0
+    records_failed_count = 0
+    records_out_count = 0
 
-            except Exception as e:
-                print(f"Error during review batch migration: {e}")
+    print("Related product migration starting...")
 
-                write_failed_rows(
-                    "./logs/s2_related_product_failed_records.json",
-                    convert_to_json(batch),
-                )
-                records_failed_count += len(batch)
-                write_failed_rows(
-                    "./logs/s2_related_product_error_logs.json",
-                    [
-                        {
-                            "batch_error": str(e),
-                            "offset": offset,
-                            "entity": "s2_related_product",
-                        }
-                    ],
-                )
+    try:
+        counts = run_partitions(
+            migrate_partition,
+            partition_key,
+            (conn_stage_1, conn_stage_2),
+            (DB_STAGE1, DB_STAGE2),
+        )
+        records_in_count, records_failed_count, records_out_count = counts
 
-            offset += batch_size
+        update_import_batch_process_task(
+            conn_meta,
+            ibpt_id,
+            "Completed",
+            records_in_count,
+            records_failed_count,
+            records_out_count,
+            None,
+            None,
+            None,
+        )
+        print("Related product migration complete.")
 
     except Exception as e:
-        print(f"Error during review migration: {e}")
+        print(f"Error during related product migration: {e}")
         update_import_batch_process_task(
             conn_meta,
             ibpt_id,
@@ -116,6 +155,7 @@ def migrate_related_product(ibp_id):
             None,
         )
         update_import_batch_process(conn_meta, ibp_id, "Failed")
+        raise
 
     # Close connections
     finally:
@@ -1,14 +1,17 @@
 import psycopg2
 import io
-from psycopg2 import sql
 
 from utils.db_utills import connect_to_db, DB_STAGE1, DB_STAGE2, DB_ADW, write_to_db
-from utils.output_utils import write_failed_rows, convert_to_json
+from utils.output_utils import write_failed_rows
 from utils.metadata_utils import (
     create_import_batch_process_task,
     update_import_batch_process_task,
     update_import_batch_process,
+    update_import_batch_process_task_bytes,
 )
+from utils.paging_utils import iter_batches, last_key
+from utils.partition_utils import run_partitions
+from utils.transfer_utils import STAGE_DIRECT_COPY, transfer_table
 
 conn_stage_1 = connect_to_db(DB_STAGE1)
 conn_stage_2 = connect_to_db(DB_STAGE2)
@@ -27,72 +30,118 @@ stage_2_columns = (
 )
 
 
-def fetch_batch(batch_size, offset):
-    with conn_stage_1.cursor() as cursor:
-        query = sql.SQL(
-            """
-            SELECT 
-                r_reviewer_source_key,
-                r_product_key,
-                r_reviewer_name,
-                r_helpfulness_rating,
-                r_review_text,
-                r_review_score,
-                r_review_title,
-                r_review_datetime
-              FROM v_s1_review LIMIT %s OFFSET %s
-              """
-        )
-        cursor.execute(query, [batch_size, offset])
-        return cursor.fetchall()
+# Stage 1 has no keys, the row id makes the order of repeated keys unique
+key_columns = (
+    "r_reviewer_source_key",
+    "r_product_key",
+    "r_review_datetime",
+    "r_row_id",
+)
 
 
-def migrate_reviews(ibp_id):
+# Reviews are partitioned by product
+partition_key = "r_product_key"
 
-    ibpt_id = create_import_batch_process_task(
-        conn_meta, ibp_id, "s2_review", "Running"
+
+def fetch_batches(conn, batch_size, partition):
+    return iter_batches(
+        conn,
+        "v_s1_review",
+        stage_2_columns,
+        key_columns,
+        batch_size,
+        partition.predicate(),
     )
 
-    batch_size = 10000
-    offset = 0
 
-    records_in_count = 0
-    records_failed_count = 0
-    records_out_count = 0
+def transfer_partition(partition, conn_read, conn_write):
+    """Copies a partition with one COPY, see transfer_table."""
+    return transfer_table(
+        conn_read,
+        conn_write,
+        "v_s1_review",
+        "s2_review",
+        stage_2_columns,
+        where=partition.predicate(),
+    )
 
-    print("Review migration starting...")
 
-    try:
+def migrate_partition(partition, conn_read, conn_write):
+    """
+    Migrates the rows of a partition in batches.
 
-        while True:
+    :return: Records in, failed and out of the partition.
+    """
+    batch_size = 10000
 
-            try:
-                batch = fetch_batch(batch_size, offset)
-                records_in_count += len(batch)
+    records_in_count = 0
+    records_failed_count = 0
+    records_out_count = 0
 
-                if not batch:
-                    break
+    for batch in fetch_batches(conn_read, batch_size, partition):
+        records_in_count += len(batch)
+
+        try:
+            with conn_write.cursor() as cursor:
+                write_to_db(cursor, "s2_review", stage_2_columns, batch, binary=True)
+                conn_write.commit()
+
+            records_out_count += len(batch)
+
+        except Exception as e:
+            print(f"Error during review batch migration: {e}")
+            conn_write.rollback()
+
+            write_failed_rows(
+                "./logs/s2_review_failed_records.ndjson",
+                batch,
+                stage_2_columns,
+            )
+            records_failed_count += len(batch)
+            write_failed_rows(
+                "./logs/s2_review_error_logs.ndjson",
+                [
+                    {
+                        "batch_error": str(e),
+                        "last_key": last_key(batch, stage_2_columns, key_columns),
+                        "partition": partition.index,
+                        "entity": "s2_review",
+                    }
+                ],
+            )
+
+    return records_in_count, records_failed_count, records_out_count
 
-                with conn_stage_2.cursor() as cursor:
-                    write_to_db(cursor, "s2_review", stage_2_columns, batch)
-                    conn_stage_2.commit()
 
-                records_out_count += len(batch)
+def migrate_reviews(ibp_id):
+    ibpt_id = create_import_batch_process_task(
+        conn_meta, ibp_id, "s2_review", "Running"
+    )
 
-            except Exception as e:
-                print(f"Error during review batch migration: {e}")
+    records_in_count = 0
+    records_failed_count = 0
+    records_out_count = 0
 
-                write_failed_rows(
-                    "./logs/s2_review_failed_records.json",
-                    convert_to_json(batch),
-                )
-                records_failed_count += len(batch)
-                write_failed_rows(
-                    "./logs/s2_review_error_logs.json",
-                    [{"batch_error": str(e), "offset": offset, "entity": "s2_review"}],
-                )
+    print("Review migration starting...")
 
-            offset += batch_size
+    try:
+        if STAGE_DIRECT_COPY:
+            records_in_count, records_out_count, transferred = run_partitions(
+                transfer_partition,
+                partition_key,
+                (conn_stage_1, conn_stage_2),
+                (DB_STAGE1, DB_STAGE2),
+            )
+            update_import_batch_process_task_bytes(conn_meta, ibpt_id, transferred)
+            print(f"Copied {records_out_count} rows, {transferred} bytes.")
+        else:
+            counts = run_partitions(
+                migrate_partition,
+                partition_key,
+                (conn_stage_1, conn_stage_2),
+                (DB_STAGE1, DB_STAGE2),
+            )
+            records_in_count, records_failed_count, records_out_count = counts
 
         update_import_batch_process_task(
             conn_meta,
@@ -121,7 +170,9 @@ def migrate_reviews(ibp_id):
             None,
         )
         update_import_batch_process(conn_meta, ibp_id, "Failed")
+        raise
 
+    # Close connections
     finally:
         conn_stage_1.close()
         conn_stage_2.close()
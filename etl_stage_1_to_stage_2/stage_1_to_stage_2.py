@@ -1,12 +1,15 @@
 import psycopg2
 import time
 
+from controllers.dedup import dedupe_stage_1
 from controllers.product import migrate_product
-from controllers.review import migrate_review
+from controllers.review import migrate_reviews
 from controllers.product_category import migrate_product_category
+from controllers.category import migrate_category
 from controllers.related_product import migrate_related_product
 
 from utils.db_utills import DB_ADW, connect_to_db
+from utils.scheduler_utils import MigrationGraph, run_process
 from utils.metadata_utils import (
     create_import_batch_process,
     update_import_batch_process,
@@ -22,12 +25,18 @@ if __name__ == "__main__":
 
     try:
 
-        migrate_product(ibp_id)
-        migrate_review(ibp_id)
-        migrate_related_product(ibp_id)
-        migrate_product_category(ibp_id)
-
-        update_import_batch_process(conn, ibp_id, "Completed")
+        # Stage 2 references products, only they have to be migrated first
+        graph = MigrationGraph()
+        graph.add("dedup", dedupe_stage_1)
+        graph.add("product", migrate_product, after=("dedup",))
+        graph.add("review", migrate_reviews, after=("product",))
+        graph.add("related_product", migrate_related_product, after=("product",))
+        graph.add("product_category", migrate_product_category, after=("product",))
+        graph.add("category", migrate_category)
+
+        failed = run_process(graph, conn, ibp_id)
+        if failed:
+            raise Exception(f"Migrations failed or skipped: {failed}")
 
     except Exception as e:
         update_import_batch_process(conn, ibp_id, "Failed")
@@ -0,0 +1,38 @@
+import unittest
+
+from psycopg2 import sql
+
+from utils.paging_utils import last_key
+
+
+class LastKeyTest(unittest.TestCase):
+    def test_key_of_the_last_row(self):
+        batch = [("A1", "Books", 1), ("A2", "Music", 2)]
+        columns = ("pc_product_source_key", "pc_category", "pc_rank")
+        key_columns = ("pc_product_source_key", "pc_category")
+
+        self.assertEqual(
+            last_key(batch, columns, key_columns),
+            {"pc_product_source_key": "A2", "pc_category": "Music"},
+        )
+
+    def test_row_ids_and_expressions_are_left_out(self):
+        batch = [("A1", "A2", "also_bought")]
+        columns = (
+            "rl_product_source_key",
+            "rl_related_product_source_key",
+            "rl_relation",
+        )
+        key_columns = (
+            sql.SQL("LEAST(rl_product_source_key, rl_related_product_source_key)"),
+            "rl_relation",
+            "rl_row_id",
+        )
+
+        self.assertEqual(
+            last_key(batch, columns, key_columns), {"rl_relation": "also_bought"}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from unittest import mock
+
+from utils import scheduler_utils
+from utils.scheduler_utils import MigrationGraph, run_process
+
+# The controllers connect when they are imported
+with mock.patch("utils.db_utills.connect_to_db"):
+    from controllers import product
+
+
+class Metadata:
+    """Records the statuses the migrations set on their tasks and process."""
+
+    def __init__(self):
+        self.tasks = {}
+        self.process_status = None
+
+    def create_task(self, conn, ibp_id, description, status):
+        ibpt_id = len(self.tasks) + 1
+        self.tasks[ibpt_id] = [description, status]
+        return ibpt_id
+
+    def update_task(self, conn, ibpt_id, status, *counts):
+        self.tasks[ibpt_id][1] = status
+
+    def update_process(self, conn, ibp_id, status):
+        self.process_status = status
+
+    def task_status(self, description):
+        return next(
+            status for name, status in self.tasks.values() if name == description
+        )
+
+
+class RunProcessTest(unittest.TestCase):
+    def setUp(self):
+        self.metadata = Metadata()
+        for module in (scheduler_utils, product):
+            for name, function in (
+                ("create_import_batch_process_task", self.metadata.create_task),
+                ("update_import_batch_process_task", self.metadata.update_task),
+                ("update_import_batch_process", self.metadata.update_process),
+            ):
+                patcher = mock.patch.object(module, name, function)
+                patcher.start()
+                self.addCleanup(patcher.stop)
+
+    def test_failed_product_skips_its_dependents(self):
+        migrations = {
+            name: mock.Mock(name=name)
+            for name in ("dedup", "review", "related_product", "category")
+        }
+        graph = MigrationGraph()
+        graph.add("dedup", migrations["dedup"])
+        graph.add("product", product.migrate_product, after=("dedup",))
+        graph.add("review", migrations["review"], after=("product",))
+        graph.add("related_product", migrations["related_product"], after=("product",))
+        graph.add("category", migrations["category"])
+
+        with mock.patch.object(
+            product, "run_partitions", side_effect=Exception("write failed")
+        ):
+            failed = run_process(graph, mock.Mock(), 1)
+
+        self.assertEqual(sorted(failed), ["product", "related_product", "review"])
+        self.assertEqual(graph.status["product"], "Failed")
+        self.assertEqual(graph.status["review"], "Skipped")
+        self.assertEqual(graph.status["related_product"], "Skipped")
+        self.assertEqual(graph.status["category"], "Completed")
+        migrations["review"].assert_not_called()
+        migrations["related_product"].assert_not_called()
+        migrations["category"].assert_called_once_with(1)
+
+        self.assertEqual(self.metadata.task_status("s2_product"), "Failed")
+        self.assertEqual(self.metadata.task_status("dag product"), "Failed")
+        self.assertEqual(self.metadata.process_status, "Failed")
+
+    def test_completed_migrations_complete_the_process(self):
+        graph = MigrationGraph()
+        graph.add("dedup", mock.Mock())
+        graph.add("product", mock.Mock(), after=("dedup",))
+
+        self.assertEqual(run_process(graph, mock.Mock(), 1), [])
+        self.assertEqual(self.metadata.process_status, "Completed")
+
+
+if __name__ == "__main__":
+    unittest.main()
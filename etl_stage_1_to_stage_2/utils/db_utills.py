@@ -1,6 +1,9 @@
 import psycopg2
-import io
+import struct
 import time
+from datetime import datetime
+from functools import lru_cache
+from psycopg2 import sql
 import csv
 
 
@@ -32,6 +35,41 @@ DB_ADW = {
 }
 
 
+# Column types of the tables written by this service, used by binary COPY
+COLUMN_TYPES = {
+    "s2_review": {
+        "r_reviewer_source_key": "varchar",
+        "r_product_key": "varchar",
+        "r_reviewer_name": "text",
+        "r_helpfulness_rating": "float8",
+        "r_review_text": "text",
+        "r_review_score": "float8",
+        "r_review_title": "text",
+        "r_review_datetime": "timestamp",
+    },
+    "s2_product": {
+        "p_product_metadata_id": "varchar",
+        "p_product_source_key": "varchar",
+        "p_sales_rank_category": "varchar",
+        "p_sales_rank": "int4",
+        "p_image_url": "varchar",
+        "p_title": "text",
+        "p_description": "text",
+        "p_price": "float8",
+        "p_brand": "varchar",
+    },
+    "s2_product_category": {
+        "pc_product_source_key": "varchar",
+        "pc_category": "varchar",
+    },
+    "s2_related_product": {
+        "rl_product_source_key": "varchar",
+        "rl_related_product_source_key": "varchar",
+        "rl_relation": "varchar",
+    },
+}
+
+
 def connect_to_db(db_params=DB_STAGE1, max_retries=5, retry_delay=5):
     """Attempt to connect to the PostgreSQL database with retries."""
     retries = 0
@@ -50,24 +88,183 @@ def connect_to_db(db_params=DB_STAGE1, max_retries=5, retry_delay=5):
     raise Exception("Unable to connect to the database after several retries.")
 
 
-def write_to_db(cursor, table_name, columns, data):
+# Characters that have to be escaped in the COPY text format
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+COPY_NULL = "\\N"
+
+# Number of characters handed to psycopg2 per read
+COPY_BUFFER_SIZE = 1 << 16
+
+
+def encode_copy_value(value):
+    """Encodes a single value in the COPY text format, None becomes NULL."""
+    if value is None:
+        return COPY_NULL
+    if type(value) is not str:
+        return str(value)
+    # Tabs, newlines and carriage returns make a string non-printable
+    if "\\" in value or not value.isprintable():
+        return value.translate(COPY_ESCAPES)
+    return value
+
+
+class CopyStream:
+    """
+    File-like COPY source that encodes rows lazily as psycopg2 reads from it,
+    so a batch is never held in memory a second time as one large string.
+    """
+
+    def __init__(self, rows, encode_row=None, header="", trailer=""):
+        self.rows = iter(rows)
+        self.encode_row = encode_row or encode_copy_row
+        self.buffer = header
+        self.trailer = trailer
+
+    def read(self, size=-1):
+        parts = [self.buffer]
+        length = len(self.buffer)
+
+        if self.rows is not None:
+            for row in self.rows:
+                line = self.encode_row(row)
+                parts.append(line)
+                length += len(line)
+                if 0 <= size <= length:
+                    break
+            else:
+                parts.append(self.trailer)
+                self.rows = None
+
+        data = self.trailer[:0].join(parts)
+        if 0 <= size < len(data):
+            data, self.buffer = data[:size], data[size:]
+        else:
+            self.buffer = self.trailer[:0]
+        return data
+
+
+def encode_copy_row(row):
+    """Encodes a row as one line of the COPY text format."""
+    return "\t".join(map(encode_copy_value, row)) + "\n"
+
+
+# Binary COPY framing, see the PostgreSQL COPY documentation
+BINARY_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+BINARY_COPY_TRAILER = struct.pack(">h", -1)
+
+_INT16 = struct.Struct(">h")
+_INT32 = struct.Struct(">i")
+_NULL_FIELD = _INT32.pack(-1)
+_PG_EPOCH = datetime(2000, 1, 1)
+_PG_EPOCH_DATE = _PG_EPOCH.date()
+
+
+def _fixed_size_encoder(fmt):
+    """Returns an encoder for a fixed size type packed with the given struct format."""
+    packer = struct.Struct(">i" + fmt)
+    size = packer.size - _INT32.size
+
+    def encode(value):
+        return _NULL_FIELD if value is None else packer.pack(size, value)
+
+    return encode
+
+
+def _encode_binary_text(value):
+    if value is None:
+        return _NULL_FIELD
+    data = str(value).encode("utf-8")
+    return _INT32.pack(len(data)) + data
+
+
+_encode_int8 = _fixed_size_encoder("q")
+_encode_int4 = _fixed_size_encoder("i")
+
+
+def _encode_binary_timestamp(value):
+    # Microseconds since 2000-01-01
+    if value is None:
+        return _NULL_FIELD
+    delta = value - _PG_EPOCH
+    return _encode_int8(
+        (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    )
+
+
+def _encode_binary_date(value):
+    # Days since 2000-01-01
+    if value is None:
+        return _NULL_FIELD
+    return _encode_int4((value - _PG_EPOCH_DATE).days)
+
+
+BINARY_ENCODERS = {
+    "text": _encode_binary_text,
+    "varchar": _encode_binary_text,
+    "int4": _encode_int4,
+    "int8": _encode_int8,
+    "float4": _fixed_size_encoder("f"),
+    "float8": _fixed_size_encoder("d"),
+    "bool": _fixed_size_encoder("?"),
+    "timestamp": _encode_binary_timestamp,
+    "date": _encode_binary_date,
+}
+
+
+@lru_cache(maxsize=None)
+def binary_row_encoder(column_types):
+    """Compiles a row encoder for the binary COPY format from a tuple of column types."""
+    encoders = [BINARY_ENCODERS[column_type] for column_type in column_types]
+    field_count = _INT16.pack(len(encoders))
+
+    def encode_row(row):
+        return field_count + b"".join(
+            [encode(value) for encode, value in zip(encoders, row)]
+        )
+
+    return encode_row
+
+
+def write_to_db(cursor, table_name, columns, data, binary=False):
     """
     Writes a list of transformed rows to the database using COPY FROM.
 
+    Rows are encoded while the COPY runs. In the text format values are
+    escaped and None is written as NULL. With binary=True the rows are sent
+    in the binary format using the types in COLUMN_TYPES, so numbers and
+    timestamps are neither formatted here nor parsed by the server.
+
     :param cursor: Database cursor.
     :param table_name: Name of the target table.
     :param columns: List of column names in the table.
-    :param data: List of tuples representing transformed rows.
+    :param data: List (or iterable) of tuples representing transformed rows.
+    :param binary: Use COPY ... (FORMAT binary).
     """
     if not data:
         return  # Nothing to write
 
-    output = io.StringIO()
-    for row in data:
-        output.write("\t".join(map(str, row)) + "\n")
-    output.seek(0)
-
     try:
-        cursor.copy_from(output, table_name, sep="\t", columns=columns)
+        if binary:
+            column_types = tuple(COLUMN_TYPES[table_name][c] for c in columns)
+            query = sql.SQL("COPY {} ({}) FROM STDIN (FORMAT binary)").format(
+                sql.Identifier(table_name),
+                sql.SQL(", ").join(map(sql.Identifier, columns)),
+            )
+            stream = CopyStream(
+                data,
+                binary_row_encoder(column_types),
+                BINARY_COPY_HEADER,
+                BINARY_COPY_TRAILER,
+            )
+            cursor.copy_expert(query, stream, size=COPY_BUFFER_SIZE)
+        else:
+            cursor.copy_from(
+                CopyStream(data),
+                table_name,
+                sep="\t",
+                null=COPY_NULL,
+                columns=columns,
+                size=COPY_BUFFER_SIZE,
+            )
     except Exception as e:
         raise Exception(f"Database write error: {e}")
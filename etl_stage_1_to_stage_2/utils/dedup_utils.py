@@ -0,0 +1,246 @@
+import heapq
+import io
+import mmap
+import os
+import shutil
+import tempfile
+from array import array
+from bisect import bisect_left
+
+from psycopg2 import sql
+
+# Memory the hash set of a table may use before its hashes are spilled to disk
+DEDUP_MEMORY_BYTES = int(os.environ.get("DEDUP_MEMORY_MB", 256)) << 20
+# Spilled runs are written below this directory, the system temp dir by default
+DEDUP_SPILL_DIR = os.environ.get("DEDUP_SPILL_DIR") or None
+
+# Approximate bytes a 64 bit hash takes in a Python set, the int and its slot
+HASH_ENTRY_BYTES = 64
+# Spilled runs are merged into one when there are more than this
+MAX_SPILL_RUNS = 8
+# Hashes written per block while runs are merged
+MERGE_BLOCK_SIZE = 1 << 16
+
+# Rows fetched per round trip while a table is streamed
+DEDUP_FETCH_ROWS = 50000
+# Repeated rows are deleted, and their hashes copied, in batches of this size
+DEDUP_DELETE_ROWS = 10000
+
+
+# Top bits of a hash that index the sorted hashes of a run
+INDEX_BITS = 16
+
+
+class SpillRun:
+    """
+    A sorted run of spilled hashes, mapped from disk and searched in place.
+    The start of every bucket of the top INDEX_BITS bits is indexed, so a
+    search only bisects the few hashes of one bucket.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.hashes = memoryview(self.mapped).cast("q")
+
+        shift = 64 - INDEX_BITS
+        self.shift = shift
+        self.offset = 1 << (INDEX_BITS - 1)
+        self.starts = array("q", [0]) * ((1 << INDEX_BITS) + 1)
+        start = 0
+        for bucket in range(1 << INDEX_BITS):
+            start = bisect_left(self.hashes, (bucket - self.offset + 1) << shift, start)
+            self.starts[bucket + 1] = start
+
+    def __contains__(self, value):
+        bucket = (value >> self.shift) + self.offset
+        index = bisect_left(
+            self.hashes, value, self.starts[bucket], self.starts[bucket + 1]
+        )
+        return index < self.starts[bucket + 1] and self.hashes[index] == value
+
+    def close(self):
+        self.hashes.release()
+        self.mapped.close()
+        os.remove(self.path)
+
+
+class SpillingHashSet:
+    """
+    Set of 64 bit row hashes that holds up to `memory_bytes` of them in
+    memory. Beyond that the hashes in memory are sorted and spilled to a run
+    file, which is searched with a binary search from then on. A value is
+    only added when it is in neither, so the runs never overlap and are
+    merged without comparing them, once there are more than MAX_SPILL_RUNS.
+    """
+
+    def __init__(self, memory_bytes=DEDUP_MEMORY_BYTES, spill_dir=DEDUP_SPILL_DIR):
+        self.capacity = max(memory_bytes // HASH_ENTRY_BYTES, 1)
+        self.hashes = set()
+        self.runs = []
+        self.spill_count = 0
+        self.directory = tempfile.mkdtemp(prefix="dedup_", dir=spill_dir)
+
+    def add(self, value):
+        """Adds a hash, returns False when it was added before."""
+        if value in self.hashes:
+            return False
+        for run in self.runs:
+            if value in run:
+                return False
+
+        self.hashes.add(value)
+        if len(self.hashes) >= self.capacity:
+            self._spill()
+        return True
+
+    def _run_path(self):
+        self.spill_count += 1
+        return os.path.join(self.directory, f"run_{self.spill_count}.bin")
+
+    def _spill(self):
+        path = self._run_path()
+        with open(path, "wb") as f:
+            array("q", sorted(self.hashes)).tofile(f)
+        self.hashes = set()
+        self.runs.append(SpillRun(path))
+
+        if len(self.runs) > MAX_SPILL_RUNS:
+            self._merge_runs()
+
+    def _merge_runs(self):
+        path = self._run_path()
+        block = array("q")
+        with open(path, "wb") as f:
+            for value in heapq.merge(*(run.hashes for run in self.runs)):
+                block.append(value)
+                if len(block) >= MERGE_BLOCK_SIZE:
+                    block.tofile(f)
+                    block = array("q")
+            block.tofile(f)
+
+        for run in self.runs:
+            run.close()
+        self.runs = [SpillRun(path)]
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+        self.hashes = set()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _delete_rows(conn, table_name, ctids):
+    """Deletes rows by their ctid and commits, returns the number deleted."""
+    if not ctids:
+        return 0
+    with conn.cursor() as cursor:
+        cursor.execute(
+            sql.SQL("DELETE FROM {} WHERE ctid = ANY(%s::tid[])").format(
+                sql.Identifier(table_name)
+            ),
+            [ctids],
+        )
+        deleted = cursor.rowcount
+    conn.commit()
+    return deleted
+
+
+def _copy_hashes(cursor, values):
+    """Copies hashes into the temporary table dedup_hashes."""
+    if values:
+        data = io.StringIO("".join(f"{value}\n" for value in values))
+        cursor.copy_expert("COPY dedup_hashes (hash) FROM STDIN", data)
+
+
+def dedupe_table(
+    conn_read,
+    conn_write,
+    table_name,
+    memory_bytes=DEDUP_MEMORY_BYTES,
+    spill_dir=DEDUP_SPILL_DIR,
+):
+    """
+    Deletes the repeated rows of a table, keeping the first copy of every
+    row, so the table can be read without DISTINCT.
+
+    The server hashes the full content of every row, only the 64 bit hash
+    is fetched, through a named cursor on `conn_read`. The hashes go into a
+    SpillingHashSet, a hash seen before is copied to a temporary table. A
+    second pass compares the full content of only the rows with those
+    hashes, so rows that merely share a hash are kept, and the repeated
+    rows are deleted over `conn_write` in batches.
+
+    :return: Number of rows read and number of rows deleted.
+    """
+    rows_in = 0
+    deleted = 0
+    repeated = 0
+    hashes = []
+    ctids = []
+    table = sql.Identifier(table_name)
+
+    with conn_read.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE dedup_hashes (hash BIGINT) ON COMMIT DROP"
+        )
+
+        with SpillingHashSet(memory_bytes, spill_dir) as seen:
+            with conn_read.cursor(name=f"dedupe_{table_name}") as rows:
+                rows.itersize = DEDUP_FETCH_ROWS
+                rows.execute(
+                    sql.SQL("SELECT hashtextextended(t::text, 0) FROM {} AS t").format(
+                        table
+                    )
+                )
+                for (value,) in rows:
+                    rows_in += 1
+                    if seen.add(value):
+                        continue
+                    repeated += 1
+                    hashes.append(value)
+                    if len(hashes) >= DEDUP_DELETE_ROWS:
+                        _copy_hashes(cursor, hashes)
+                        hashes = []
+        _copy_hashes(cursor, hashes)
+
+    if repeated:
+        with conn_read.cursor(name=f"dedupe_{table_name}_copies") as rows:
+            rows.itersize = DEDUP_FETCH_ROWS
+            rows.execute(
+                sql.SQL(
+                    """
+                    SELECT ctid::text
+                    FROM (
+                        SELECT
+                            ctid,
+                            ROW_NUMBER() OVER (
+                                PARTITION BY t::text ORDER BY ctid
+                            ) AS copy_number
+                        FROM {} AS t
+                        WHERE hashtextextended(t::text, 0) IN (
+                            SELECT hash FROM dedup_hashes
+                        )
+                    ) AS copies
+                    WHERE copy_number > 1
+                    """
+                ).format(table)
+            )
+            for (ctid,) in rows:
+                ctids.append(ctid)
+                if len(ctids) >= DEDUP_DELETE_ROWS:
+                    deleted += _delete_rows(conn_write, table_name, ctids)
+                    ctids = []
+
+        deleted += _delete_rows(conn_write, table_name, ctids)
+
+    conn_read.commit()
+    return rows_in, deleted
@@ -114,6 +114,19 @@ def update_import_batch_process_task(
         conn.commit()
 
 
+def update_import_batch_process_task_bytes(conn, ibpt_id, bytes_transferred):
+    """Records the bytes of data copied by an import batch process task."""
+    query = """
+        UPDATE import_batch_process_task
+        SET ibpt_bytes = %s
+        WHERE ibpt_id = %s;
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(query, (bytes_transferred, ibpt_id))
+        conn.commit()
+
+
 def record_failure(conn):
     """Finds the latest running batch, process, or task and marks it as 'Failed'."""
 
@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.metadata_utils import (
+    create_import_batch_process_task,
+    update_import_batch_process_task,
+    update_import_batch_process,
+)
+
+# Migrations of a process that may run at the same time
+STAGE_MIGRATION_WORKERS = int(os.environ.get("STAGE_MIGRATION_WORKERS", 4))
+
+
+class MigrationGraph:
+    """
+    Dependency graph of the migrations of a process. Every node is a
+    function called with the ibp_id, e.g. migrate_product, and runs in a
+    worker thread as soon as the nodes it depends on have completed. The
+    migrations open their own connections, so independent nodes run
+    concurrently. When a node raises, the nodes that depend on it are
+    skipped, the others still run. The migrations record their failure in
+    their own task and re-raise it, so the graph sees it.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.status = {}
+        self.times = {}
+
+    def add(self, name, function, after=()):
+        """Adds a node that runs after the nodes `after`, added before it."""
+        unknown = [dependency for dependency in after if dependency not in self.nodes]
+        if unknown:
+            raise ValueError(f"Node {name} depends on unknown nodes {unknown}")
+        self.nodes[name] = (function, tuple(after))
+
+    def run(self, conn_meta, ibp_id, max_workers=STAGE_MIGRATION_WORKERS):
+        """
+        Runs every node, at most `max_workers` at a time. Every node gets a
+        task "dag <name>" with its start and end time, the timeline and
+        critical path are printed at the end.
+
+        :return: Names of the nodes that failed or were skipped.
+        """
+        meta_lock = threading.Lock()
+        started = time.perf_counter()
+        self.status = {}
+        self.times = {}
+
+        def run_node(name, function):
+            with meta_lock:
+                ibpt_id = create_import_batch_process_task(
+                    conn_meta, ibp_id, f"dag {name}", "Running"
+                )
+            start = time.perf_counter() - started
+            status = "Failed"
+            try:
+                function(ibp_id)
+                status = "Completed"
+            finally:
+                self.times[name] = (start, time.perf_counter() - started)
+                with meta_lock:
+                    update_import_batch_process_task(
+                        conn_meta,
+                        ibpt_id,
+                        status,
+                        None,
+                        None,
+                        None,
+                        None,
+                        None,
+                        None,
+                    )
+
+        pending = dict(self.nodes)
+        running = {}
+        with ThreadPoolExecutor(max(1, max_workers)) as executor:
+            while pending or running:
+                for name, (function, after) in list(pending.items()):
+                    statuses = [self.status.get(dependency) for dependency in after]
+                    if any(status in ("Failed", "Skipped") for status in statuses):
+                        print(f"Skipping {name}, a migration it depends on failed.")
+                        self.status[name] = "Skipped"
+                        del pending[name]
+                    elif all(status == "Completed" for status in statuses):
+                        running[executor.submit(run_node, name, function)] = name
+                        del pending[name]
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        self.status[name] = "Completed"
+                    else:
+                        print(f"Error during migration {name}: {error}")
+                        self.status[name] = "Failed"
+
+        print(self.format_timeline())
+        return [name for name, status in self.status.items() if status != "Completed"]
+
+    def critical_path(self):
+        """
+        Returns the chain of nodes that ended last, from the first node of
+        the chain to the last, walking back along the dependency of every
+        node that ended last.
+        """
+        if not self.times:
+            return []
+        name = max(self.times, key=lambda node: self.times[node][1])
+        path = [name]
+        while True:
+            after = [node for node in self.nodes[name][1] if node in self.times]
+            if not after:
+                break
+            name = max(after, key=lambda node: self.times[node][1])
+            path.append(name)
+        return path[::-1]
+
+    def format_timeline(self):
+        """Formats the start, end and status of every node and the critical path."""
+        lines = ["Migration timeline:"]
+        for name in self.nodes:
+            status = self.status.get(name, "Pending")
+            if name in self.times:
+                start, end = self.times[name]
+                lines.append(
+                    f"  {name}: {start:.1f}s - {end:.1f}s ({end - start:.1f}s) {status}"
+                )
+            else:
+                lines.append(f"  {name}: {status}")
+
+        path = self.critical_path()
+        if path:
+            lines.append(
+                f"Critical path: {' -> '.join(path)} ({self.times[path[-1]][1]:.1f}s)"
+            )
+        return "\n".join(lines)
+
+
+def run_process(graph, conn_meta, ibp_id, max_workers=STAGE_MIGRATION_WORKERS):
+    """
+    Runs the migration graph of a process and sets the status of the
+    process, Failed when a migration failed or was skipped.
+
+    :return: Names of the nodes that failed or were skipped.
+    """
+    failed = graph.run(conn_meta, ibp_id, max_workers)
+    update_import_batch_process(conn_meta, ibp_id, "Failed" if failed else "Completed")
+    return failed
@@ -0,0 +1,167 @@
+import os
+import queue
+import threading
+
+from psycopg2 import sql
+
+# Migrate the tables that are copied unchanged with one COPY per table
+STAGE_DIRECT_COPY = os.environ.get("STAGE_DIRECT_COPY", "false").lower() == "true"
+
+# Bytes of COPY data collected before they are handed to the writing side
+TRANSFER_CHUNK_SIZE = 1 << 16
+# Chunks buffered between the two connections, bounds the memory used
+TRANSFER_BUFFER_CHUNKS = 64
+# Seconds a side waits on the buffer before checking whether the other failed
+TRANSFER_POLL_SECONDS = 1
+
+
+class TransferAborted(Exception):
+    """Raised on one side of a CopyPipe when the other side failed."""
+
+
+class CopyPipe:
+    """
+    Bounded buffer between a COPY TO STDOUT on one connection and a COPY
+    FROM STDIN on another. psycopg2 writes the data of the COPY TO into it,
+    one message per row, which is collected into chunks of `chunk_size`
+    bytes and queued. The COPY FROM reads the chunks back. At most
+    `max_chunks` chunks are queued, beyond that the COPY TO waits for the
+    COPY FROM to catch up.
+    """
+
+    def __init__(
+        self, chunk_size=TRANSFER_CHUNK_SIZE, max_chunks=TRANSFER_BUFFER_CHUNKS
+    ):
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(max_chunks)
+        self.parts = []
+        self.length = 0
+        self.pending = b""
+        self.bytes = 0
+        self.aborted = threading.Event()
+
+    def _put(self, chunk):
+        while True:
+            if self.aborted.is_set():
+                raise TransferAborted("The COPY FROM side of the transfer failed")
+            try:
+                self.chunks.put(chunk, timeout=TRANSFER_POLL_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+    def write(self, data):
+        """Called by the COPY TO with the data of every row."""
+        self.parts.append(data)
+        self.length += len(data)
+        if self.length >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            chunk = b"".join(self.parts)
+            self.parts = []
+            self.length = 0
+            self.bytes += len(chunk)
+            self._put(chunk)
+
+    def close(self):
+        """Queues the last chunk and the end of the data."""
+        self.flush()
+        self._put(None)
+
+    def read(self, size=-1):
+        """Called by the COPY FROM, returns up to size bytes, b"" at the end."""
+        if not self.pending:
+            while True:
+                if self.aborted.is_set():
+                    raise TransferAborted("The COPY TO side of the transfer failed")
+                try:
+                    chunk = self.chunks.get(timeout=TRANSFER_POLL_SECONDS)
+                    break
+                except queue.Empty:
+                    pass
+            if chunk is None:
+                return b""
+            self.pending = chunk
+
+        if 0 <= size < len(self.pending):
+            data, self.pending = self.pending[:size], self.pending[size:]
+        else:
+            data, self.pending = self.pending, b""
+        return data
+
+    def abort(self):
+        self.aborted.set()
+
+
+def _rollback(*conns):
+    """Rolls back after a failed transfer, a connection left in a COPY may fail to."""
+    for conn in conns:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+
+def transfer_table(
+    conn_read, conn_write, source, table_name, columns, binary=True, where=None
+):
+    """
+    Copies the columns of a table or view on `conn_read` into a table on
+    `conn_write` without decoding a single row. A thread runs
+    COPY (SELECT ...) TO STDOUT, the calling thread COPY ... FROM STDIN, the
+    data passes between them through a CopyPipe. The binary format needs
+    the same column types on both sides. `conn_write` is committed once all
+    rows are copied, a failure on either side rolls back both. Only the rows
+    that meet the sql condition `where` are copied when it is given.
+
+    :return: Rows read, rows written and bytes transferred.
+    """
+    options = sql.SQL(" (FORMAT binary)" if binary else "")
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    select = sql.SQL("SELECT {} FROM {}").format(column_list, sql.Identifier(source))
+    if where is not None:
+        select += sql.SQL(" WHERE ") + where
+    copy_to = sql.SQL("COPY ({}) TO STDOUT{}").format(select, options)
+    copy_from = sql.SQL("COPY {} ({}) FROM STDIN{}").format(
+        sql.Identifier(table_name), column_list, options
+    )
+
+    pipe = CopyPipe()
+    result = {}
+
+    def read():
+        try:
+            with conn_read.cursor() as cursor:
+                cursor.copy_expert(copy_to, pipe, size=TRANSFER_CHUNK_SIZE)
+                result["rows_in"] = cursor.rowcount
+            pipe.close()
+        except Exception as e:
+            result["error"] = e
+            pipe.abort()
+
+    reader = threading.Thread(target=read, name=f"copy_{source}", daemon=True)
+    reader.start()
+    try:
+        with conn_write.cursor() as cursor:
+            cursor.copy_expert(copy_from, pipe, size=TRANSFER_CHUNK_SIZE)
+            rows_out = cursor.rowcount
+    except Exception:
+        pipe.abort()
+        reader.join()
+        _rollback(conn_read, conn_write)
+        # The COPY FROM is aborted as well when the COPY TO failed first
+        error = result.get("error")
+        if error is not None and not isinstance(error, TransferAborted):
+            raise error
+        raise
+
+    reader.join()
+    if "error" in result:
+        _rollback(conn_read, conn_write)
+        raise result["error"]
+
+    conn_write.commit()
+    conn_read.commit()
+    return result["rows_in"], rows_out, pipe.bytes
@@ -1,12 +1,13 @@
 import psycopg2
 from psycopg2 import sql
 from utils.db_utills import connect_to_db, DB_STAGE2, DB_ADW, write_to_db
-from utils.output_utils import write_failed_rows, convert_to_json
+from utils.output_utils import write_failed_rows
 from utils.metadata_utils import (
     create_import_batch_process_task,
     update_import_batch_process_task,
     update_import_batch_process,
 )
+from utils.paging_utils import iter_batches, last_key
 
 conn_stage_2 = connect_to_db(DB_STAGE2)
 conn_adw = connect_to_db(DB_ADW)
@@ -14,22 +15,20 @@ conn_adw = connect_to_db(DB_ADW)
 adw_columns = ("product_category",)
 
 
-def fetch_batch_from_stage_2(batch_size, offset):
-    with conn_stage_2.cursor() as cursor:
-        query = sql.SQL(
-            """
-            SELECT DISTINCT
-                pc_category          
-            FROM v_s2_product_categories_only
-            LIMIT %s OFFSET %s
-            """
-        )
-        cursor.execute(query, [batch_size, offset])
-        return cursor.fetchall()
+key_columns = ("pc_category",)
 
 
-def check_if_categories_exist(cursor, categories_to_check):
+def fetch_batches_from_stage_2(batch_size):
+    return iter_batches(
+        conn_stage_2,
+        "v_s2_product_categories_only",
+        ("pc_category",),
+        key_columns,
+        batch_size,
+    )
 
+
+def check_if_categories_exist(cursor, categories_to_check):
     placeholders = [sql.Placeholder()] * len(categories_to_check)
 
     check_query = sql.SQL(
@@ -50,7 +49,6 @@ def migrate_category_to_adw(ibp_id):
     )
 
     batch_size = 100000
-    offset = 0
 
     records_in_count = 0
     records_failed_count = 0
@@ -59,14 +57,10 @@ def migrate_category_to_adw(ibp_id):
     print("Migration to ADW starting...")
 
     try:
-        while True:
-            try:
-                batch = fetch_batch_from_stage_2(batch_size, offset)
-                records_in_count += len(batch)
-
-                if not batch:
-                    break
+        for batch in fetch_batches_from_stage_2(batch_size):
+            records_in_count += len(batch)
 
+            try:
                 categories_to_check = [row[0] for row in batch]
 
                 with conn_adw.cursor() as cursor:
@@ -81,7 +75,6 @@ def migrate_category_to_adw(ibp_id):
                     for row in batch:
                         category = row
                         if (category,) not in existing_categories_set:
-
                             records_to_insert.append((category))
 
                     if records_to_insert:
@@ -93,23 +86,22 @@ def migrate_category_to_adw(ibp_id):
             except Exception as e:
                 print(f"Error during migration to ADW: {e}")
                 # write_failed_rows(
-                #     "./logs/adw_category_failed_records.json",
-                #     convert_to_json(batch),
+                #     "./logs/adw_category_failed_records.ndjson",
+                #     batch,
+                #     adw_columns,
                 # )
                 records_failed_count += len(batch)
                 write_failed_rows(
-                    "./logs/adw_category_error_logs.json",
+                    "./logs/adw_category_error_logs.ndjson",
                     [
                         {
                             "batch_error": str(e),
-                            "offset": offset,
+                            "last_key": last_key(batch, key_columns, key_columns),
                             "entity": "adw_category",
                         }
                     ],
                 )
 
-            offset += batch_size
-
         update_import_batch_process_task(
             conn_adw,
             ibpt_id,
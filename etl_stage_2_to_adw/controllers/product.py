@@ -1,12 +1,13 @@
 import psycopg2
 from psycopg2 import sql
 from utils.db_utills import connect_to_db, DB_STAGE2, DB_ADW, write_to_db
-from utils.output_utils import write_failed_rows, convert_to_json
+from utils.output_utils import write_failed_rows
 from utils.metadata_utils import (
     create_import_batch_process_task,
     update_import_batch_process_task,
     update_import_batch_process,
 )
+from utils.paging_utils import iter_batches, last_key
 
 conn_stage_2 = connect_to_db(DB_STAGE2)
 conn_adw = connect_to_db(DB_ADW)
@@ -24,27 +25,25 @@ adw_columns = (
 )
 
 
+source_columns = (
+    "p_product_source_key",
+    "p_product_metadata_id",
+    "p_sales_rank_category",
+    "p_sales_rank",
+    "p_image_url",
+    "p_title",
+    "p_description",
+    "p_price",
+    "p_brand",
+)
+key_columns = ("p_product_source_key",)
+
+
 # Fetch batch of records from the source
-def fetch_batch_from_stage_2(batch_size, offset):
-    with conn_stage_2.cursor() as cursor:
-        query = sql.SQL(
-            """
-            SELECT 
-                p_product_source_key,
-                p_product_metadata_id,
-                p_sales_rank_category,
-                p_sales_rank,
-                p_image_url,
-                p_title,
-                p_description,
-                p_price,
-                p_brand
-            FROM v_s2_product
-            LIMIT %s OFFSET %s
-            """
-        )
-        cursor.execute(query, [batch_size, offset])
-        return cursor.fetchall()
+def fetch_batches_from_stage_2(batch_size):
+    return iter_batches(
+        conn_stage_2, "v_s2_product", source_columns, key_columns, batch_size
+    )
 
 
 # Function to insert new products in bulk
@@ -85,7 +84,6 @@ def migrate_product_to_adw(ibp_id):
     )
 
     batch_size = 10000
-    offset = 0
 
     records_in_count = 0
     records_failed_count = 0
@@ -96,15 +94,11 @@ def migrate_product_to_adw(ibp_id):
     print("Migration to ADW starting...")
 
     try:
-        while True:
-            try:
-                # Fetch batch from stage_2
-                batch = fetch_batch_from_stage_2(batch_size, offset)
-                records_in_count += len(batch)
-
-                if not batch:
-                    break
+        # Fetch batches from stage_2
+        for batch in fetch_batches_from_stage_2(batch_size):
+            records_in_count += len(batch)
 
+            try:
                 product_source_keys = [row[0] for row in batch]
 
                 # Check which products exist in ADW
@@ -183,22 +177,20 @@ def migrate_product_to_adw(ibp_id):
             except Exception as e:
                 print(f"Error during migration to ADW: {e}")
                 # write_failed_rows(
-                #     "./logs/adw_product_failed_records.json", convert_to_json(batch)
+                #     "./logs/adw_product_failed_records.ndjson", batch, adw_columns
                 # )
                 records_failed_count += len(batch)
                 write_failed_rows(
-                    "./logs/adw_product_error_logs.json",
+                    "./logs/adw_product_error_logs.ndjson",
                     [
                         {
                             "batch_error": str(e),
-                            "offset": offset,
+                            "last_key": last_key(batch, source_columns, key_columns),
                             "entity": "adw_product",
                         }
                     ],
                 )
 
-            offset += batch_size
-
         update_import_batch_process_task(
             conn_adw,
             ibpt_id,
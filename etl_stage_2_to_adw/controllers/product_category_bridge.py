@@ -1,12 +1,13 @@
 import psycopg2
 from psycopg2 import sql
 from utils.db_utills import connect_to_db, DB_STAGE2, DB_ADW, write_to_db
-from utils.output_utils import write_failed_rows, convert_to_json
+from utils.output_utils import write_failed_rows
 from utils.metadata_utils import (
     create_import_batch_process_task,
     update_import_batch_process_task,
     update_import_batch_process,
 )
+from utils.paging_utils import iter_batches, last_key
 
 conn_stage_2 = connect_to_db(DB_STAGE2)
 conn_adw = connect_to_db(DB_ADW)
@@ -14,19 +15,17 @@ conn_adw = connect_to_db(DB_ADW)
 adw_columns = ("product_key", "category_key")
 
 
-def fetch_batch_from_stage_2(batch_size, offset):
-    with conn_stage_2.cursor() as cursor:
-        query = sql.SQL(
-            """
-            SELECT 
-                pc_product_source_key, 
-                pc_category
-            FROM v_s2_product_category
-            LIMIT %s OFFSET %s
-            """
-        )
-        cursor.execute(query, [batch_size, offset])
-        return cursor.fetchall()
+source_columns = (
+    "pc_product_source_key",
+    "pc_category",
+)
+key_columns = ("pc_product_source_key", "pc_category")
+
+
+def fetch_batches_from_stage_2(batch_size):
+    return iter_batches(
+        conn_stage_2, "v_s2_product_category", source_columns, key_columns, batch_size
+    )
 
 
 def fetch_category_keys_by_names(cursor, category_names):
@@ -82,7 +81,6 @@ def migrate_product_category_bridge_to_adw(ibp_id):
     )
 
     batch_size = 10000
-    offset = 0
 
     records_in_count = 0
     records_failed_count = 0
@@ -91,14 +89,10 @@ def migrate_product_category_bridge_to_adw(ibp_id):
     print("Migration to ADW starting...")
 
     try:
-        while True:
-            try:
-                batch = fetch_batch_from_stage_2(batch_size, offset)
-                records_in_count += len(batch)
-
-                if not batch:
-                    break
+        for batch in fetch_batches_from_stage_2(batch_size):
+            records_in_count += len(batch)
 
+            try:
                 # Extract unique product_source_keys and category_names
                 product_source_keys = list(set(row[0] for row in batch))
                 category_names = list(set(row[1] for row in batch))
@@ -157,18 +151,16 @@ def migrate_product_category_bridge_to_adw(ibp_id):
                 print(f"Error during migration to ADW: {e}")
                 records_failed_count += len(batch)
                 write_failed_rows(
-                    "./logs/adw_product_category_bridge_error_logs.json",
+                    "./logs/adw_product_category_bridge_error_logs.ndjson",
                     [
                         {
                             "batch_error": str(e),
-                            "offset": offset,
+                            "last_key": last_key(batch, source_columns, key_columns),
                             "entity": "adw_product_category_bridge",
                         }
                     ],
                 )
 
-            offset += batch_size
-
         update_import_batch_process_task(
             conn_adw,
             ibpt_id,
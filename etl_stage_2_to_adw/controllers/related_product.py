@@ -2,12 +2,13 @@ import psycopg2
 import psycopg2.extras  # Import extras
 from psycopg2 import sql
 from utils.db_utills import connect_to_db, DB_STAGE2, DB_ADW, write_to_db
-from utils.output_utils import write_failed_rows, convert_to_json
+from utils.output_utils import write_failed_rows
 from utils.metadata_utils import (
     create_import_batch_process_task,
     update_import_batch_process_task,
     update_import_batch_process,
 )
+from utils.paging_utils import iter_batches, last_key
 
 conn_stage_2 = connect_to_db(DB_STAGE2)
 conn_adw = connect_to_db(DB_ADW)
@@ -15,20 +16,18 @@ conn_adw = connect_to_db(DB_ADW)
 adw_columns = ("primary_product_key", "secondary_product_key", "relation")
 
 
-def fetch_batch_from_stage_2(batch_size, offset):
-    with conn_stage_2.cursor() as cursor:
-        query = sql.SQL(
-            """
-            SELECT 
-                rl_product_source_key,
-                rl_related_product_source_key,
-                rl_relation
-            FROM v_s2_related_product
-            LIMIT %s OFFSET %s
-            """
-        )
-        cursor.execute(query, [batch_size, offset])
-        return cursor.fetchall()
+source_columns = (
+    "rl_product_source_key",
+    "rl_related_product_source_key",
+    "rl_relation",
+)
+key_columns = ("rl_product_source_key", "rl_related_product_source_key", "rl_relation")
+
+
+def fetch_batches_from_stage_2(batch_size):
+    return iter_batches(
+        conn_stage_2, "v_s2_related_product", source_columns, key_columns, batch_size
+    )
 
 
 def fetch_product_keys(cursor, product_source_keys):
@@ -79,7 +78,6 @@ def migrate_related_product_to_adw(ibp_id):
     )
 
     batch_size = 10000
-    offset = 0
 
     records_in_count = 0
     records_failed_count = 0
@@ -88,14 +86,10 @@ def migrate_related_product_to_adw(ibp_id):
     print("Migration to ADW starting...")
 
     try:
-        while True:
-            try:
-                batch = fetch_batch_from_stage_2(batch_size, offset)
-                records_in_count += len(batch)
-
-                if not batch:
-                    break
+        for batch in fetch_batches_from_stage_2(batch_size):
+            records_in_count += len(batch)
 
+            try:
                 # Prepare a list of product source keys from the batch
                 product_source_keys = list(
                     set(row[0] for row in batch) | set(row[1] for row in batch)
@@ -148,18 +142,16 @@ def migrate_related_product_to_adw(ibp_id):
                 print(f"Error during migration to ADW: {e}")
                 records_failed_count += len(batch)
                 write_failed_rows(
-                    "./logs/adw_related_product_error_logs.json",
+                    "./logs/adw_related_product_error_logs.ndjson",
                     [
                         {
                             "batch_error": str(e),
-                            "offset": offset,
+                            "last_key": last_key(batch, source_columns, key_columns),
                             "entity": "adw_related_product",
                         }
                     ],
                 )
 
-            offset += batch_size
-
         update_import_batch_process_task(
             conn_adw,
             ibpt_id,
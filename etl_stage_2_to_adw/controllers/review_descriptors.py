@@ -1,12 +1,12 @@
 import psycopg2
-from psycopg2 import sql
 from utils.db_utills import connect_to_db, DB_STAGE2, DB_ADW, write_to_db
-from utils.output_utils import write_failed_rows, convert_to_json
+from utils.output_utils import write_failed_rows
 from utils.metadata_utils import (
     create_import_batch_process_task,
     update_import_batch_process_task,
     update_import_batch_process,
 )
+from utils.paging_utils import iter_batches, last_key
 
 conn_stage_2 = connect_to_db(DB_STAGE2)
 conn_adw = connect_to_db(DB_ADW)
@@ -17,19 +17,17 @@ adw_columns = (
 )
 
 
-def fetch_batch_from_stage_2(batch_size, offset):
-    with conn_stage_2.cursor() as cursor:
-        query = sql.SQL(
-            """
-            SELECT 
-                r_review_text,
-                r_review_title
-            FROM v_s2_reviewer
-            LIMIT %s OFFSET %s
-            """
-        )
-        cursor.execute(query, [batch_size, offset])
-        return cursor.fetchall()
+source_columns = (
+    "r_review_text",
+    "r_review_title",
+)
+key_columns = ("r_reviewer_source_key", "r_product_key")
+
+
+def fetch_batches_from_stage_2(batch_size):
+    return iter_batches(
+        conn_stage_2, "v_s2_review", source_columns, key_columns, batch_size
+    )
 
 
 def migrate_review_descriptors_to_adw(ibp_id):
@@ -38,7 +36,6 @@ def migrate_review_descriptors_to_adw(ibp_id):
     )
 
     batch_size = 10000
-    offset = 0
 
     records_in_count = 0
     records_failed_count = 0
@@ -47,14 +44,10 @@ def migrate_review_descriptors_to_adw(ibp_id):
     print("Migration to ADW starting...")
 
     try:
-        while True:
-            try:
-                batch = fetch_batch_from_stage_2(batch_size, offset)
-                records_in_count += len(batch)
-
-                if not batch:
-                    break
+        for batch in fetch_batches_from_stage_2(batch_size):
+            records_in_count += len(batch)
 
+            try:
                 # Insert reviews into ADW
                 with conn_adw.cursor() as cursor:
                     write_to_db(cursor, "review_descriptors", adw_columns, batch)
@@ -66,17 +59,22 @@ def migrate_review_descriptors_to_adw(ibp_id):
                 print(f"Error during migration to ADW: {e}")
 
                 # write_failed_rows(
-                #     "./logs/adw_review_descriptors_failed_records.json",
-                #     convert_to_json(batch),
+                #     "./logs/adw_review_descriptors_failed_records.ndjson",
+                #     batch,
+                #     adw_columns,
                 # )
                 records_failed_count += len(batch)
                 write_failed_rows(
-                    "./logs/adw_review_descriptors_error_logs.json",
-                    [{"batch_error": str(e), "offset": offset, "entity": "adw_review"}],
+                    "./logs/adw_review_descriptors_error_logs.ndjson",
+                    [
+                        {
+                            "batch_error": str(e),
+                            "last_key": last_key(batch, source_columns, key_columns),
+                            "entity": "adw_review",
+                        }
+                    ],
                 )
 
-            offset += batch_size
-
         update_import_batch_process_task(
             conn_adw,
             ibpt_id,
@@ -7,6 +7,8 @@ from utils.metadata_utils import (
     update_import_batch_process_task,
     update_import_batch_process,
 )
+from utils.paging_utils import iter_batches, last_key
+from utils.partition_utils import run_partitions
 
 conn_stage_2 = connect_to_db(DB_STAGE2)
 conn_adw = connect_to_db(DB_ADW)
@@ -22,24 +24,31 @@ adw_columns = (
 
 
 # Step 1: Fetch the batch of rows from the fact table (review_fact)
-def fetch_batch_from_stage_2(batch_size, offset):
-    with conn_stage_2.cursor() as cursor:
-        query = sql.SQL(
-            """
-            SELECT 
-                r_review_date_key, 
-                r_reviewer_source_key, 
-                r_product_key,  
-                r_helpfulness_rating, 
-                r_review_score,
-                r_review_title,
-                r_review_text
-            FROM v_s2_review
-            LIMIT %s OFFSET %s
-            """
-        )
-        cursor.execute(query, [batch_size, offset])
-        return cursor.fetchall()
+source_columns = (
+    "r_review_date_key",
+    "r_reviewer_source_key",
+    "r_product_key",
+    "r_helpfulness_rating",
+    "r_review_score",
+    "r_review_title",
+    "r_review_text",
+)
+key_columns = ("r_reviewer_source_key", "r_product_key")
+
+
+# Reviews are partitioned by product
+partition_key = "r_product_key"
+
+
+def fetch_batches_from_stage_2(conn, batch_size, partition):
+    return iter_batches(
+        conn,
+        "v_s2_review",
+        source_columns,
+        key_columns,
+        batch_size,
+        partition.predicate(),
+    )
 
 
 def fetch_reviewer_keys(cursor, reviewer_ids, chunk_size=5000):
@@ -110,122 +119,137 @@ def fetch_product_keys(cursor, product_ids, chunk_size=5000):
     return all_results
 
 
-def migrate_fact_table_to_adw(ibp_id):
-    ibpt_id = create_import_batch_process_task(
-        conn_adw, ibp_id, "adw_review_fact", "Running"
-    )
+def migrate_partition(partition, conn_read, conn_write):
+    """
+    Migrates the reviews of a partition to the fact table in batches.
 
+    :return: Records in, failed and out of the partition.
+    """
     batch_size = 10000
-    offset = 0
 
     records_in_count = 0
     records_failed_count = 0
     records_out_count = 0
 
-    print("Migration to ADW starting...")
+    for batch in fetch_batches_from_stage_2(conn_read, batch_size, partition):
+        records_in_count += len(batch)
+
+        try:
+            # Prepare lists to fetch surrogate keys for each dimension
+            reviewer_ids = [row[1] for row in batch]
+            product_ids = [row[2] for row in batch]
+            review_descriptor_pairs = [(row[5], row[6]) for row in batch]
+
+            with conn_write.cursor() as cursor:
+                # Step 2: Fetch surrogate keys for reviewer, product, and review_descriptors
+                reviewer_keys = fetch_reviewer_keys(cursor, reviewer_ids)
+                product_keys = fetch_product_keys(cursor, product_ids)
+                review_descriptor_keys = fetch_review_descriptor_keys(
+                    cursor, review_descriptor_pairs
+                )
 
-    try:
-        while True:
-            try:
-                batch = fetch_batch_from_stage_2(batch_size, offset)
-                records_in_count += len(batch)
-
-                if not batch:
-                    break
-
-                # Prepare lists to fetch surrogate keys for each dimension
-                reviewer_ids = [row[1] for row in batch]
-                product_ids = [row[2] for row in batch]
-                review_descriptor_pairs = [(row[5], row[6]) for row in batch]
-
-                with conn_adw.cursor() as cursor:
-                    # Step 2: Fetch surrogate keys for reviewer, product, and review_descriptors
-                    reviewer_keys = fetch_reviewer_keys(cursor, reviewer_ids)
-                    product_keys = fetch_product_keys(cursor, product_ids)
-                    review_descriptor_keys = fetch_review_descriptor_keys(
-                        cursor, review_descriptor_pairs
+                # Create mappings for dimensions (excluding date)
+                reviewer_map = {
+                    row[0]: row[1] for row in reviewer_keys if row[0] in reviewer_ids
+                }
+                product_map = {
+                    row[0]: row[1] for row in product_keys if row[0] in product_ids
+                }
+                review_descriptor_map = {
+                    (row[0], row[1]): row[2]
+                    for row in review_descriptor_keys
+                    if (row[0], row[1]) in review_descriptor_pairs
+                }
+
+                # Prepare the fact data with surrogate keys
+                records_to_insert = []
+
+                for row in batch:
+                    (
+                        date_reviewed_key,  # r_review_date_key is used directly
+                        reviewer_key,
+                        product_key,
+                        helpfulness_rating,
+                        review_rating,
+                        review_title,
+                        review_text,
+                    ) = row  # Unpack 7 values
+
+                    # Fetch surrogate keys
+                    new_reviewer_key = reviewer_map.get(reviewer_key)
+                    new_product_key = product_map.get(product_key)
+                    new_review_descriptors_key = review_descriptor_map.get(
+                        (review_title, review_text)
                     )
 
-                    # Create mappings for dimensions (excluding date)
-                    reviewer_map = {
-                        row[0]: row[1]
-                        for row in reviewer_keys
-                        if row[0] in reviewer_ids
-                    }
-                    product_map = {
-                        row[0]: row[1] for row in product_keys if row[0] in product_ids
-                    }
-                    review_descriptor_map = {
-                        (row[0], row[1]): row[2]
-                        for row in review_descriptor_keys
-                        if (row[0], row[1]) in review_descriptor_pairs
+                    # If valid surrogate keys are found, add to records to insert
+                    if (
+                        new_reviewer_key
+                        and new_product_key
+                        and new_review_descriptors_key
+                    ):
+                        records_to_insert.append(
+                            (
+                                date_reviewed_key,  # Use date_reviewed_key directly
+                                new_reviewer_key,
+                                new_product_key,
+                                new_review_descriptors_key,
+                                helpfulness_rating,
+                                review_rating,
+                            )
+                        )
+
+                # Step 6: Insert records
+                if records_to_insert:
+                    write_to_db(
+                        cursor,
+                        "review_fact",
+                        adw_columns,
+                        records_to_insert,
+                        binary=True,
+                    )
+                    conn_write.commit()
+
+            records_out_count += len(records_to_insert)
+
+        except Exception as e:
+            print(f"Error during migration to ADW: {e}")
+            conn_write.rollback()
+            records_failed_count += len(batch)
+            write_failed_rows(
+                "./logs/adw_review_fact_error_logs.ndjson",
+                [
+                    {
+                        "batch_error": str(e),
+                        "last_key": last_key(batch, source_columns, key_columns),
+                        "partition": partition.index,
+                        "entity": "adw_review_fact",
                     }
+                ],
+            )
 
-                    # Prepare the fact data with surrogate keys
-                    records_to_insert = []
-
-                    for row in batch:
-                        (
-                            date_reviewed_key,  # r_review_date_key is used directly
-                            reviewer_key,
-                            product_key,
-                            helpfulness_rating,
-                            review_rating,
-                            review_title,
-                            review_text,
-                        ) = row  # Unpack 7 values
-
-                        # Fetch surrogate keys
-                        new_reviewer_key = reviewer_map.get(reviewer_key)
-                        new_product_key = product_map.get(product_key)
-                        new_review_descriptors_key = review_descriptor_map.get(
-                            (review_title, review_text)
-                        )
+    return records_in_count, records_failed_count, records_out_count
 
-                        # If valid surrogate keys are found, add to records to insert
-                        if (
-                            new_reviewer_key
-                            and new_product_key
-                            and new_review_descriptors_key
-                        ):
-                            records_to_insert.append(
-                                (
-                                    date_reviewed_key,  # Use date_reviewed_key directly
-                                    new_reviewer_key,
-                                    new_product_key,
-                                    new_review_descriptors_key,
-                                    helpfulness_rating,
-                                    review_rating,
-                                )
-                            )
 
-                    # Step 6: Insert records
-                    if records_to_insert:
-                        write_to_db(
-                            cursor,
-                            "review_fact",
-                            adw_columns,
-                            records_to_insert,
-                        )
-                        conn_adw.commit()
-
-                records_out_count += len(records_to_insert)
-
-            except Exception as e:
-                print(f"Error during migration to ADW: {e}")
-                records_failed_count += len(batch)
-                write_failed_rows(
-                    "./logs/adw_review_fact_error_logs.json",
-                    [
-                        {
-                            "batch_error": str(e),
-                            "offset": offset,
-                            "entity": "adw_review_fact",
-                        }
-                    ],
-                )
+def migrate_fact_table_to_adw(ibp_id):
+    ibpt_id = create_import_batch_process_task(
+        conn_adw, ibp_id, "adw_review_fact", "Running"
+    )
+
+    records_in_count = 0
+    records_failed_count = 0
+    records_out_count = 0
 
-            offset += batch_size
+    print("Migration to ADW starting...")
+
+    try:
+        counts = run_partitions(
+            migrate_partition,
+            partition_key,
+            (conn_stage_2, conn_adw),
+            (DB_STAGE2, DB_ADW),
+        )
+        records_in_count, records_failed_count, records_out_count = counts
 
         update_import_batch_process_task(
             conn_adw,
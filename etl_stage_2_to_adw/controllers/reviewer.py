@@ -1,12 +1,13 @@
 import psycopg2
 from psycopg2 import sql
 from utils.db_utills import connect_to_db, DB_STAGE2, DB_ADW, write_to_db
-from utils.output_utils import write_failed_rows, convert_to_json
+from utils.output_utils import write_failed_rows
 from utils.metadata_utils import (
     create_import_batch_process_task,
     update_import_batch_process_task,
     update_import_batch_process,
 )
+from utils.paging_utils import iter_batches, last_key
 
 conn_stage_2 = connect_to_db(DB_STAGE2)
 conn_adw = connect_to_db(DB_ADW)
@@ -14,20 +15,18 @@ conn_adw = connect_to_db(DB_ADW)
 adw_columns = ("reviewer_source_key", "reviewer_name")
 
 
-def fetch_batch_from_stage_2(batch_size, offset):
-    with conn_stage_2.cursor() as cursor:
-        query = sql.SQL(
-            """
-            SELECT 
-              DISTINCT
-                r_reviewer_source_key,
-                r_reviewer_name
-            FROM v_s2_review
-            LIMIT %s OFFSET %s
-            """
-        )
-        cursor.execute(query, [batch_size, offset])
-        return cursor.fetchall()
+source_columns = (
+    "r_reviewer_source_key",
+    "r_reviewer_name",
+)
+# Unique, v_s2_reviewer is distinct
+key_columns = ("r_reviewer_source_key", "r_reviewer_name")
+
+
+def fetch_batches_from_stage_2(batch_size):
+    return iter_batches(
+        conn_stage_2, "v_s2_reviewer", source_columns, key_columns, batch_size
+    )
 
 
 def update_reviewers_in_adw(cursor, reviewers_to_update):
@@ -59,7 +58,6 @@ def migrate_reviewer_to_adw(ibp_id):
     )
 
     batch_size = 10000
-    offset = 0
 
     records_in_count = 0
     records_failed_count = 0
@@ -70,14 +68,10 @@ def migrate_reviewer_to_adw(ibp_id):
     print("Migration to ADW starting...")
 
     try:
-        while True:
-            try:
-                batch = fetch_batch_from_stage_2(batch_size, offset)
-                records_in_count += len(batch)
-
-                if not batch:
-                    break
+        for batch in fetch_batches_from_stage_2(batch_size):
+            records_in_count += len(batch)
 
+            try:
                 reviewer_source_keys = [row[0] for row in batch]
 
                 # Check which reviewers exist in ADW
@@ -129,17 +123,22 @@ def migrate_reviewer_to_adw(ibp_id):
                 print(f"Error during migration to ADW: {e}")
 
                 # write_failed_rows(
-                #     "./logs/adw_review_failed_records.json",
-                #     convert_to_json(batch),
+                #     "./logs/adw_review_failed_records.ndjson",
+                #     batch,
+                #     adw_columns,
                 # )
                 records_failed_count += len(batch)
                 write_failed_rows(
-                    "./logs/adw_review_error_logs.json",
-                    [{"batch_error": str(e), "offset": offset, "entity": "adw_review"}],
+                    "./logs/adw_review_error_logs.ndjson",
+                    [
+                        {
+                            "batch_error": str(e),
+                            "last_key": last_key(batch, source_columns, key_columns),
+                            "entity": "adw_review",
+                        }
+                    ],
                 )
 
-            offset += batch_size
-
         update_import_batch_process_task(
             conn_adw,
             ibpt_id,
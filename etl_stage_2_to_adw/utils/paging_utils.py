@@ -0,0 +1,129 @@
+import os
+from itertools import islice
+
+from psycopg2 import sql
+
+# Stream every source from one query through a server side cursor, instead
+# of a query per page
+STAGE_STREAM_READS = os.environ.get("STAGE_STREAM_READS", "false").lower() == "true"
+# Rows a server side cursor fetches per round trip
+STAGE_STREAM_ITERSIZE = int(os.environ.get("STAGE_STREAM_ITERSIZE", 2000))
+
+
+def _column(column):
+    """Names are quoted as identifiers, expressions are passed as sql.SQL."""
+    return column if isinstance(column, sql.Composable) else sql.Identifier(column)
+
+
+def fetch_page(
+    conn, source, columns, key_columns, batch_size, last_key=None, where=None
+):
+    """
+    Returns the next page of up to batch_size rows of a table or view in
+    the order of key_columns, and the key of its last row to fetch the page
+    after it. The first page is fetched with last_key None, every later one
+    starts after the key of the page before instead of skipping an OFFSET
+    of rows, so with an index on the key every page is an index range scan.
+
+    The key has to be unique and NOT NULL. Key columns that are not among
+    `columns`, e.g. a row id, are fetched after them and left out of the
+    rows returned. `where` is an optional sql condition the rows have to
+    meet, e.g. Partition.predicate().
+    """
+    extra_columns = [key for key in key_columns if key not in columns]
+    selected = list(columns) + extra_columns
+    key_positions = [selected.index(key) for key in key_columns]
+    keys = sql.SQL(", ").join(_column(key) for key in key_columns)
+
+    query = sql.SQL("SELECT {columns} FROM {source}").format(
+        columns=sql.SQL(", ").join(_column(column) for column in selected),
+        source=sql.Identifier(source),
+    )
+    conditions = [where] if where is not None else []
+    params = []
+    if last_key is not None:
+        conditions.append(
+            sql.SQL("({keys}) > ({values})").format(
+                keys=keys,
+                values=sql.SQL(", ").join(sql.Placeholder() * len(key_columns)),
+            )
+        )
+        params.extend(last_key)
+    if conditions:
+        query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+    query += sql.SQL(" ORDER BY {keys} LIMIT %s").format(keys=keys)
+    params.append(batch_size)
+
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+
+    if not rows:
+        return rows, last_key
+
+    last_key = tuple(rows[-1][position] for position in key_positions)
+    if extra_columns:
+        rows = [row[: len(columns)] for row in rows]
+    return rows, last_key
+
+
+def iter_batches(
+    conn,
+    source,
+    columns,
+    key_columns,
+    batch_size,
+    where=None,
+    stream=STAGE_STREAM_READS,
+    itersize=STAGE_STREAM_ITERSIZE,
+):
+    """
+    Yields the rows of a table or view in batches of up to batch_size rows,
+    only those that meet the sql condition `where` when it is given.
+
+    By default every batch is a page of fetch_page. With stream, the source
+    is read by a single query through a named, server side cursor, which
+    fetches `itersize` rows per round trip, so only one batch is held in
+    memory and the query is planned once. The cursor keeps a transaction
+    open on `conn`, nothing else may commit on it until the source is read.
+    """
+    if not stream:
+        last_key = None
+        while True:
+            batch, last_key = fetch_page(
+                conn, source, columns, key_columns, batch_size, last_key, where
+            )
+            if not batch:
+                return
+            yield batch
+
+    query = sql.SQL("SELECT {columns} FROM {source}").format(
+        columns=sql.SQL(", ").join(_column(column) for column in columns),
+        source=sql.Identifier(source),
+    )
+    if where is not None:
+        query += sql.SQL(" WHERE ") + where
+
+    with conn.cursor(name=f"stream_{source}") as cursor:
+        cursor.itersize = itersize
+        cursor.execute(query)
+        while True:
+            batch = list(islice(cursor, batch_size))
+            if not batch:
+                break
+            yield batch
+    conn.commit()
+
+
+def last_key(batch, columns, key_columns):
+    """
+    Returns the key of the last row of a batch by key column, e.g. to log
+    where a failed batch ends. Key columns that are not among `columns`,
+    like a row id or an expression, are left out.
+    """
+    row = batch[-1]
+    return {
+        key: row[columns.index(key)]
+        for key in key_columns
+        if not isinstance(key, sql.Composable) and key in columns
+    }
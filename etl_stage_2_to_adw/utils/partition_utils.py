@@ -0,0 +1,65 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import sql
+
+from utils.db_utills import connect_to_db
+
+# Workers that migrate a table, every one a hash partition of its rows
+STAGE_PARTITIONS = int(os.environ.get("STAGE_PARTITIONS", 1))
+
+
+class Partition(namedtuple("Partition", ("key_column", "index", "count"))):
+    """
+    Partition `index` of `count` partitions of a table by a hash of its key
+    column, the rows whose hashtext(key) modulo count is the index.
+    """
+
+    __slots__ = ()
+
+    def predicate(self):
+        """Returns the sql condition of the rows of the partition, None for all rows."""
+        if self.count <= 1:
+            return None
+        # hashtext is signed, the sign bit is masked off
+        return sql.SQL("(hashtext({}) & 2147483647) % {} = {}").format(
+            sql.Identifier(self.key_column),
+            sql.Literal(self.count),
+            sql.Literal(self.index),
+        )
+
+
+def get_partitions(key_column, count=STAGE_PARTITIONS):
+    """Returns the `count` partitions of a table by its key column."""
+    count = max(1, count)
+    return [Partition(key_column, index, count) for index in range(count)]
+
+
+def run_partitions(
+    migrate_partition, key_column, conns, db_params, count=STAGE_PARTITIONS
+):
+    """
+    Calls migrate_partition(partition, *connections) for every partition of
+    a table and returns the sums of the counts it returns per partition.
+
+    A single partition runs on `conns`, the connections of the caller. With
+    more, every partition runs in a thread of its own, on new connections
+    to the databases `db_params`, e.g. (DB_STAGE1, DB_STAGE2). When a
+    partition fails, its error is raised once the others have finished.
+    """
+    partitions = get_partitions(key_column, count)
+    if len(partitions) == 1:
+        return migrate_partition(partitions[0], *conns)
+
+    def run(partition):
+        partition_conns = [connect_to_db(params) for params in db_params]
+        try:
+            return migrate_partition(partition, *partition_conns)
+        finally:
+            for conn in partition_conns:
+                conn.close()
+
+    with ThreadPoolExecutor(len(partitions)) as executor:
+        results = list(executor.map(run, partitions))
+    return tuple(map(sum, zip(*results)))